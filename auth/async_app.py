@@ -0,0 +1,563 @@
+"""Asyncio variant of the auth service.
+
+Same routes and responses as app.py, served by an event loop instead of
+request threads:
+
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker \
+        gunicorn -c gunicorn.conf.py async_app:app
+
+Postgres I/O goes through one shared asyncpg pool per worker. CPU-bound
+credential work runs on a small bounded executor so it never blocks the loop.
+"""
+import asyncio
+import functools
+import logging
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import asyncpg
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from config import (
+    DB_POOL_MAX,
+    DB_POOL_MAX_IDLE,
+    DB_POOL_MIN,
+    DB_POOL_TIMEOUT,
+    EMAIL_FILTER_ENABLED,
+    EMAIL_FILTER_ERROR_RATE,
+    EMAIL_FILTER_MAX_STALENESS,
+    EMAIL_FILTER_SYNC_INTERVAL,
+    JWT_EXP_DELTA_SECONDS,
+    POSTGRES_URL,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_TRUSTED_PROXIES,
+    REFRESH_TOKEN_TTL_SECONDS,
+    REFRESH_TOKENS_SCHEMA,
+    REVOCATION_INDEX_SIZE,
+    SCHEMA_LOCK_ID,
+    USERS_SCHEMA,
+    VERIFY_BATCH_MAX,
+)
+from email_filter import EmailFilter, FilterSync
+from logging_setup import begin_request, configure_logging, end_request
+import metrics
+import passwords
+from passwords import dummy_hash, hash_password, hashing_pool, needs_rehash, verify_password
+from queries import (
+    FIND_REFRESH_TOKEN,
+    INSERT_REFRESH_TOKEN,
+    LOAD_REVOKED_REFRESH_TOKENS,
+    PURGE_EXPIRED_REFRESH_TOKENS,
+    REGISTER_USER,
+    REHASH_PASSWORD,
+    REVOKE_REFRESH_FAMILY,
+    ROTATE_REFRESH_TOKEN,
+    SELECT_LOGIN_USER,
+    numbered,
+)
+from rate_limit import client_ip, create_limiter
+from refresh_tokens import RevocationIndex, hash_refresh_token, new_family_id, new_refresh_token
+from tokens import issue_token, jwks, token_cache, verify_token
+
+# Structured JSON logs through a background queue (see logging_setup.py)
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Threads for credential work, and how many calls may queue for them before
+# new callers wait on the loop instead of piling into the executor queue.
+CREDENTIAL_WORKERS = int(os.environ.get("CREDENTIAL_WORKERS", "2"))
+CREDENTIAL_QUEUE_LIMIT = int(os.environ.get("CREDENTIAL_QUEUE_LIMIT", "64"))
+
+REQUESTS = metrics.counter("auth_http_requests_total", "HTTP requests", ["route", "method", "status"])
+REQUEST_SECONDS = metrics.histogram(
+    "auth_http_request_duration_seconds", "HTTP request latency", ["route", "method", "status"]
+)
+DB_WAIT_SECONDS = metrics.histogram("auth_db_pool_wait_seconds", "Time waiting to check out a connection")
+DB_HOLD_SECONDS = metrics.histogram("auth_db_pool_hold_seconds", "Time a connection is held, i.e. time in Postgres")
+DB_CHECKOUT_FAILURES = metrics.counter("auth_db_pool_checkout_failures_total", "Checkouts that timed out or failed")
+LOGIN_FILTERED = metrics.counter(
+    "auth_login_filtered_total", "Logins rejected by the email filter without a database lookup"
+)
+
+db_pool = None
+_db_waiting = 0
+_checkout_failures = 0
+_last_checkout_failures = 0
+_credential_executor = None
+_credential_slots = None
+revocation_index = RevocationIndex(REVOCATION_INDEX_SIZE)
+# Registered emails, so logins for unknown ones skip Postgres (see email_filter.py).
+# It syncs on a thread with its own psycopg2 connection, off the loop and the pool.
+email_filter = EmailFilter(EMAIL_FILTER_ERROR_RATE, EMAIL_FILTER_MAX_STALENESS) if EMAIL_FILTER_ENABLED else None
+if email_filter is not None:
+    metrics.add_collector(email_filter.collect)
+
+
+async def run_credential_work(func, *args):
+    """Run password hashing (KDF) work off the event loop, with bounded queueing.
+
+    Uses the password-hashing process pool when one is configured, so hashing
+    also runs outside this process's GIL; otherwise a small thread pool.
+    func and its arguments must be picklable, and any state it changes stays
+    in the child process.
+    """
+    async with _credential_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(hashing_pool.executor or _credential_executor, func, *args)
+
+
+async def run_token_work(func, *args):
+    """Run token work off the event loop on the credential thread pool.
+
+    Threads, not the hashing processes: token verification uses this
+    process's token_cache and JWKS state.
+    """
+    async with _credential_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_credential_executor, func, *args)
+
+
+async def init_db(conn):
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", SCHEMA_LOCK_ID)
+        await conn.execute(USERS_SCHEMA)
+        await conn.execute(REFRESH_TOKENS_SCHEMA)
+        await conn.execute(PURGE_EXPIRED_REFRESH_TOKENS)
+    logger.info("Database initialized successfully")
+
+
+async def load_revocation_index(conn):
+    async with conn.transaction():
+        async for row in conn.cursor(LOAD_REVOKED_REFRESH_TOKENS, prefetch=5000):
+            revocation_index.add(bytes(row["token_hash"]), row["expires_at"].timestamp(), row["family_id"])
+    logger.info("Loaded %s revoked refresh tokens", len(revocation_index))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global db_pool, _credential_executor, _credential_slots
+    _credential_executor = ThreadPoolExecutor(max_workers=CREDENTIAL_WORKERS, thread_name_prefix="credential")
+    _credential_slots = asyncio.Semaphore(CREDENTIAL_QUEUE_LIMIT)
+    # Computed off the loop, possibly in a hashing child, and kept in this process
+    # so the first unknown-email login doesn't run the KDF on the event loop.
+    passwords.DUMMY_HASH = await run_credential_work(dummy_hash)
+    db_pool = await asyncpg.create_pool(
+        POSTGRES_URL,
+        min_size=DB_POOL_MIN,
+        max_size=DB_POOL_MAX,
+        max_inactive_connection_lifetime=DB_POOL_MAX_IDLE,
+    )
+    try:
+        async with db_pool.acquire() as conn:
+            await init_db(conn)
+            await load_revocation_index(conn)
+    except Exception as e:
+        logger.error("Database initialization failed: %s", e)
+    logger.info("Async connection pool created in worker %s (max %s)", os.getpid(), DB_POOL_MAX)
+    filter_sync = None
+    if email_filter is not None:
+        filter_sync = FilterSync(email_filter, POSTGRES_URL, EMAIL_FILTER_SYNC_INTERVAL)
+        filter_sync.start()
+    try:
+        yield
+    finally:
+        if filter_sync is not None:
+            filter_sync.stop()
+        await db_pool.close()
+        _credential_executor.shutdown(wait=False)
+        hashing_pool.shutdown()
+
+
+@asynccontextmanager
+async def db_connection():
+    """Acquire a pooled connection, timing the wait and how long it's held."""
+    global _db_waiting, _checkout_failures
+    start = time.perf_counter()
+    _db_waiting += 1
+    try:
+        conn = await db_pool.acquire(timeout=DB_POOL_TIMEOUT)
+    except Exception:
+        _checkout_failures += 1
+        DB_CHECKOUT_FAILURES.inc()
+        raise
+    finally:
+        _db_waiting -= 1
+    acquired = time.perf_counter()
+    DB_WAIT_SECONDS.observe(acquired - start)
+    try:
+        yield conn
+    finally:
+        DB_HOLD_SECONDS.observe(time.perf_counter() - acquired)
+        await db_pool.release(conn)
+
+
+def _pool_stats():
+    size, idle = db_pool.get_size(), db_pool.get_idle_size()
+    return {"size": size, "max": db_pool.get_max_size(), "idle": idle, "in_use": size - idle, "waiting": _db_waiting}
+
+
+def _pool_collector():
+    if db_pool is None:
+        return []
+    stats = _pool_stats()
+    lines = []
+    for name, key, help_text in (
+        ("auth_db_pool_connections", "size", "Open pool connections"),
+        ("auth_db_pool_max_connections", "max", "Pool size limit"),
+        ("auth_db_pool_in_use", "in_use", "Connections checked out"),
+        ("auth_db_pool_waiting", "waiting", "Requests waiting for a connection"),
+    ):
+        lines += metrics.header_lines(name, "gauge", help_text)
+        lines.append(f"{name} {stats[key]}")
+    return lines
+
+
+metrics.add_collector(_pool_collector)
+
+
+def _user_fields(data):
+    user = data.get("user")
+    if not isinstance(user, dict):
+        return None, None, None
+    return user.get("email"), user.get("password"), user.get("name")
+
+
+async def _json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+rate_limiter = create_limiter() if RATE_LIMIT_ENABLED else None
+
+
+def rate_limited(handler):
+    """Reject with 429 when the client IP or the email is over its limit,
+    before any credential work or connection checkout."""
+    @functools.wraps(handler)
+    async def wrapper(request):
+        if rate_limiter is not None:
+            data = await _json_body(request)
+            email = _user_fields(data)[0] if isinstance(data, dict) else None
+            remote = request.client.host if request.client else None
+            ip = client_ip(request.headers.get("x-forwarded-for"), remote, RATE_LIMIT_TRUSTED_PROXIES)
+            retry_after = rate_limiter.check(request.url.path, ip=ip, email=email if isinstance(email, str) else None)
+            if retry_after is not None:
+                logger.warning("Rate limited: %s from %s", request.url.path, ip)
+                return JSONResponse(
+                    {"error": "Too many requests"}, status_code=429,
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
+        return await handler(request)
+    return wrapper
+
+
+@rate_limited
+async def auth_register(request):
+    data = await _json_body(request)
+    if not data or not isinstance(data, dict):
+        logger.warning("Registration failed: No data provided")
+        return JSONResponse({"error": "No valid data provided"}, status_code=400)
+
+    email, password, name = _user_fields(data)
+    logger.info("Registration attempt for email: %s, name: %s", email, name)
+
+    if not name or not password or not email:
+        logger.warning("Registration failed: name, email, and password are required")
+        return JSONResponse({"error": "Name, email, and password are required"}, status_code=400)
+    if not all(isinstance(field, str) for field in (email, password, name)):
+        logger.warning("Registration failed: name, email, and password must be strings")
+        return JSONResponse({"error": "Name, email, and password must be strings"}, status_code=400)
+
+    password_hash = await run_credential_work(hash_password, password)
+
+    async with db_connection() as conn:
+        try:
+            # asyncpg prepares and caches statements per connection on its own
+            user_id = await conn.fetchval(numbered(REGISTER_USER), email, password_hash, name)
+            if user_id is None:
+                logger.warning("Registration failed: User with email '%s' already exists", email)
+                return JSONResponse({"error": "User with this email already exists"}, status_code=400)
+            if email_filter is not None:
+                email_filter.add(email)
+            logger.info("User with email '%s' registered successfully.", email)
+            return JSONResponse({"message": f"User with email '{email}' registered successfully."}, status_code=201)
+        except Exception as e:
+            logger.error("Registration error: %s", e)
+            return JSONResponse({"error": "Registration failed"}, status_code=500)
+
+
+@rate_limited
+async def login(request):
+    data = await _json_body(request)
+    if not data or not isinstance(data, dict):
+        logger.warning("Login failed: No data provided")
+        return JSONResponse({"error": "No valid data provided"}, status_code=400)
+
+    email, password, _ = _user_fields(data)
+    logger.info("Login attempt for email: %s", email)
+
+    filter_started = time.perf_counter()
+    # Confirming a miss waits for the sync thread, so it runs off the event loop
+    if (email_filter is not None and email_filter.maybe_absent(email)
+            and await asyncio.to_thread(email_filter.confirm_absent, email)):
+        # No such user: skip the pool, but spend what a real miss would
+        confirmed = time.perf_counter() - filter_started
+        await run_credential_work(verify_password, dummy_hash(), password)
+        await asyncio.sleep(email_filter.padding(confirmed))
+        LOGIN_FILTERED.inc()
+        logger.warning("Login failed for email: %s", email)
+        return JSONResponse({"error": "Invalid credentials"}, status_code=401)
+
+    lookup_started = time.perf_counter()
+    async with db_connection() as conn:
+        try:
+            user_from_db = await conn.fetchrow(numbered(SELECT_LOGIN_USER), email)
+        except Exception as e:
+            logger.error("Login error: %s", e)
+            return JSONResponse({"error": "Login failed"}, status_code=500)
+    if email_filter is not None:
+        email_filter.observe_lookup(time.perf_counter() - lookup_started)
+
+    # Unknown emails are checked against a dummy hash so they take as long as
+    # a wrong password.
+    stored_hash = user_from_db["password"] if user_from_db else dummy_hash()
+    if not await run_credential_work(verify_password, stored_hash, password) or not user_from_db:
+        logger.warning("Login failed for email: %s", email)
+        return JSONResponse({"error": "Invalid credentials"}, status_code=401)
+
+    new_hash = await run_credential_work(hash_password, password) if needs_rehash(stored_hash) else None
+
+    refresh_token, refresh_hash = new_refresh_token()
+    async with db_connection() as conn:
+        try:
+            if new_hash is not None:
+                await conn.execute(numbered(REHASH_PASSWORD), new_hash, user_from_db["id"], stored_hash)
+            await conn.execute(
+                numbered(INSERT_REFRESH_TOKEN),
+                user_from_db["id"], refresh_hash, new_family_id(), float(REFRESH_TOKEN_TTL_SECONDS),
+            )
+        except Exception as e:
+            logger.error("Login error: %s", e)
+            return JSONResponse({"error": "Login failed"}, status_code=500)
+
+    token = issue_token(email, user_from_db["id"])
+    logger.info("Login successful for username: %s", email)
+
+    user_info = {
+        "userId": str(user_from_db["id"]),
+        "email": user_from_db["email"],
+        "name": user_from_db["name"]
+    }
+    return JSONResponse({
+        "token": token,
+        "refreshToken": refresh_token,
+        "expiresIn": JWT_EXP_DELTA_SECONDS,
+        "user": user_info
+    }, status_code=200)
+
+
+async def _refresh_token_from_request(request):
+    data = await _json_body(request)
+    token = data.get("refreshToken") if isinstance(data, dict) else None
+    return token if isinstance(token, str) and token else None
+
+
+async def _revoke_family(conn, token_hash, family_id, expires_at):
+    await conn.execute(numbered(REVOKE_REFRESH_FAMILY), family_id)
+    revocation_index.add(token_hash, expires_at, family_id)
+    revocation_index.revoke_family(family_id, expires_at)
+
+
+@rate_limited
+async def refresh(request):
+    refresh_token = await _refresh_token_from_request(request)
+    if refresh_token is None:
+        return JSONResponse({"error": "refreshToken is required"}, status_code=400)
+
+    old_hash = hash_refresh_token(refresh_token)
+    revoked, family_id = revocation_index.lookup(old_hash)
+    if revoked and revocation_index.family_revoked(family_id):
+        logger.warning("Refresh rejected: token already revoked")
+        return JSONResponse({"error": "Invalid refresh token"}, status_code=401)
+
+    new_token, new_hash = new_refresh_token()
+    async with db_connection() as conn:
+        try:
+            row = None
+            if not revoked:
+                row = await conn.fetchrow(
+                    numbered(ROTATE_REFRESH_TOKEN), old_hash, new_hash, float(REFRESH_TOKEN_TTL_SECONDS)
+                )
+            if row is None:
+                # Unknown, expired, or already used. Presenting a used token
+                # means it was copied: revoke its whole family.
+                found = await conn.fetchrow(numbered(FIND_REFRESH_TOKEN), old_hash)
+                if found is not None and found["revoked_at"] is not None:
+                    await _revoke_family(conn, old_hash, found["family_id"], found["expires_at"].timestamp())
+                    logger.warning("Refresh token reuse detected, token family revoked")
+                return JSONResponse({"error": "Invalid refresh token"}, status_code=401)
+        except Exception as e:
+            logger.error("Refresh error: %s", e)
+            return JSONResponse({"error": "Refresh failed"}, status_code=500)
+
+    revocation_index.add(old_hash, row["old_expires_at"].timestamp(), row["family_id"])
+    token = issue_token(row["email"], row["id"])
+    return JSONResponse({"token": token, "refreshToken": new_token, "expiresIn": JWT_EXP_DELTA_SECONDS})
+
+
+async def logout(request):
+    refresh_token = await _refresh_token_from_request(request)
+    if refresh_token is None:
+        return JSONResponse({"error": "refreshToken is required"}, status_code=400)
+
+    token_hash = hash_refresh_token(refresh_token)
+    async with db_connection() as conn:
+        try:
+            found = await conn.fetchrow(numbered(FIND_REFRESH_TOKEN), token_hash)
+            if found is not None:
+                await _revoke_family(conn, token_hash, found["family_id"], found["expires_at"].timestamp())
+        except Exception as e:
+            logger.error("Logout error: %s", e)
+            return JSONResponse({"error": "Logout failed"}, status_code=500)
+    return JSONResponse({"message": "Logged out"})
+
+
+async def verify(request):
+    data = await _json_body(request)
+    token = data.get("token") if isinstance(data, dict) else None
+    result = verify_token(token)
+    if not result["valid"]:
+        logger.warning("Token verification failed: %s", result['error'])
+        return JSONResponse(result, status_code=401)
+    logger.info("Token verification successful for user: %s", result['user'])
+    return JSONResponse(result)
+
+
+# Batches larger than this are verified on the credential thread pool, so a
+# burst of uncached tokens doesn't hold the event loop for the whole batch.
+VERIFY_INLINE_MAX = 32
+
+
+def _verify_tokens(tokens):
+    return [verify_token(token) for token in tokens]
+
+
+async def verify_batch(request):
+    data = await _json_body(request)
+    tokens = data.get("tokens") if isinstance(data, dict) else None
+    if not isinstance(tokens, list):
+        return JSONResponse({"error": "Expected a JSON body with a 'tokens' list"}, status_code=400)
+    if len(tokens) > VERIFY_BATCH_MAX:
+        return JSONResponse({"error": f"At most {VERIFY_BATCH_MAX} tokens per request"}, status_code=400)
+    if len(tokens) <= VERIFY_INLINE_MAX:
+        results = _verify_tokens(tokens)
+    else:
+        results = await run_token_work(_verify_tokens, tokens)
+    logger.info("Batch verification: %s/%s valid", sum(r['valid'] for r in results), len(results))
+    return JSONResponse({"results": results})
+
+
+async def jwks_document(request):
+    return JSONResponse(jwks(), headers={"Cache-Control": "public, max-age=300"})
+
+
+async def health(request):
+    """Readiness: 503 while the pool is exhausted, so the ALB routes elsewhere."""
+    global _last_checkout_failures
+    pool_stats = None
+    ready = True
+    if db_pool is not None:
+        pool_stats = _pool_stats()
+        saturated = pool_stats["in_use"] >= pool_stats["max"] and pool_stats["waiting"] > 0
+        ready = not (saturated or _checkout_failures > _last_checkout_failures)
+        _last_checkout_failures = _checkout_failures
+    body = {"status": "ok" if ready else "saturated", "pool": pool_stats, "token_cache": token_cache.stats()}
+    if email_filter is not None:
+        body["email_filter"] = email_filter.stats()
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+async def live(request):
+    """Liveness for the container health check; never touches the pool."""
+    return JSONResponse({"status": "ok"})
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+async def pool_exhausted(request, exc):
+    logger.warning("Connection pool exhausted: no connection within timeout")
+    return JSONResponse({"error": "Service busy, please retry"}, status_code=503, headers={"Retry-After": "1"})
+
+
+class RequestContextMiddleware:
+    """Bind a request id for logging, echo it as X-Request-ID, and log each request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        incoming = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        request_id = begin_request(scope["path"], incoming)
+        route = scope["path"] if scope["path"] in ROUTE_PATHS else "unmatched"
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS.inc(route=route, method=scope["method"], status=status)
+            REQUEST_SECONDS.observe(elapsed, route=route, method=scope["method"], status=status)
+            logger.info(
+                "%s %s %s", scope["method"], scope["path"], status,
+                extra={"status": status, "duration_ms": round(elapsed * 1000, 2)},
+            )
+            end_request()
+
+
+app = Starlette(
+    routes=[
+        Route("/auth/register", auth_register, methods=["POST"]),
+        Route("/auth/login", login, methods=["POST"]),
+        Route("/auth/refresh", refresh, methods=["POST"]),
+        Route("/auth/logout", logout, methods=["POST"]),
+        Route("/verify", verify, methods=["POST"]),
+        Route("/verify/batch", verify_batch, methods=["POST"]),
+        Route("/auth/health", health, methods=["GET"]),
+        Route("/auth/live", live, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+        # Published at both paths: the ALB only forwards /auth/* to this service
+        Route("/.well-known/jwks.json", jwks_document, methods=["GET"]),
+        Route("/auth/.well-known/jwks.json", jwks_document, methods=["GET"]),
+    ],
+    middleware=[Middleware(RequestContextMiddleware)],
+    exception_handlers={asyncio.TimeoutError: pool_exhausted},
+    lifespan=lifespan,
+)
+# Every route is a fixed path, so the raw path is a bounded label
+ROUTE_PATHS = frozenset(route.path for route in app.routes)
+
+if __name__ == "__main__":
+    # Development server only; production runs under gunicorn with uvicorn workers
+    import uvicorn
+    port = int(os.environ.get("PORT", "5000"))
+    uvicorn.run(app, host="0.0.0.0", port=port)
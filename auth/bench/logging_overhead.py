@@ -0,0 +1,91 @@
+"""Per-request logging cost on the request thread, before and after logging_setup.
+
+"before" replays the old login path: basicConfig writing synchronously, with
+f-strings and the full request body logged. "after" logs the same events
+through logging_setup's queue, with an optional sample rate for the route.
+
+    python bench/logging_overhead.py --requests 20000 --sample-rate 0.1
+
+Both write to a temporary file so terminal speed doesn't skew the numbers.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BODY = {"user": {"email": "bench@example.com", "password": "correct horse battery staple"}}
+USER_INFO = {"userId": "42", "email": "bench@example.com", "name": "Bench"}
+
+
+def _before(logger, n):
+    for _ in range(n):
+        data = BODY
+        logger.info(f"Received login data: {data}")
+        email = data["user"]["email"]
+        logger.info(f"Login attempt for email: {email}")
+        logger.info(f"Login successful for username: {email}")
+        logger.info(f"Generated token for user: {USER_INFO}")
+
+
+def _after(logger, n, begin_request, end_request):
+    for i in range(n):
+        begin_request("/auth/login", None)
+        email = BODY["user"]["email"]
+        logger.info("Login attempt for email: %s", email)
+        logger.info("Login successful for username: %s", email)
+        logger.info("%s %s %s", "POST", "/auth/login", 200, extra={"status": 200, "duration_ms": 1.0})
+        end_request()
+
+
+def _reset_root():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def run(requests, sample_rate):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "before.log"), "w") as out:
+            _reset_root()
+            logging.basicConfig(stream=out, level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+            start = time.perf_counter()
+            _before(logging.getLogger("bench"), requests)
+            results["before_us_per_request"] = (time.perf_counter() - start) / requests * 1e6
+            _reset_root()
+
+        # Room for every record, so the run measures enqueueing, not dropping
+        os.environ["LOG_QUEUE_SIZE"] = str(requests * 3)
+        os.environ["LOG_SAMPLE_RATES"] = f"/auth/login={sample_rate}"
+        import logging_setup
+
+        with open(os.path.join(tmp, "after.log"), "w") as out:
+            logging_setup.configure_logging(stream=out)
+            start = time.perf_counter()
+            _after(logging.getLogger("bench"), requests, logging_setup.begin_request, logging_setup.end_request)
+            results["after_us_per_request"] = (time.perf_counter() - start) / requests * 1e6
+            logging_setup.stop_logging()
+            # Including the background thread draining the queue
+            results["after_us_per_request_with_drain"] = (time.perf_counter() - start) / requests * 1e6
+            results["after_dropped_records"] = logging_setup.dropped_records()
+    results["requests"] = requests
+    results["sample_rate"] = sample_rate
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-request logging overhead")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--sample-rate", type=float, default=1.0)
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests, args.sample_rate), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Duplicate-registration race against a running auth service.
+
+Each round sends `--concurrency` simultaneous registrations for the same new
+email. Exactly one should get 201 and the rest 400; any 5xx means the check and
+the insert raced (the old SELECT-then-INSERT path surfaced the unique violation
+as a 500).
+
+    python bench/register_race.py --url http://localhost:5000 --rounds 50 --concurrency 16
+
+With --dsn and the pg_stat_statements extension enabled, also reports how many
+statements against `users` each registration cost on the database.
+"""
+import argparse
+import collections
+import json
+import secrets
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+_USERS_STATEMENT_CALLS = """
+    SELECT COALESCE(sum(calls), 0) FROM pg_stat_statements
+    WHERE query ILIKE '%users%' AND query NOT ILIKE '%pg_stat_statements%'
+"""
+
+
+def _register(url, email, barrier):
+    body = json.dumps({"user": {"email": email, "password": "race-password", "name": "Race"}}).encode()
+    req = urllib.request.Request(f"{url}/auth/register", data=body, headers={"Content-Type": "application/json"})
+    barrier.wait()
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = 0
+    return status, time.perf_counter() - start
+
+
+def _statement_calls(dsn):
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(_USERS_STATEMENT_CALLS)
+            return int(cur.fetchone()[0])
+    finally:
+        conn.close()
+
+
+def run(url, rounds, concurrency, dsn=None):
+    statuses = collections.Counter()
+    latencies = []
+    bad_rounds = 0
+    calls_before = _statement_calls(dsn) if dsn else None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(rounds):
+            email = f"race-{secrets.token_hex(6)}@example.com"
+            barrier = threading.Barrier(concurrency)
+            results = list(executor.map(lambda _: _register(url, email, barrier), range(concurrency)))
+            round_statuses = collections.Counter(status for status, _ in results)
+            statuses.update(round_statuses)
+            latencies.extend(seconds for _, seconds in results)
+            if round_statuses[201] != 1 or round_statuses[400] != concurrency - 1:
+                bad_rounds += 1
+
+    latencies.sort()
+    report = {
+        "requests": rounds * concurrency,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "server_errors": sum(v for k, v in statuses.items() if k >= 500 or k == 0),
+        "bad_rounds": bad_rounds,
+        "latency_ms": {
+            "p50": statistics.median(latencies) * 1000,
+            "p95": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+            "max": latencies[-1] * 1000,
+        },
+    }
+    if dsn:
+        report["users_statements_per_register"] = (_statement_calls(dsn) - calls_before) / report["requests"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent duplicate-registration test")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--dsn", help="Postgres DSN for pg_stat_statements round-trip counts")
+    args = parser.parse_args()
+
+    report = run(args.url.rstrip("/"), args.rounds, args.concurrency, args.dsn)
+    print(json.dumps(report, indent=2))
+    raise SystemExit(1 if report["server_errors"] or report["bad_rounds"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Bulk import and export of the users table.
+
+Import streams NDJSON or CSV rows, validates each one as it arrives, and loads
+them in batches: COPY into a temporary staging table, then one
+INSERT ... SELECT ... ON CONFLICT (email) per batch. Export streams rows from
+a server-side cursor, so memory stays flat however many users there are.
+
+Both are available as admin HTTP routes in app.py and from the command line:
+
+    python bulk_users.py import users.ndjson --on-conflict skip > errors.ndjson
+    python bulk_users.py export --format csv > users.csv
+
+Each import row needs `email` and `name`, plus either `password` (hashed on
+import) or `password_hash` (an existing hash, e.g. from an export).
+"""
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import re
+import sys
+
+import psycopg2
+
+from passwords import hash_password, hashing_pool, is_password_hash
+
+IMPORT_BATCH_SIZE = 5000
+EXPORT_FETCH_SIZE = 5000
+# Per-row errors reported individually; beyond this only the count grows
+MAX_REPORTED_ERRORS = 1000
+
+FORMATS = ("ndjson", "csv")
+EXPORT_COLUMNS = ("id", "email", "name", "created_at")
+
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+_STAGING_TABLE = """
+    CREATE TEMP TABLE IF NOT EXISTS users_import (
+        line_no INTEGER NOT NULL,
+        email TEXT NOT NULL,
+        password TEXT NOT NULL,
+        name TEXT
+    ) ON COMMIT DELETE ROWS
+"""
+
+# First occurrence of an email in the batch wins; the rest are reported
+_MERGE = {
+    "skip": """
+        INSERT INTO users (email, password, name)
+        SELECT DISTINCT ON (email) email, password, name FROM users_import ORDER BY email, line_no
+        ON CONFLICT (email) DO NOTHING
+        RETURNING email
+    """,
+    "update": """
+        INSERT INTO users (email, password, name)
+        SELECT DISTINCT ON (email) email, password, name FROM users_import ORDER BY email, line_no
+        ON CONFLICT (email) DO UPDATE SET password = EXCLUDED.password, name = EXCLUDED.name
+        RETURNING email
+    """,
+}
+
+
+def iter_rows(lines, fmt):
+    """Yield (line_no, row) from an iterable of text lines; bad lines yield (line_no, None)."""
+    if fmt == "ndjson":
+        for line_no, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_no, row if isinstance(row, dict) else None
+    elif fmt == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def validate_row(row):
+    """Return (email, password_or_hash, name, is_hash) or raise ValueError."""
+    if row is None:
+        raise ValueError("Malformed row")
+    email = row.get("email") or ""
+    name = row.get("name") or ""
+    password = row.get("password")
+    password_hash = row.get("password_hash")
+    # NDJSON values can be numbers, lists or objects
+    if not isinstance(email, str) or not _EMAIL.match(email.strip()):
+        raise ValueError("Invalid email")
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("Name is required")
+    email, name = email.strip(), name.strip()
+    if password_hash:
+        if not is_password_hash(password_hash):
+            raise ValueError("Unrecognized password_hash format")
+        return email, password_hash, name, True
+    if not isinstance(password, str) or not password:
+        raise ValueError("password or password_hash is required")
+    return email, password, name, False
+
+
+def _hash_batch(batch):
+    plain = [i for i, entry in enumerate(batch) if not entry[4]]
+    if not plain:
+        return
+    executor = hashing_pool.executor
+    passwords = [batch[i][2] for i in plain]
+    if executor is None:
+        hashes = map(hash_password, passwords)
+    else:
+        hashes = executor.map(hash_password, passwords, chunksize=32)
+    for i, hashed in zip(plain, hashes):
+        line_no, email, _, name, _ = batch[i]
+        batch[i] = (line_no, email, hashed, name, True)
+
+
+def _load_batch(conn, batch, on_conflict):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for line_no, email, password_hash, name, _ in batch:
+        writer.writerow((line_no, email, password_hash, name))
+    buffer.seek(0)
+    with conn.cursor() as cur:
+        cur.execute(_STAGING_TABLE)
+        cur.copy_expert("COPY users_import (line_no, email, password, name) FROM STDIN WITH (FORMAT csv)", buffer)
+        cur.execute(_MERGE[on_conflict])
+        written = {email for (email,) in cur.fetchall()}
+    conn.commit()
+    return written
+
+
+def import_users(connection, rows, on_conflict="skip", batch_size=IMPORT_BATCH_SIZE, max_errors=MAX_REPORTED_ERRORS):
+    """Load (line_no, row) pairs into users.
+
+    `connection` is called once per batch, after the batch's passwords are
+    hashed, and returns a context manager yielding a psycopg2 connection (e.g.
+    ConnectionPool.connection), so no connection is held while hashing.
+
+    A generator: yields {"line": n, "error": "..."} for rejected rows (at most
+    `max_errors` of them) and finally {"summary": {...}}.
+    """
+    if on_conflict not in _MERGE:
+        raise ValueError(f"on_conflict must be one of {sorted(_MERGE)}")
+    counts = {"rows": 0, "imported": 0, "rejected": 0}
+
+    def reject(line_no, message):
+        counts["rejected"] += 1
+        if counts["rejected"] <= max_errors:
+            return {"line": line_no, "error": message}
+        return None
+
+    rows = iter(rows)
+    while True:
+        batch = []
+        consumed = 0
+        for line_no, row in itertools.islice(rows, batch_size):
+            consumed += 1
+            try:
+                email, secret, name, is_hash = validate_row(row)
+            except ValueError as e:
+                error = reject(line_no, str(e))
+                if error:
+                    yield error
+                continue
+            batch.append((line_no, email, secret, name, is_hash))
+        counts["rows"] += consumed
+
+        if batch:
+            _hash_batch(batch)
+            with connection() as conn:
+                try:
+                    written = _load_batch(conn, batch, on_conflict)
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    written = None
+                    message = f"Batch failed: {(e.pgerror or str(e)).strip()}"
+            if written is None:
+                for line_no, *_ in batch:
+                    error = reject(line_no, message)
+                    if error:
+                        yield error
+            else:
+                counts["imported"] += len(written)
+                for line_no, email, *_ in batch:
+                    if email in written:
+                        written.discard(email)
+                    else:
+                        error = reject(line_no, "User with this email already exists")
+                        if error:
+                            yield error
+
+        if consumed < batch_size:
+            break
+    yield {"summary": counts}
+
+
+def export_users(conn, fmt="ndjson", include_hashes=False, fetch_size=EXPORT_FETCH_SIZE):
+    """Yield the users table as NDJSON or CSV text chunks."""
+    columns = EXPORT_COLUMNS + (("password",) if include_hashes else ())
+    header = [("password_hash" if c == "password" else c) for c in columns]
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(header)
+    elif fmt != "ndjson":
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    with conn.cursor(name="users_export") as cur:
+        cur.itersize = fetch_size
+        cur.execute(f"SELECT {', '.join(columns)} FROM users ORDER BY id")
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if not rows:
+                break
+            if fmt == "csv":
+                for row in rows:
+                    writer.writerow(row)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            else:
+                yield "".join(
+                    json.dumps(dict(zip(header, row)), default=str) + "\n" for row in rows
+                )
+    if fmt == "csv" and buffer.tell():
+        # Empty table: still emit the header
+        yield buffer.getvalue()
+    conn.rollback()
+
+
+def main():
+    from config import POSTGRES_URL
+
+    parser = argparse.ArgumentParser(description="Bulk import/export of auth users")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Import users; per-row errors are written to stdout as NDJSON")
+    imp.add_argument("path", help="Input file, or - for stdin")
+    imp.add_argument("--format", choices=FORMATS, help="Defaults to the file extension")
+    imp.add_argument("--on-conflict", choices=sorted(_MERGE), default="skip")
+    exp = sub.add_parser("export", help="Export users to stdout")
+    exp.add_argument("--format", choices=FORMATS, default="ndjson")
+    exp.add_argument("--include-hashes", action="store_true", help="Include password hashes")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(POSTGRES_URL)
+    try:
+        if args.command == "import":
+            fmt = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+            source = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+            with source:
+                batches = import_users(lambda: contextlib.nullcontext(conn), iter_rows(source, fmt), args.on_conflict)
+                for result in batches:
+                    print(json.dumps(result), flush="summary" in result)
+        else:
+            for chunk in export_users(conn, args.format, args.include_hashes):
+                sys.stdout.write(chunk)
+    finally:
+        hashing_pool.shutdown()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Thread-safe, bounded Postgres connection pool.
+
+Replaces psycopg2's SimpleConnectionPool, which is not thread-safe and raises
+immediately when every connection is checked out. Callers here block up to a
+timeout instead, stale connections are validated or recycled, and counters are
+kept for the health and metrics endpoints, including how long connections
+wait to be checked out and how long they are held (which approximates time
+spent in Postgres: passwords, including a bulk import's, are hashed before a
+connection is checked out).
+"""
+import bisect
+import collections
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+from queries import numbered
+
+# Upper bounds (seconds) of the checkout wait-time and hold-time histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the checkout timeout."""
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """Connection that caches server-side prepared statements by name.
+
+    The first execute of a statement on a connection sends PREPARE; later ones
+    send only EXECUTE with the parameters, skipping parse and plan.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+    def execute_prepared(self, cur, name, sql, params):
+        # `name` must be a plain identifier; `sql` uses %s placeholders
+        if name not in self.prepared:
+            cur.execute(f"PREPARE {name} AS {numbered(sql)}")
+            self.prepared.add(name)
+        placeholders = ", ".join(["%s"] * len(params))
+        cur.execute(f"EXECUTE {name} ({placeholders})", params)
+
+
+def connect(dsn):
+    return psycopg2.connect(dsn, connection_factory=PreparingConnection)
+
+
+_Idle = collections.namedtuple("_Idle", "conn created_at returned_at")
+
+
+class ConnectionPool:
+    def __init__(self, dsn, minconn=1, maxconn=20, timeout=5.0, max_lifetime=1800.0,
+                 max_idle=600.0, validate_after=30.0, connect=connect):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("expected 0 <= minconn <= maxconn and maxconn >= 1")
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.validate_after = validate_after
+        self._connect = connect
+
+        self._cond = threading.Condition()
+        self._idle = collections.deque()   # most recently returned on the right
+        self._created = {}                 # id(conn) -> (creation time, checkout time), for checked-out conns
+        self._size = 0                     # open connections, including ones being opened
+        self._waiting = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._checkout_failures = 0
+        self._recycled = 0
+        self._wait_counts = [0] * (len(WAIT_BUCKETS) + 1)
+        self._wait_sum = 0.0
+        self._hold_counts = [0] * (len(WAIT_BUCKETS) + 1)
+        self._hold_sum = 0.0
+
+        for _ in range(minconn):
+            with self._cond:
+                self._size += 1
+            self._idle.append(_Idle(self._open(), time.monotonic(), time.monotonic()))
+
+    def _open(self):
+        try:
+            return self._connect(self.dsn)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _discard(self, conn):
+        # Caller must hold self._cond
+        self._size -= 1
+        self._recycled += 1
+        self._cond.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_usable(self, conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _record_wait(self, waited):
+        # Caller must hold self._cond
+        self._wait_counts[bisect.bisect_left(WAIT_BUCKETS, waited)] += 1
+        self._wait_sum += waited
+
+    def _record_hold(self, held):
+        # Caller must hold self._cond
+        self._hold_counts[bisect.bisect_left(WAIT_BUCKETS, held)] += 1
+        self._hold_sum += held
+
+    def getconn(self, timeout=None):
+        """Check out a connection, blocking up to `timeout` seconds."""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            candidate = None
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.pool.PoolError("connection pool is closed")
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._checkout_failures += 1
+                        raise PoolTimeout(f"no connection available after {timeout:.1f}s")
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+                now = time.monotonic()
+                if self._idle:
+                    candidate = self._idle.pop()
+                    if (now - candidate.created_at > self.max_lifetime
+                            or (now - candidate.returned_at > self.max_idle and self._size > self.minconn)
+                            or candidate.conn.closed):
+                        self._discard(candidate.conn)
+                        continue
+                else:
+                    self._size += 1
+
+            if candidate is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._checkout_failures += 1
+                    raise
+                created_at = time.monotonic()
+            else:
+                conn, created_at = candidate.conn, candidate.created_at
+                # Connections idle for a while may have been dropped server side
+                if time.monotonic() - candidate.returned_at > self.validate_after and not self._is_usable(conn):
+                    with self._cond:
+                        self._discard(conn)
+                    continue
+
+            with self._cond:
+                now = time.monotonic()
+                self._created[id(conn)] = (created_at, now)
+                self._checkouts += 1
+                self._record_wait(now - start)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a checked-out connection, rolling back any open transaction."""
+        if not discard and not conn.closed:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    discard = True
+        with self._cond:
+            checked_out = self._created.pop(id(conn), None)
+            if checked_out is None:
+                raise psycopg2.pool.PoolError("connection was not checked out from this pool")
+            created_at, checked_out_at = checked_out
+            now = time.monotonic()
+            self._record_hold(now - checked_out_at)
+            if discard or conn.closed or self._closed or now - created_at > self.max_lifetime:
+                self._discard(conn)
+            else:
+                self._idle.append(_Idle(conn, created_at, now))
+                self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that always returns the connection to the pool."""
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop().conn)
+            self._cond.notify_all()
+
+    @staticmethod
+    def _histogram(counts, total_seconds):
+        cumulative = []
+        total = 0
+        for bound, count in zip(WAIT_BUCKETS + ("+Inf",), counts):
+            total += count
+            cumulative.append((str(bound), total))
+        return {"buckets": dict(cumulative), "count": total, "sum": round(total_seconds, 6)}
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "max": self.maxconn,
+                "in_use": len(self._created),
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "checkout_failures": self._checkout_failures,
+                "recycled": self._recycled,
+                "wait_seconds": self._histogram(self._wait_counts, self._wait_sum),
+                "hold_seconds": self._histogram(self._hold_counts, self._hold_sum),
+            }
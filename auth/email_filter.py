@@ -0,0 +1,284 @@
+"""Membership filter of registered emails, so logins for unknown emails skip Postgres.
+
+A Bloom filter answers "definitely not registered" or "maybe registered".
+Each worker builds one at startup with a streaming scan of `users`, adds
+emails it registers itself, and catches up on other workers' and replicas'
+registrations with a background poll: pages of rows after a
+`(created_at, id)` keyset cursor, starting a few seconds behind the newest
+row seen so that slow commits aren't missed.
+
+A miss is only trusted once a catch-up that started after the login arrived
+has completed, so a user who registered on another worker or replica a
+moment ago is always found: their registration committed before the login
+was sent. A miss wakes the sync thread, and logins missing at the same time
+share its next catch-up, so the sync connection runs at most one query at a
+time however many arrive. If no such catch-up completes within
+EMAIL_FILTER_MAX_STALENESS seconds, or the last one is older than that,
+login falls back to the database.
+
+To keep the fast path from revealing which emails exist, login still verifies
+the password against the dummy hash, then waits out the recent average
+duration of the real lookup it skipped.
+"""
+import datetime
+import hashlib
+import logging
+import math
+import threading
+import time
+
+import psycopg2
+
+from metrics import header_lines
+from queries import ESTIMATE_USERS, LOAD_USER_EMAILS, USER_EMAILS_AFTER
+
+logger = logging.getLogger(__name__)
+
+# Re-read registrations this far behind the newest created_at seen. created_at
+# is the inserting transaction's start time, so a row can commit after a
+# newer one; the slowest writers are bulk import batches, which hash their
+# passwords before the transaction opens and commit within a few seconds.
+OVERLAP = datetime.timedelta(seconds=5)
+# Rows fetched per catch-up query; a burst of registrations is read in pages
+CATCH_UP_PAGE_SIZE = 5000
+# Smallest filter built, so a new deployment doesn't rebuild on every registration
+MIN_CAPACITY = 100000
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / self.capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        """Set the item's bits; count it only if it wasn't (apparently) present."""
+        positions = self._positions(item)
+        # Setting a bit is a read-modify-write of its byte; two unlocked adds
+        # to the same byte could lose one, which would be a false negative.
+        with self._lock:
+            bits = self._bits
+            new = False
+            for pos in positions:
+                mask = 1 << (pos & 7)
+                if not bits[pos >> 3] & mask:
+                    bits[pos >> 3] |= mask
+                    new = True
+            if new:
+                self.count += 1
+
+    def __contains__(self, item):
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class EmailFilter:
+    def __init__(self, error_rate=0.01, max_staleness=1.0):
+        self.error_rate = error_rate
+        self.max_staleness = max_staleness
+        self._bloom = None
+        self._watermark = None       # newest created_at seen
+        self._synced_at = None       # monotonic start time of the last complete sync
+        self._synced = threading.Condition()
+        self._sync_wanted = threading.Event()
+        self._building = None        # emails added by this worker while a rebuild runs
+        self._lookup_seconds = None  # moving average of the real lookup's duration
+
+    @property
+    def ready(self):
+        return self._bloom is not None
+
+    def needs_rebuild(self):
+        return self._bloom is None or self._bloom.count > self._bloom.capacity
+
+    def since(self):
+        """Lower bound on created_at for the next catch-up query."""
+        if self._watermark is None:
+            return datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+        return self._watermark - OVERLAP
+
+    def _add_rows(self, bloom, rows):
+        for email, created_at, *_ in rows:
+            bloom.add(email)
+            if created_at is not None and (self._watermark is None or created_at > self._watermark):
+                self._watermark = created_at
+
+    def build(self, rows, started, expected=0):
+        """Replace the filter with one built from (email, created_at) rows.
+
+        `started` is time.monotonic() from before the scan began; capacity is
+        twice the larger of `expected` and the current filter's count.
+        """
+        previous = self._bloom
+        expected = max(expected, previous.count if previous else 0)
+        bloom = BloomFilter(max(MIN_CAPACITY, 2 * expected), self.error_rate)
+        self._building = []
+        try:
+            self._add_rows(bloom, rows)
+            # Registrations committed after the scan's snapshot
+            for email in self._building:
+                bloom.add(email)
+            self._bloom = bloom
+            self._mark_synced(started)
+        finally:
+            self._building = None
+        logger.info("Email filter built: %s emails, %s KiB", bloom.count, len(bloom._bits) // 1024)
+
+    def load(self, conn):
+        """Build from a streaming scan over a psycopg2 connection."""
+        with conn.cursor() as cur:
+            cur.execute(ESTIMATE_USERS)
+            expected = max(0, int(cur.fetchone()[0]))
+        started = time.monotonic()
+        with conn.cursor(name="email_filter_load") as cur:
+            cur.itersize = 10000
+            cur.execute(LOAD_USER_EMAILS)
+            self.build(cur, started, expected)
+        conn.rollback()
+
+    def catch_up(self, conn, page_size=CATCH_UP_PAGE_SIZE):
+        """Add registrations since the last sync over a psycopg2 connection."""
+        if self.needs_rebuild():
+            self.load(conn)
+            return
+        started = time.monotonic()
+        # ids are positive, so (since, 0) starts at the first row of that instant
+        cursor = (self.since(), 0)
+        with conn.cursor() as cur:
+            while True:
+                cur.execute(USER_EMAILS_AFTER, (*cursor, page_size))
+                rows = cur.fetchall()
+                self._add_rows(self._bloom, rows)
+                if len(rows) < page_size:
+                    break
+                _, created_at, user_id = rows[-1]
+                cursor = (created_at, user_id)
+        conn.rollback()
+        self._mark_synced(started)
+
+    def add(self, email):
+        """Record an email registered by this worker."""
+        building = self._building
+        if building is not None:
+            building.append(email)
+        if self._bloom is not None:
+            self._bloom.add(email)
+
+    def _mark_synced(self, started):
+        with self._synced:
+            self._synced_at = started
+            self._synced.notify_all()
+
+    def wait_for_sync_request(self, timeout):
+        """Sync thread: block until a login asks for a catch-up, or for at most `timeout` seconds."""
+        self._sync_wanted.wait(timeout)
+        self._sync_wanted.clear()
+
+    def request_sync(self):
+        self._sync_wanted.set()
+
+    def maybe_absent(self, email):
+        """True if the filter, as of its last sync, hasn't seen email; doesn't block."""
+        bloom = self._bloom
+        if bloom is None or not isinstance(email, str):
+            return False
+        if time.monotonic() - self._synced_at > self.max_staleness:
+            return False
+        return email not in bloom
+
+    def confirm_absent(self, email):
+        """Wait for a catch-up that starts now; True if email is still absent after it. Blocks."""
+        requested = time.monotonic()
+        deadline = requested + self.max_staleness
+        self.request_sync()
+        with self._synced:
+            while self._synced_at is None or self._synced_at < requested:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._synced.wait(remaining)
+        return email not in self._bloom
+
+    def definitely_absent(self, email):
+        """True only if email wasn't registered when the login arrived; may wait for one catch-up."""
+        return self.maybe_absent(email) and self.confirm_absent(email)
+
+    def observe_lookup(self, seconds):
+        """Feed the duration of a real user lookup, for padding the fast path."""
+        if self._lookup_seconds is None:
+            self._lookup_seconds = seconds
+        else:
+            self._lookup_seconds += 0.1 * (seconds - self._lookup_seconds)
+
+    def padding(self, elapsed=0.0):
+        """Seconds left to wait for a filtered login that has already spent `elapsed` confirming the miss."""
+        return max(0.0, (self._lookup_seconds or 0.0) - elapsed)
+
+    def stats(self):
+        bloom = self._bloom
+        return {
+            "entries": bloom.count if bloom else 0,
+            "capacity": bloom.capacity if bloom else 0,
+            "staleness_seconds": round(time.monotonic() - self._synced_at, 3) if self._synced_at else None,
+        }
+
+    def collect(self):
+        """Exposition lines for metrics.add_collector."""
+        stats = self.stats()
+        lines = header_lines("auth_email_filter_entries", "gauge", "Emails in the login email filter")
+        lines.append(f"auth_email_filter_entries {stats['entries']}")
+        if stats["staleness_seconds"] is not None:
+            lines += header_lines(
+                "auth_email_filter_staleness_seconds", "gauge", "Seconds since the email filter last synced"
+            )
+            lines.append(f"auth_email_filter_staleness_seconds {stats['staleness_seconds']}")
+        return lines
+
+
+class FilterSync(threading.Thread):
+    """Loads an EmailFilter, then keeps it caught up, from its own connection outside the pool.
+
+    Catches up every `interval` seconds, or as soon as a login asks to confirm
+    a miss. That connection is one more per worker than DB_POOL_MAX (see
+    gunicorn.conf.py). Until the first load completes the filter isn't ready
+    and every login takes the database path.
+    """
+
+    def __init__(self, email_filter, dsn, interval=1.0):
+        super().__init__(name="email-filter-sync", daemon=True)
+        self.email_filter = email_filter
+        self.dsn = dsn
+        self.interval = interval
+        self._stopping = threading.Event()
+
+    def run(self):
+        conn = None
+        while not self._stopping.is_set():
+            try:
+                if conn is None or conn.closed:
+                    conn = psycopg2.connect(self.dsn)
+                self.email_filter.catch_up(conn)
+            except Exception as e:
+                # The filter goes stale and login falls back to the database
+                logger.warning("Email filter sync failed: %s", e)
+                if conn is not None:
+                    conn.close()
+                conn = None
+                self._stopping.wait(5)
+            self.email_filter.wait_for_sync_request(self.interval)
+        if conn is not None:
+            conn.close()
+
+    def stop(self):
+        self._stopping.set()
+        self.email_filter.request_sync()
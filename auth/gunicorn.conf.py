@@ -0,0 +1,71 @@
+# Production serving config for the auth service:
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# Every setting can be overridden from the environment. Send SIGHUP to the
+# master for a graceful reload (new workers start before old ones drain).
+import os
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Preforked workers, each with a small thread pool. Requests are dominated by
+# Postgres round trips, so threads overlap I/O while workers use the cores.
+# For async_app use GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker: one
+# event loop per core already overlaps I/O, so it gets fewer, busier workers.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+_async_workers = "uvicorn" in worker_class.lower()
+workers = int(os.environ.get("GUNICORN_WORKERS", _cpu_count() if _async_workers else _cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", "4"))
+
+# Listen queue for connection bursts (login storms) while workers catch up
+backlog = int(os.environ.get("GUNICORN_BACKLOG", "2048"))
+
+# One pooled connection per request thread is enough; more only adds idle
+# connections. Each worker also holds one connection outside the pool for its
+# email filter sync, so workers x (pool size + 1) must stay under the RDS
+# connection limit.
+# An event loop multiplexes many requests, so async workers get a larger pool.
+raw_env = [f"DB_POOL_MAX={os.environ.get('DB_POOL_MAX', 20 if _async_workers else threads)}"]
+
+# Keep idle connections open longer than the ALB idle timeout (60s) so the
+# load balancer never reuses a socket the worker has already closed.
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "75"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+# Recycle workers periodically; jitter keeps them from restarting together.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "10000"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", "1000"))
+
+# The app is imported per worker, never in the master, so no connection can
+# be inherited across fork() and a reload picks up new code.
+preload_app = False
+reload = os.environ.get("GUNICORN_RELOAD", "false").lower() == "true"
+
+accesslog = None
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+# The async app sets itself up in its ASGI lifespan; these hooks are for app.py.
+def _is_flask_app(worker):
+    return (worker.app.app_uri or "").split(":")[0] == "app"
+
+
+def post_worker_init(worker):
+    if _is_flask_app(worker):
+        from app import init_worker
+        init_worker()
+
+
+def worker_exit(server, worker):
+    if _is_flask_app(worker):
+        from app import close_worker
+        close_worker()
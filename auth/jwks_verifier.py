@@ -0,0 +1,75 @@
+"""Local access-token verification for services downstream of auth.
+
+Fetches the auth service's JWKS, caches the public keys, and verifies tokens
+without calling back to auth or holding any shared secret:
+
+    from jwks_verifier import JWKSVerifier
+
+    verifier = JWKSVerifier("https://crdtapi.yossidemo.click/auth/.well-known/jwks.json")
+    claims = verifier.verify(token)   # raises jwt.InvalidTokenError subclasses
+
+Only needs PyJWT[crypto]; safe to copy into another service as a single file.
+"""
+import json
+import threading
+import time
+import urllib.request
+
+import jwt
+
+SUPPORTED_ALGORITHMS = ("RS256", "EdDSA")
+
+
+class JWKSVerifier:
+    def __init__(self, jwks_url, ttl=300.0, min_refresh_interval=30.0, timeout=5.0, leeway=0):
+        self.jwks_url = jwks_url
+        self.ttl = ttl
+        # An unknown kid triggers a refetch (the signer may have rotated), but
+        # no more often than this, so garbage kids can't hammer the auth service.
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.leeway = leeway
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._fetched_at = None
+
+    def _fetch(self):
+        with urllib.request.urlopen(self.jwks_url, timeout=self.timeout) as response:
+            document = json.load(response)
+        keys = {}
+        for jwk in document.get("keys", []):
+            if jwk.get("kid") and jwk.get("alg") in SUPPORTED_ALGORITHMS:
+                keys[jwk["kid"]] = jwt.PyJWK(jwk, algorithm=jwk["alg"])
+        return keys
+
+    def _refresh(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if self._fetched_at is not None:
+                age = now - self._fetched_at
+                if age < self.min_refresh_interval or (not force and age < self.ttl):
+                    return
+            try:
+                self._keys = self._fetch()
+            except Exception:
+                # Keep serving the cached keys when auth is unreachable
+                if not self._keys:
+                    raise
+            self._fetched_at = now
+
+    def get_key(self, kid):
+        self._refresh()
+        key = self._keys.get(kid)
+        if key is None:
+            self._refresh(force=True)
+            key = self._keys.get(kid)
+        return key
+
+    def verify(self, token):
+        """Return the token's claims, or raise a jwt.InvalidTokenError subclass."""
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self.get_key(kid) if kid else None
+        if key is None:
+            raise jwt.InvalidTokenError("Unknown signing key")
+        # Pin the algorithm to the published key's own, never the token's claim
+        return jwt.decode(token, key.key, algorithms=[key.algorithm_name], leeway=self.leeway)
@@ -0,0 +1,159 @@
+"""Asymmetric signing keys for access tokens, and their published JWKS.
+
+Keys are private-key PEMs identified by a key id (`kid`), loaded from either
+  - JWT_KEYS_DIR: a directory of `<kid>.pem` files, re-read when it changes, or
+  - JWT_SIGNING_KEYS: a JSON object of {kid: pem} (e.g. from Secrets Manager).
+
+Every loaded key is published in the JWKS and accepted for verification; only
+JWT_ACTIVE_KID (default: the newest kid in sort order) signs new tokens. To
+rotate, add a new key and make it active, then remove the old one once the
+longest-lived token it signed has expired.
+
+Generate a key with:
+    python keys.py generate --alg EdDSA --dir keys/
+"""
+import argparse
+import datetime
+import json
+import os
+import secrets
+import threading
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+# How often a JWT_KEYS_DIR ring checks the directory for rotated keys
+RELOAD_INTERVAL_SECONDS = 30
+
+
+class SigningKey:
+    def __init__(self, kid, private_key):
+        self.kid = kid
+        self.private_key = private_key
+        self.public_key = private_key.public_key()
+        if isinstance(private_key, rsa.RSAPrivateKey):
+            self.algorithm = "RS256"
+            jwk = RSAAlgorithm.to_jwk(self.public_key, as_dict=True)
+        elif isinstance(private_key, ed25519.Ed25519PrivateKey):
+            self.algorithm = "EdDSA"
+            jwk = OKPAlgorithm.to_jwk(self.public_key, as_dict=True)
+        else:
+            raise ValueError(f"Unsupported key type for kid '{kid}': use RSA or Ed25519")
+        self.jwk = {**jwk, "kid": kid, "alg": self.algorithm, "use": "sig"}
+
+    @classmethod
+    def from_pem(cls, kid, pem):
+        if isinstance(pem, str):
+            pem = pem.encode()
+        return cls(kid, serialization.load_pem_private_key(pem, password=None))
+
+
+class KeyRing:
+    def __init__(self, keys_dir=None, keys_json=None, active_kid=None, on_change=None):
+        self.keys_dir = keys_dir
+        self.keys_json = keys_json
+        self.active_kid = active_kid
+        # Called after a reload, e.g. to drop claims verified with a removed key
+        self.on_change = on_change
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._jwks = {"keys": []}
+        self._dir_mtime = None
+        self._checked_at = 0.0
+        self._load()
+
+    @property
+    def enabled(self):
+        return bool(self._keys)
+
+    def _read_keys(self):
+        keys = {}
+        if self.keys_json:
+            for kid, pem in json.loads(self.keys_json).items():
+                keys[kid] = SigningKey.from_pem(kid, pem)
+        if self.keys_dir:
+            for name in os.listdir(self.keys_dir):
+                if name.endswith(".pem"):
+                    with open(os.path.join(self.keys_dir, name), "rb") as f:
+                        kid = name[:-len(".pem")]
+                        keys[kid] = SigningKey.from_pem(kid, f.read())
+        return keys
+
+    def _load(self):
+        keys = self._read_keys()
+        if self.active_kid and keys and self.active_kid not in keys:
+            raise ValueError(f"JWT_ACTIVE_KID '{self.active_kid}' is not among the loaded keys")
+        self._keys = keys
+        self._jwks = {"keys": [keys[kid].jwk for kid in sorted(keys)]}
+        if self.keys_dir:
+            self._dir_mtime = os.stat(self.keys_dir).st_mtime
+
+    def _maybe_reload(self):
+        if not self.keys_dir:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_INTERVAL_SECONDS:
+            return
+        with self._lock:
+            if now - self._checked_at < RELOAD_INTERVAL_SECONDS:
+                return
+            self._checked_at = now
+            if os.stat(self.keys_dir).st_mtime != self._dir_mtime:
+                self._load()
+                if self.on_change is not None:
+                    self.on_change()
+
+    def signing_key(self):
+        self._maybe_reload()
+        kid = self.active_kid or max(self._keys)
+        return self._keys[kid]
+
+    def get(self, kid):
+        self._maybe_reload()
+        return self._keys.get(kid)
+
+    def jwks(self):
+        self._maybe_reload()
+        return self._jwks
+
+
+def generate_key(alg):
+    if alg == "EdDSA":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+    elif alg == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        raise ValueError(f"Unsupported algorithm: {alg}")
+    # Timestamp prefix keeps the newest key last in sort order
+    kid = f"{datetime.datetime.now(datetime.timezone.utc):%Y%m%d%H%M%S}-{secrets.token_hex(4)}"
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    return kid, pem
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage JWT signing keys")
+    sub = parser.add_subparsers(dest="command", required=True)
+    gen = sub.add_parser("generate", help="Generate a new signing key")
+    gen.add_argument("--alg", choices=["EdDSA", "RS256"], default="EdDSA")
+    gen.add_argument("--dir", help="Write <kid>.pem into this directory instead of printing JSON")
+    args = parser.parse_args()
+
+    kid, pem = generate_key(args.alg)
+    if args.dir:
+        os.makedirs(args.dir, exist_ok=True)
+        path = os.path.join(args.dir, f"{kid}.pem")
+        with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as f:
+            f.write(pem)
+        print(f"Wrote {path}")
+    else:
+        print(json.dumps({kid: pem.decode()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Structured, sampled, non-blocking logging for app.py and async_app.py.
+
+Request threads only put records on a bounded in-memory queue; a background
+listener formats them as one JSON object per line and writes them out. When
+the queue is full a record is dropped and counted rather than blocking the
+request.
+
+Messages use %-style arguments, so nothing is formatted for records that are
+filtered out or sampled away:
+
+    logger.info("Login attempt for email: %s", email)
+
+Every record carries the current request id (taken from an incoming
+`X-Request-ID` header or generated, and echoed on the response). Records below
+WARNING are sampled per request by route (LOG_SAMPLE_RATES); warnings and
+errors are always kept. Keys that look like secrets in dict arguments and
+extra fields, and anything shaped like a JWT, are replaced with [REDACTED].
+"""
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import secrets
+import sys
+
+from config import LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLE_RATES
+
+REDACTED = "[REDACTED]"
+_SECRET_KEY = re.compile(r"pass|secret|token|authorization|cookie|hash", re.IGNORECASE)
+_JWT = re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]*")
+_REQUEST_ID = re.compile(r"^[\w.:-]{1,64}$")
+
+# Attributes every LogRecord has; anything else was passed with `extra=`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+route_var = contextvars.ContextVar("route", default=None)
+sampled_var = contextvars.ContextVar("sampled", default=True)
+
+
+def _parse_sample_rates(text):
+    """"/verify=0.01,/auth/login=1" -> {"/verify": 0.01, "/auth/login": 1.0}"""
+    rates = {}
+    for item in text.split(","):
+        if "=" in item:
+            route, rate = item.split("=", 1)
+            rates[route.strip()] = float(rate)
+    return rates
+
+
+SAMPLE_RATES = _parse_sample_rates(LOG_SAMPLE_RATES)
+
+
+def redact(value):
+    if isinstance(value, dict):
+        return {k: REDACTED if isinstance(k, str) and _SECRET_KEY.search(k) else redact(v)
+                for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact(v) for v in value)
+    if isinstance(value, str):
+        return _JWT.sub(REDACTED, value)
+    return value
+
+
+def begin_request(route, request_id=None):
+    """Bind a request id and sampling decision to the current context.
+
+    Returns the request id; call from the start of each request.
+    """
+    if not request_id or not _REQUEST_ID.match(request_id):
+        request_id = secrets.token_hex(8)
+    request_id_var.set(request_id)
+    route_var.set(route)
+    rate = SAMPLE_RATES.get(route, 1.0)
+    sampled_var.set(rate >= 1.0 or random.random() < rate)
+    return request_id
+
+
+def end_request():
+    request_id_var.set(None)
+    route_var.set(None)
+    sampled_var.set(True)
+
+
+class SamplingFilter(logging.Filter):
+    """Drop sub-WARNING records of requests that weren't sampled."""
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or sampled_var.get()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        args = record.args
+        if args:
+            record.args = redact(args) if isinstance(args, (dict, tuple)) else args
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": _JWT.sub(REDACTED, record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = REDACTED if _SECRET_KEY.search(key) else redact(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local development, with the same redaction."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(message)s")
+
+    def format(self, record):
+        if record.args and isinstance(record.args, (dict, tuple)):
+            record.args = redact(record.args)
+        return _JWT.sub(REDACTED, super().format(record))
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue without formatting and without ever blocking the caller."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Capture the context here, on the request's thread; leave the
+        # message unformatted for the listener.
+        record.request_id = request_id_var.get()
+        record.route = route_var.get()
+        if record.exc_info:
+            # Tracebacks hold frames alive; render them now and let go
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # The stock listener uses put_nowait, which fails on a full queue and
+        # leaves the thread running; wait for room instead.
+        self.queue.put(self._sentinel)
+
+
+_listener = None
+_handler = None
+_pid = None
+
+
+def configure_logging(stream=None, level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Route the root logger through the background queue; idempotent per process."""
+    global _listener, _handler, _pid
+    if _pid == os.getpid():
+        return
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    _handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _handler.addFilter(SamplingFilter())
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+    root.setLevel(level)
+
+    # A listener inherited through fork has no thread in this process
+    _listener = _QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    _pid = os.getpid()
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener, _pid
+    if _listener is not None and _pid == os.getpid():
+        _listener.stop()
+    _listener = None
+    _pid = None
+
+
+def dropped_records():
+    return _handler.dropped if _handler is not None else 0
+
+
+atexit.register(stop_logging)
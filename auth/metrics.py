@@ -0,0 +1,246 @@
+"""In-process metrics rendered in the Prometheus text format for /metrics.
+
+    REQUESTS = counter("auth_http_requests_total", "HTTP requests", ["route", "method", "status"])
+    REQUESTS.inc(route="/auth/login", method="POST", status="200")
+
+    with JWT_SECONDS.time(op="decode"):
+        ...
+
+Values live in the worker process that recorded them: under gunicorn each
+scrape is answered by whichever worker accepts it. Collectors registered with
+`add_collector` are called at scrape time for values that are cheaper to read
+than to track (pool state, process CPU and memory).
+"""
+import bisect
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; suits both sub-millisecond JWT work and KDF-bound logins
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def header_lines(name, kind, help_text):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+def histogram_lines(name, buckets, count, total, labelnames=(), labelvalues=()):
+    """Render one histogram series from cumulative {upper_bound: count} buckets."""
+    lines = []
+    for bound, cumulative in buckets.items():
+        le = "+Inf" if bound in ("+Inf", float("inf")) else _number(float(bound))
+        lines.append(f"{name}_bucket{_labels(labelnames, labelvalues, ('le', le))} {cumulative}")
+    lines.append(f"{name}_count{_labels(labelnames, labelvalues)} {count}")
+    lines.append(f"{name}_sum{_labels(labelnames, labelvalues)} {_number(float(total))}")
+    return lines
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = header_lines(self.name, self.kind, self.help)
+        for key, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (plus +Inf), then the running sum
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = header_lines(self.name, self.kind, self.help)
+        for key, (counts, total) in items:
+            cumulative, running = {}, 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                running += count
+                cumulative[bound] = running
+            lines.extend(histogram_lines(self.name, cumulative, running, total, self.labelnames, key))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Re-importing a module returns the already-registered metric
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def add_collector(self, collector):
+        """`collector()` returns exposition lines, including HELP and TYPE."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        for collector in collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, labelnames=()):
+    return REGISTRY.register(Counter(name, help_text, labelnames))
+
+
+def gauge(name, help_text, labelnames=()):
+    return REGISTRY.register(Gauge(name, help_text, labelnames))
+
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, labelnames, buckets))
+
+
+def add_collector(collector):
+    REGISTRY.add_collector(collector)
+
+
+def render():
+    return REGISTRY.render()
+
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_START_TIME = time.time()
+
+
+def _resident_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        # Peak rather than current RSS, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def process_collector():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    lines = [
+        "# HELP process_cpu_seconds_total User and system CPU time of this worker",
+        "# TYPE process_cpu_seconds_total counter",
+        f"process_cpu_seconds_total {_number(usage.ru_utime + usage.ru_stime)}",
+        "# HELP process_resident_memory_bytes Resident set size of this worker",
+        "# TYPE process_resident_memory_bytes gauge",
+        f"process_resident_memory_bytes {_resident_bytes()}",
+        "# HELP process_start_time_seconds Start time of this worker since the epoch",
+        "# TYPE process_start_time_seconds gauge",
+        f"process_start_time_seconds {_number(_START_TIME)}",
+        "# HELP process_threads Threads in this worker",
+        "# TYPE process_threads gauge",
+        f"process_threads {threading.active_count()}",
+        "# HELP auth_worker_pid Process id of the worker that answered this scrape",
+        "# TYPE auth_worker_pid gauge",
+        f"auth_worker_pid {os.getpid()}",
+    ]
+    fds = _open_fds()
+    if fds is not None:
+        lines += [
+            "# HELP process_open_fds Open file descriptors of this worker",
+            "# TYPE process_open_fds gauge",
+            f"process_open_fds {fds}",
+        ]
+    return lines
+
+
+add_collector(process_collector)
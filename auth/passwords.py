@@ -0,0 +1,268 @@
+"""Password hashing for register and login.
+
+Hashes are self-describing strings, so cost parameters can change without a
+migration: login verifies with whatever parameters a hash was made with, and
+re-hashes when they differ from the current settings.
+
+    $scrypt$ln=14,r=8,p=1$<salt>$<hash>
+    $pbkdf2-sha256$i=600000$<salt>$<hash>
+    $argon2id$v=19$m=65536,t=3,p=1$<salt>$<hash>   (needs argon2-cffi)
+
+Rows from before hashing (plain text) still verify, and are re-hashed on the
+next successful login.
+
+Hashing is deliberately slow, so it runs on a process pool rather than the
+request threads. Pick parameters for the deployed CPU with:
+
+    python passwords.py calibrate --target-ms 100
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config import PASSWORD_HASH_ALGORITHM, PASSWORD_HASH_PARAMS, PASSWORD_HASH_WORKERS
+
+SALT_BYTES = 16
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _format_params(params):
+    return ",".join(f"{k}={v}" for k, v in params.items())
+
+
+def _parse_params(text):
+    return {k: int(v) for k, v in (item.split("=", 1) for item in text.split(",") if item)}
+
+
+class Scrypt:
+    name = "scrypt"
+    default_params = {"ln": 14, "r": 8, "p": 1}
+    # Calibration raises the CPU/memory cost exponent
+    tuning_param = "ln"
+
+    def _derive(self, password, salt, params):
+        n, r, p = 1 << params["ln"], params["r"], params["p"]
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * r * (n + p), dklen=32)
+
+    def hash(self, password, params):
+        salt = secrets.token_bytes(SALT_BYTES)
+        digest = self._derive(password, salt, params)
+        return f"${self.name}${_format_params(params)}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def parse_params(self, encoded):
+        return _parse_params(encoded.split("$")[2])
+
+    def verify(self, encoded, password):
+        _, _, params, salt, digest = encoded.split("$")
+        actual = self._derive(password, _b64decode(salt), _parse_params(params))
+        return hmac.compare_digest(actual, _b64decode(digest))
+
+
+class PBKDF2SHA256(Scrypt):
+    name = "pbkdf2-sha256"
+    default_params = {"i": 600000}
+    tuning_param = "i"
+
+    def _derive(self, password, salt, params):
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, params["i"])
+
+
+class Argon2id:
+    name = "argon2id"
+    default_params = {"m": 65536, "t": 3, "p": 1}
+    tuning_param = "t"
+
+    def _hasher(self, params):
+        from argon2 import PasswordHasher
+        return PasswordHasher(time_cost=params["t"], memory_cost=params["m"], parallelism=params["p"])
+
+    def hash(self, password, params):
+        return self._hasher(params).hash(password)
+
+    def parse_params(self, encoded):
+        return _parse_params(encoded.split("$")[3])
+
+    def verify(self, encoded, password):
+        from argon2.exceptions import VerificationError, InvalidHashError
+        try:
+            return self._hasher(self.parse_params(encoded)).verify(encoded, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+
+ALGORITHMS = {algorithm.name: algorithm for algorithm in (Scrypt(), PBKDF2SHA256(), Argon2id())}
+
+
+def _algorithm_of(encoded):
+    if not encoded.startswith("$"):
+        return None
+    return ALGORITHMS.get(encoded.split("$")[1])
+
+
+def is_password_hash(value):
+    """True if `value` is a hash in one of the supported formats."""
+    return isinstance(value, str) and _algorithm_of(value) is not None
+
+
+def hash_password(password, algorithm=PASSWORD_HASH_ALGORITHM, params=None):
+    algo = ALGORITHMS[algorithm]
+    return algo.hash(password, params or current_params(algorithm))
+
+
+def verify_password(encoded, password):
+    if not isinstance(password, str) or not isinstance(encoded, str):
+        return False
+    algo = _algorithm_of(encoded)
+    if algo is None:
+        # Legacy plain-text row
+        return hmac.compare_digest(encoded.encode(), password.encode())
+    try:
+        return algo.verify(encoded, password)
+    except (ValueError, KeyError):
+        return False
+
+
+def current_params(algorithm=PASSWORD_HASH_ALGORITHM):
+    params = dict(ALGORITHMS[algorithm].default_params)
+    if PASSWORD_HASH_PARAMS and algorithm == PASSWORD_HASH_ALGORITHM:
+        params.update(_parse_params(PASSWORD_HASH_PARAMS))
+    return params
+
+
+def needs_rehash(encoded):
+    algo = _algorithm_of(encoded)
+    if algo is None or algo.name != PASSWORD_HASH_ALGORITHM:
+        return True
+    try:
+        return algo.parse_params(encoded) != current_params()
+    except (ValueError, IndexError):
+        return True
+
+
+# Hash of a random password with the current parameters. Login verifies
+# against it when the email is unknown, so both paths cost the same.
+DUMMY_HASH = None
+
+
+def dummy_hash():
+    global DUMMY_HASH
+    if DUMMY_HASH is None:
+        DUMMY_HASH = hash_password(secrets.token_urlsafe(16))
+    return DUMMY_HASH
+
+
+class HashingPool:
+    """Runs hashing on worker processes, created lazily in each server worker."""
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """The process pool, or None when hashing runs inline (workers=0)."""
+        if self.workers <= 0:
+            return None
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    # spawn, not fork: server workers are multi-threaded
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _run(self, func, *args):
+        executor = self.executor
+        if executor is None:
+            return func(*args)
+        return executor.submit(func, *args).result()
+
+    def hash(self, password):
+        return self._run(hash_password, password)
+
+    def verify(self, encoded, password):
+        return self._run(verify_password, encoded, password)
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+hashing_pool = HashingPool()
+
+
+def _time_hash(algorithm, params, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        ALGORITHMS[algorithm].hash("calibration-password", params)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def calibrate(algorithm, target_ms, rounds=5, max_steps=24):
+    """Raise the algorithm's cost until one hash takes at least target_ms.
+
+    Returns a list of (params, ms_per_hash, logins_per_sec_per_core) rows.
+    """
+    algo = ALGORITHMS[algorithm]
+    params = dict(algo.default_params)
+    key = algo.tuning_param
+    # Start cheap and work upwards
+    params[key] = {"ln": 10, "i": 50000, "t": 1}[key]
+    results = []
+    for _ in range(max_steps):
+        seconds = _time_hash(algorithm, params, rounds)
+        results.append((dict(params), seconds * 1000, 1 / seconds))
+        if seconds * 1000 >= target_ms:
+            break
+        if key == "ln":
+            params[key] += 1
+        elif key == "i":
+            params[key] = int(params[key] * 1.5)
+        else:
+            params[key] += 1
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Password hashing tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cal = sub.add_parser("calibrate", help="Pick cost parameters for a target hash latency")
+    cal.add_argument("--algorithm", choices=sorted(ALGORITHMS), default=PASSWORD_HASH_ALGORITHM)
+    cal.add_argument("--target-ms", type=float, default=100.0)
+    cal.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'params':<28} {'ms/hash':>10} {'logins/s/core':>14}")
+    results = calibrate(args.algorithm, args.target_ms, args.rounds)
+    for params, ms, per_sec in results:
+        print(f"{_format_params(params):<28} {ms:>10.1f} {per_sec:>14.1f}")
+    chosen = results[-1][0]
+    print(f"\nPASSWORD_HASH_ALGORITHM={args.algorithm}")
+    print(f"PASSWORD_HASH_PARAMS={_format_params(chosen)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""SQL shared by app.py (psycopg2) and async_app.py (asyncpg).
+
+Statements are written with psycopg2's `%s` placeholders; `numbered()`
+converts them to asyncpg's `$1, $2, ...` form.
+"""
+import re
+
+_PLACEHOLDER = re.compile(r"%s")
+
+
+def numbered(sql):
+    """Rewrite `%s` placeholders as `$1, $2, ...` for asyncpg."""
+    counter = iter(range(1, sql.count("%s") + 1))
+    return _PLACEHOLDER.sub(lambda _: f"${next(counter)}", sql)
+
+
+# Register in one statement. Returns no row if the email is taken, so two
+# concurrent registrations can't both pass a check and one then hit a unique
+# violation. Parameters: email, password_hash, name
+REGISTER_USER = """
+    INSERT INTO users (email, password, name) VALUES (%s, %s, %s)
+    ON CONFLICT (email) DO NOTHING
+    RETURNING id
+"""
+
+# Only the columns login needs. Parameters: email
+SELECT_LOGIN_USER = """
+    SELECT id, email, name, password FROM users WHERE email = %s
+"""
+
+# Email filter (email_filter.py): planner's row estimate for sizing, a full
+# scan, and registrations after a (created_at, id) keyset cursor
+ESTIMATE_USERS = """
+    SELECT reltuples::BIGINT FROM pg_class WHERE oid = 'users'::regclass
+"""
+
+LOAD_USER_EMAILS = """
+    SELECT email, created_at FROM users
+"""
+
+# Parameters: cursor created_at, cursor id, page size
+USER_EMAILS_AFTER = """
+    SELECT email, created_at, id FROM users
+    WHERE (created_at, id) > (%s, %s)
+    ORDER BY created_at, id
+    LIMIT %s
+"""
+
+# Upgrade a password hash after login, if nobody changed it meanwhile.
+# Parameters: new_hash, user_id, old_hash
+REHASH_PASSWORD = """
+    UPDATE users SET password = %s WHERE id = %s AND password = %s
+"""
+
+# Store a new refresh token. Parameters: user_id, token_hash, family_id, ttl_seconds
+INSERT_REFRESH_TOKEN = """
+    INSERT INTO refresh_tokens (user_id, token_hash, family_id, expires_at)
+    VALUES (%s, %s, %s, now() + %s * interval '1 second')
+"""
+
+# Consume a live refresh token and issue its successor in the same family, in
+# one round trip. Returns no row if the token is unknown, expired or already
+# used. Parameters: old_hash, new_hash, ttl_seconds
+ROTATE_REFRESH_TOKEN = """
+    WITH consumed AS (
+        UPDATE refresh_tokens SET revoked_at = now()
+        WHERE token_hash = %s AND revoked_at IS NULL AND expires_at > now()
+        RETURNING user_id, family_id, expires_at
+    ), issued AS (
+        INSERT INTO refresh_tokens (user_id, token_hash, family_id, expires_at)
+        SELECT user_id, %s, family_id, now() + %s * interval '1 second' FROM consumed
+        RETURNING user_id
+    )
+    SELECT u.id, u.email, consumed.family_id, consumed.expires_at AS old_expires_at
+    FROM consumed JOIN users u ON u.id = consumed.user_id
+"""
+
+# Look up a token that failed to rotate, to tell reuse from garbage, or one
+# being logged out. Parameters: token_hash
+FIND_REFRESH_TOKEN = """
+    SELECT family_id, expires_at, revoked_at FROM refresh_tokens WHERE token_hash = %s
+"""
+
+# Revoke every live token in a family (logout, or reuse of a rotated token).
+# Parameters: family_id
+REVOKE_REFRESH_FAMILY = """
+    UPDATE refresh_tokens SET revoked_at = now()
+    WHERE family_id = %s AND revoked_at IS NULL
+"""
+
+# Revoked tokens that could still be presented, to seed the revocation index
+LOAD_REVOKED_REFRESH_TOKENS = """
+    SELECT token_hash, family_id, expires_at FROM refresh_tokens
+    WHERE revoked_at IS NOT NULL AND expires_at > now()
+"""
+
+PURGE_EXPIRED_REFRESH_TOKENS = """
+    DELETE FROM refresh_tokens WHERE expires_at < now() - interval '1 day'
+"""
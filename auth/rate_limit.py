@@ -0,0 +1,195 @@
+"""Token-bucket rate limiting for the credential routes.
+
+Each route has limits per key kind: the client IP, and for login/register the
+email being tried. A bucket holds up to `burst` tokens, refills at `rate` per
+second, and a request spends one; an empty bucket rejects with a Retry-After.
+
+Limits come from RATE_LIMITS, a JSON object of route -> {kind: "N/period"},
+where period is second, minute or hour and an optional ":B" sets the burst
+(default N):
+
+    {"/auth/login": {"ip": "600/minute:200", "email": "10/minute:5"}}
+
+Buckets live in a bounded in-process LRU by default, so limits are per worker.
+Set RATE_LIMIT_REDIS_URL (needs the `redis` package) to share them across
+workers and replicas; if Redis is unreachable the limiter falls back to the
+in-process store rather than failing requests.
+"""
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from config import RATE_LIMIT_REDIS_URL, RATE_LIMIT_STORE_SIZE, RATE_LIMITS
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+# Per-IP limits are sized for a school behind one NAT address, where a whole
+# class logs in at once; the per-email bucket is what stops guessing against
+# one account, and the IP bucket only caps spraying many emails from one host.
+DEFAULT_LIMITS = {
+    "/auth/login": {"ip": "600/minute:200", "email": "10/minute"},
+    "/auth/register": {"ip": "120/minute:60"},
+    "/auth/refresh": {"ip": "600/minute:200"},
+}
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+
+RATE_LIMITED = counter("auth_rate_limited_total", "Requests rejected by rate limiting", ["route", "kind"])
+
+
+class Limit:
+    def __init__(self, rate, burst):
+        self.rate = rate      # tokens per second
+        self.burst = burst
+
+    @classmethod
+    def parse(cls, spec):
+        """"30/minute" or "30/minute:60" -> Limit(0.5, 60)"""
+        spec, _, burst = spec.partition(":")
+        count, _, period = spec.partition("/")
+        if period not in _PERIODS:
+            raise ValueError(f"Invalid rate limit '{spec}': period must be one of {sorted(_PERIODS)}")
+        count = int(count)
+        return cls(count / _PERIODS[period], int(burst) if burst else count)
+
+
+def parse_limits(text):
+    """RATE_LIMITS JSON (or the defaults) -> {route: {kind: Limit}}"""
+    raw = json.loads(text) if text else DEFAULT_LIMITS
+    return {route: {kind: Limit.parse(spec) for kind, spec in kinds.items()} for route, kinds in raw.items()}
+
+
+class MemoryStore:
+    """Buckets in a bounded LRU; the least recently used key is evicted first.
+
+    An evicted key starts again with a full bucket, so size the store above
+    the number of distinct clients expected within one refill period.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = collections.OrderedDict()   # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, key, limit, cost=1):
+        """Spend `cost` tokens; return (allowed, retry_after_seconds)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+            if tokens >= cost:
+                tokens -= cost
+                allowed, retry_after = True, 0.0
+            else:
+                allowed, retry_after = False, (cost - tokens) / limit.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RedisStore:
+    """Buckets shared through Redis, updated atomically by a Lua script."""
+
+    # Uses the server clock, so replicas with skewed clocks agree
+    _SCRIPT = """
+        local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or burst
+        local ts = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+        local allowed, retry = 0, 0
+        if tokens >= cost then
+            tokens = tokens - cost
+            allowed = 1
+        else
+            retry = (cost - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+        redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+        return {allowed, tostring(retry)}
+    """
+
+    def __init__(self, url, prefix="ratelimit:"):
+        import redis
+
+        self._client = redis.Redis.from_url(url, socket_timeout=0.1, socket_connect_timeout=0.1)
+        self._script = self._client.register_script(self._SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key, limit, cost=1):
+        allowed, retry_after = self._script(keys=[self.prefix + key], args=[limit.rate, limit.burst, cost])
+        return bool(allowed), float(retry_after)
+
+
+class RateLimiter:
+    def __init__(self, limits, store, fallback=None):
+        self.limits = limits
+        self.store = store
+        # Used when the shared store errors, so an outage doesn't turn into 500s
+        self.fallback = fallback
+
+    @staticmethod
+    def _key(route, kind, value):
+        # Hashed so emails and IPs aren't stored in the clear (e.g. in Redis)
+        digest = hashlib.blake2b(str(value).strip().lower().encode(), digest_size=12).hexdigest()
+        return f"{route}:{kind}:{digest}"
+
+    def _take(self, key, limit):
+        try:
+            return self.store.take(key, limit)
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            logger.warning("Rate limit store failed, using in-process buckets: %s", e)
+            return self.fallback.take(key, limit)
+
+    def check(self, route, **values):
+        """Spend a token from each of the route's buckets, e.g. check(route, ip=..., email=...).
+
+        Returns None when the request may proceed, otherwise the seconds
+        until it would be allowed. Buckets are checked in configured order
+        and stop at the first rejection, so a throttled IP doesn't also drain
+        the email's bucket.
+        """
+        for kind, limit in self.limits.get(route, {}).items():
+            value = values.get(kind)
+            if not value:
+                continue
+            allowed, retry_after = self._take(self._key(route, kind, value), limit)
+            if not allowed:
+                RATE_LIMITED.inc(route=route, kind=kind)
+                return retry_after
+        return None
+
+
+def client_ip(forwarded_for, remote_addr, trusted_proxies):
+    """The client address as seen by the outermost trusted proxy.
+
+    Each proxy appends the address it received the request from to
+    X-Forwarded-For, so with N trusted proxies the Nth entry from the right is
+    the client; anything further left is client-supplied and can be forged.
+    """
+    if trusted_proxies <= 0 or not forwarded_for:
+        return remote_addr
+    hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+    if len(hops) < trusted_proxies:
+        return remote_addr
+    return hops[-trusted_proxies]
+
+
+def create_limiter():
+    limits = parse_limits(RATE_LIMITS)
+    memory = MemoryStore(RATE_LIMIT_STORE_SIZE)
+    if RATE_LIMIT_REDIS_URL:
+        return RateLimiter(limits, RedisStore(RATE_LIMIT_REDIS_URL), fallback=memory)
+    return RateLimiter(limits, memory)
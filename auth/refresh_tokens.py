@@ -0,0 +1,82 @@
+"""Long-lived, rotating refresh tokens.
+
+A refresh token is an opaque random string; only its SHA-256 digest is stored
+(`refresh_tokens.token_hash`, uniquely indexed). Each use consumes the token
+and issues a successor in the same family, so renewing an access token is one
+indexed statement instead of a credential check. Presenting an already-used
+token means it was copied, and revokes its whole family.
+
+The in-memory RevocationIndex remembers revoked hashes until they expire so
+replays are rejected without a database round trip. It is only a fast path:
+the database stays authoritative, and revocations made by other workers are
+still caught by the rotate statement.
+"""
+import hashlib
+import heapq
+import secrets
+import threading
+import time
+
+
+def new_refresh_token():
+    """Return (token, token_hash) for a fresh refresh token."""
+    token = secrets.token_urlsafe(32)
+    return token, hash_refresh_token(token)
+
+
+def hash_refresh_token(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+def new_family_id():
+    return secrets.token_hex(16)
+
+
+class RevocationIndex:
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._revoked = {}          # token_hash -> (expires_at, family_id)
+        self._by_expiry = []        # heap of (expires_at, token_hash)
+        self._families = {}         # family_id -> latest expiry of its revoked tokens
+
+    def _prune(self, now):
+        # Caller must hold self._lock. Drop expired entries, then the
+        # soonest-expiring ones if still over capacity.
+        while self._by_expiry and (self._by_expiry[0][0] <= now or len(self._revoked) > self.maxsize):
+            expires_at, token_hash = heapq.heappop(self._by_expiry)
+            entry = self._revoked.get(token_hash)
+            if entry is not None and entry[0] == expires_at:
+                del self._revoked[token_hash]
+        if len(self._families) > self.maxsize:
+            self._families = {f: exp for f, exp in self._families.items() if exp > now}
+
+    def add(self, token_hash, expires_at, family_id=None):
+        """Record a revoked token; `expires_at` is a Unix timestamp."""
+        now = time.time()
+        if expires_at <= now:
+            return
+        with self._lock:
+            self._revoked[token_hash] = (expires_at, family_id)
+            heapq.heappush(self._by_expiry, (expires_at, token_hash))
+            self._prune(now)
+
+    def revoke_family(self, family_id, expires_at):
+        with self._lock:
+            self._families[family_id] = max(expires_at, self._families.get(family_id, 0))
+
+    def lookup(self, token_hash):
+        """Return (revoked, family_id) for a presented token hash."""
+        now = time.time()
+        with self._lock:
+            entry = self._revoked.get(token_hash)
+            if entry is None or entry[0] <= now:
+                return False, None
+            return True, entry[1]
+
+    def family_revoked(self, family_id):
+        with self._lock:
+            return self._families.get(family_id, 0) > time.time()
+
+    def __len__(self):
+        return len(self._revoked)
@@ -0,0 +1,6 @@
+# The service's modules import each other by plain name (python app.py, gunicorn app:app),
+# so the tests put auth/ on the path the same way.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,174 @@
+import contextlib
+import csv
+import io
+
+import psycopg2
+import pytest
+
+import bulk_users
+from bulk_users import import_users, iter_rows, validate_row
+from passwords import hash_password, is_password_hash
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if "INSERT INTO users" in sql:
+            batch = {}
+            for line_no, email, password, name in self.conn.staged:
+                batch.setdefault(email, (password, name))
+            written = [email for email in batch if email not in self.conn.users]
+            for email in written:
+                self.conn.users[email] = batch[email]
+            self.result = [(email,) for email in written]
+
+    def copy_expert(self, sql, buffer):
+        if self.conn.fail_copy:
+            raise psycopg2.DataError("bad batch")
+        self.conn.staged = list(csv.reader(buffer))
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self, users=None, fail_copy=False):
+        self.users = dict(users or {})
+        self.staged = []
+        self.fail_copy = fail_copy
+        self.checked_out = False
+        self.checkouts = 0
+
+    @contextlib.contextmanager
+    def connection(self):
+        assert not self.checked_out
+        self.checked_out = True
+        self.checkouts += 1
+        try:
+            yield self
+        finally:
+            self.checked_out = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.staged = []
+
+    def rollback(self):
+        self.staged = []
+
+
+@pytest.fixture(autouse=True)
+def fast_hashing(monkeypatch):
+    # Real scrypt is slow and irrelevant here; any string stands in for a hash, computed inline
+    monkeypatch.setattr(bulk_users.hashing_pool, "workers", 0)
+    monkeypatch.setattr(bulk_users, "hash_password", lambda password: f"hashed:{password}")
+
+
+def rows(*dicts):
+    return list(enumerate(dicts, start=1))
+
+
+@pytest.mark.parametrize("row, message", [
+    (None, "Malformed row"),
+    ({"email": "not-an-email", "name": "A", "password": "pw"}, "Invalid email"),
+    ({"email": 123, "name": "A", "password": "pw"}, "Invalid email"),
+    ({"email": ["a@example.com"], "name": "A", "password": "pw"}, "Invalid email"),
+    ({"email": "a@example.com", "name": "  ", "password": "pw"}, "Name is required"),
+    ({"email": "a@example.com", "name": ["x"], "password": "pw"}, "Name is required"),
+    ({"email": "a@example.com", "name": 7, "password": "pw"}, "Name is required"),
+    ({"email": "a@example.com", "name": "A"}, "password or password_hash is required"),
+    ({"email": "a@example.com", "name": "A", "password": 5}, "password or password_hash is required"),
+    ({"email": "a@example.com", "name": "A", "password_hash": "plain"}, "Unrecognized password_hash format"),
+])
+def test_validate_row_rejects(row, message):
+    with pytest.raises(ValueError, match=message):
+        validate_row(row)
+
+
+def test_validate_row_strips_and_accepts_existing_hashes():
+    assert validate_row({"email": " a@example.com ", "name": " A ", "password": "pw"}) == (
+        "a@example.com", "pw", "A", False)
+    existing = hash_password("pw")
+    assert is_password_hash(existing)
+    assert validate_row({"email": "a@example.com", "name": "A", "password_hash": existing}) == (
+        "a@example.com", existing, "A", True)
+
+
+def test_iter_rows_marks_malformed_ndjson_lines():
+    lines = ['{"email": "a@example.com"}\n', "not json\n", "\n", "[1, 2]\n"]
+    assert list(iter_rows(lines, "ndjson")) == [(1, {"email": "a@example.com"}), (2, None), (4, None)]
+
+
+def test_import_rejects_bad_rows_and_keeps_going():
+    conn = FakeConnection(users={"taken@example.com": ("x", "T")})
+    results = list(import_users(conn.connection, rows(
+        {"email": "a@example.com", "name": "A", "password": "pw"},
+        {"email": 123, "name": "B", "password": "pw"},
+        {"email": "c@example.com", "name": ["C"], "password": "pw"},
+        {"email": "taken@example.com", "name": "T", "password": "pw"},
+        {"email": "a@example.com", "name": "A again", "password": "pw"},
+        {"email": "d@example.com", "name": "D", "password": "pw"},
+    ), batch_size=4))
+    errors, summary = results[:-1], results[-1]["summary"]
+    assert errors == [
+        {"line": 2, "error": "Invalid email"},
+        {"line": 3, "error": "Name is required"},
+        {"line": 4, "error": "User with this email already exists"},
+        {"line": 5, "error": "User with this email already exists"},
+    ]
+    assert summary == {"rows": 6, "imported": 2, "rejected": 4}
+    assert conn.users["a@example.com"] == ("hashed:pw", "A")
+
+
+def test_import_hashes_before_checking_out_a_connection(monkeypatch):
+    conn = FakeConnection()
+
+    def hash_password(password):
+        assert not conn.checked_out, "hashing while holding a connection"
+        return f"hashed:{password}"
+
+    monkeypatch.setattr(bulk_users, "hash_password", hash_password)
+    data = rows(*({"email": f"u{i}@example.com", "name": "U", "password": "pw"} for i in range(5)))
+    results = list(import_users(conn.connection, data, batch_size=2))
+    assert results[-1]["summary"]["imported"] == 5
+    assert conn.checkouts == 3
+
+
+def test_failed_batch_rejects_its_rows():
+    conn = FakeConnection(fail_copy=True)
+    results = list(import_users(conn.connection, rows(
+        {"email": "a@example.com", "name": "A", "password": "pw"},
+        {"email": "b@example.com", "name": "B", "password": "pw"},
+    )))
+    assert [error["line"] for error in results[:-1]] == [1, 2]
+    assert all(error["error"].startswith("Batch failed: ") for error in results[:-1])
+    assert results[-1]["summary"] == {"rows": 2, "imported": 0, "rejected": 2}
+
+
+def test_reported_errors_are_capped():
+    conn = FakeConnection()
+    data = rows(*({"email": "bad", "name": "A", "password": "pw"} for _ in range(5)))
+    results = list(import_users(conn.connection, data, max_errors=2))
+    assert len(results) == 3
+    assert results[-1]["summary"]["rejected"] == 5
+
+
+def test_unknown_on_conflict_is_refused():
+    with pytest.raises(ValueError):
+        list(import_users(FakeConnection().connection, [], on_conflict="replace"))
+
+
+def test_iter_rows_numbers_csv_rows_by_file_line():
+    source = io.StringIO("email,name,password_hash\na@example.com,A,x\n")
+    assert list(iter_rows(source, "csv")) == [(2, {"email": "a@example.com", "name": "A", "password_hash": "x"})]
@@ -0,0 +1,193 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+import email_filter
+from email_filter import BloomFilter, EmailFilter, FilterSync
+
+T0 = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class FakeUsers:
+    """A users table behind the psycopg2 calls EmailFilter makes; `queries` counts catch-up pages."""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)   # (email, created_at, id)
+        self.queries = 0
+        self.lock = threading.Lock()
+
+    def register(self, email, seconds=0):
+        with self.lock:
+            self.rows.append((email, T0 + datetime.timedelta(seconds=seconds), len(self.rows) + 1))
+
+    def connect(self, dsn=None):
+        return FakeConnection(self)
+
+
+class FakeCursor:
+    def __init__(self, users):
+        self.users = users
+        self.itersize = None
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        with self.users.lock:
+            rows = sorted(self.users.rows, key=lambda row: (row[1], row[2]))
+        if "reltuples" in sql:
+            self.result = [(len(rows),)]
+        elif params is None:
+            self.result = [(email, created_at) for email, created_at, _ in rows]
+        else:
+            created_at, user_id, limit = params
+            self.users.queries += 1
+            self.result = [row for row in rows if (row[1], row[2]) > (created_at, user_id)][:limit]
+
+    def fetchone(self):
+        return self.result[0]
+
+    def fetchall(self):
+        return list(self.result)
+
+    def __iter__(self):
+        return iter(self.result)
+
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self, users):
+        self.users = users
+
+    def cursor(self, name=None):
+        return FakeCursor(self.users)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def loaded_filter(users, max_staleness=2.0):
+    email_filter = EmailFilter(max_staleness=max_staleness)
+    email_filter.load(users.connect())
+    return email_filter
+
+
+@pytest.fixture
+def syncing(monkeypatch):
+    """Start a FilterSync over a FakeUsers table; returns (filter, users)."""
+    users = FakeUsers()
+    users.register("alice@example.com")
+    monkeypatch.setattr(email_filter.psycopg2, "connect", users.connect)
+    email_filter_ = EmailFilter(max_staleness=2.0)
+    # A long interval: catch-ups only happen when a login asks for one
+    sync = FilterSync(email_filter_, "postgresql://test", interval=60)
+    sync.start()
+    deadline = time.monotonic() + 5
+    while not email_filter_.ready and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield email_filter_, users
+    sync.stop()
+    sync.join(5)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    emails = [f"user{i}@example.com" for i in range(1000)]
+    for email in emails:
+        bloom.add(email)
+    assert all(email in bloom for email in emails)
+    assert bloom.count <= len(emails)
+
+
+def test_unready_filter_never_rejects():
+    assert not EmailFilter().definitely_absent("nobody@example.com")
+
+
+def test_registered_and_locally_added_emails_are_present():
+    email_filter_ = loaded_filter(FakeUsers([("alice@example.com", T0, 1)]))
+    email_filter_.add("bob@example.com")
+    assert not email_filter_.maybe_absent("alice@example.com")
+    assert not email_filter_.maybe_absent("bob@example.com")
+    assert email_filter_.maybe_absent("nobody@example.com")
+
+
+def test_non_string_email_is_not_filtered():
+    email_filter_ = loaded_filter(FakeUsers())
+    assert not email_filter_.maybe_absent(None)
+    assert not email_filter_.maybe_absent(["nobody@example.com"])
+
+
+def test_stale_filter_falls_back_to_the_database():
+    email_filter_ = loaded_filter(FakeUsers(), max_staleness=2.0)
+    assert email_filter_.maybe_absent("nobody@example.com")
+    email_filter_._synced_at -= 3
+    assert not email_filter_.maybe_absent("nobody@example.com")
+
+
+def test_catch_up_pages_through_new_registrations():
+    users = FakeUsers()
+    email_filter_ = loaded_filter(users)
+    for i in range(7):
+        users.register(f"new{i}@example.com", seconds=i // 2)
+    email_filter_.catch_up(users.connect(), page_size=3)
+    assert all(not email_filter_.maybe_absent(f"new{i}@example.com") for i in range(7))
+    # 7 rows in pages of 3: full, full, then a short page ends the catch-up
+    assert users.queries == 3
+
+
+def test_catch_up_rereads_the_overlap_for_late_commits():
+    users = FakeUsers()
+    users.register("first@example.com", seconds=10)
+    email_filter_ = loaded_filter(users)
+    # Committed after the load, but its transaction started earlier
+    users.register("late@example.com", seconds=9)
+    email_filter_.catch_up(users.connect())
+    assert not email_filter_.maybe_absent("late@example.com")
+
+
+def test_miss_for_a_registration_on_another_worker_is_not_trusted(syncing):
+    email_filter_, users = syncing
+    users.register("carol@example.com", seconds=1)
+    assert not email_filter_.definitely_absent("carol@example.com")
+    assert email_filter_.definitely_absent("nobody@example.com")
+
+
+def test_concurrent_misses_share_catch_ups(syncing):
+    email_filter_, users = syncing
+    before = users.queries
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(email_filter_.definitely_absent(f"x{i}@example.com")))
+               for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [True] * 20
+    assert users.queries - before < 20
+
+
+def test_miss_without_a_sync_falls_back_after_max_staleness():
+    email_filter_ = loaded_filter(FakeUsers(), max_staleness=0.2)
+    started = time.monotonic()
+    # No FilterSync running, so no catch-up can confirm the miss
+    assert not email_filter_.definitely_absent("nobody@example.com")
+    assert time.monotonic() - started < 1
+
+
+def test_padding_subtracts_time_spent_confirming():
+    email_filter_ = EmailFilter()
+    assert email_filter_.padding() == 0.0
+    email_filter_.observe_lookup(0.05)
+    assert email_filter_.padding() == pytest.approx(0.05)
+    assert email_filter_.padding(0.02) == pytest.approx(0.03)
+    assert email_filter_.padding(0.1) == 0.0
@@ -0,0 +1,121 @@
+import pytest
+
+import rate_limit
+from rate_limit import DEFAULT_LIMITS, Limit, MemoryStore, RateLimiter, client_ip, parse_limits
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_limit_parse():
+    limit = Limit.parse("30/minute")
+    assert (limit.rate, limit.burst) == (0.5, 30)
+    limit = Limit.parse("10/second:25")
+    assert (limit.rate, limit.burst) == (10, 25)
+    with pytest.raises(ValueError):
+        Limit.parse("5/fortnight")
+
+
+def test_parse_limits_defaults_and_override():
+    assert set(parse_limits("")) == set(DEFAULT_LIMITS)
+    limits = parse_limits('{"/auth/login": {"email": "5/minute"}}')
+    assert list(limits) == ["/auth/login"]
+    assert limits["/auth/login"]["email"].burst == 5
+
+
+def test_default_login_ip_limit_admits_a_class_behind_one_address():
+    burst = parse_limits("")["/auth/login"]["ip"].burst
+    assert burst >= 100
+
+
+def test_bucket_spends_burst_then_refills(clock):
+    store = MemoryStore()
+    limit = Limit(rate=1.0, burst=3)
+    assert [store.take("k", limit)[0] for _ in range(3)] == [True] * 3
+    allowed, retry_after = store.take("k", limit)
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+    clock.now += 1.0
+    assert store.take("k", limit)[0]
+    assert not store.take("k", limit)[0]
+
+
+def test_bucket_never_exceeds_burst(clock):
+    store = MemoryStore()
+    limit = Limit(rate=1.0, burst=2)
+    store.take("k", limit)
+    clock.now += 3600
+    assert [store.take("k", limit)[0] for _ in range(3)] == [True, True, False]
+
+
+def test_store_evicts_least_recently_used(clock):
+    store = MemoryStore(maxsize=2)
+    limit = Limit(rate=0.001, burst=1)
+    store.take("a", limit)
+    store.take("b", limit)
+    store.take("c", limit)
+    assert len(store) == 2
+    # "a" was evicted, so it starts again with a full bucket
+    assert store.take("a", limit)[0]
+    assert not store.take("c", limit)[0]
+
+
+def test_limiter_stops_at_first_rejection(clock):
+    limits = {"/auth/login": {"ip": Limit(rate=0.001, burst=1), "email": Limit(rate=0.001, burst=5)}}
+    store = MemoryStore()
+    limiter = RateLimiter(limits, store)
+    assert limiter.check("/auth/login", ip="1.2.3.4", email="a@example.com") is None
+    assert limiter.check("/auth/login", ip="1.2.3.4", email="a@example.com") > 0
+    # The throttled IP didn't spend the email's second token
+    email_key = RateLimiter._key("/auth/login", "email", "a@example.com")
+    assert store._buckets[email_key][0] == pytest.approx(4, abs=0.01)
+
+
+def test_limiter_keys_emails_case_insensitively(clock):
+    limiter = RateLimiter({"/auth/login": {"email": Limit(rate=0.001, burst=1)}}, MemoryStore())
+    assert limiter.check("/auth/login", email="A@Example.com") is None
+    assert limiter.check("/auth/login", email=" a@example.com") is not None
+    # Routes without limits and missing values are never throttled
+    assert limiter.check("/auth/other", email="a@example.com") is None
+    assert limiter.check("/auth/login", email=None) is None
+
+
+def test_limiter_falls_back_when_the_shared_store_fails(clock):
+    class Broken:
+        def take(self, key, limit, cost=1):
+            raise ConnectionError("redis down")
+
+    limits = {"/auth/login": {"ip": Limit(rate=0.001, burst=1)}}
+    limiter = RateLimiter(limits, Broken(), fallback=MemoryStore())
+    assert limiter.check("/auth/login", ip="1.2.3.4") is None
+    assert limiter.check("/auth/login", ip="1.2.3.4") is not None
+    with pytest.raises(ConnectionError):
+        RateLimiter(limits, Broken()).check("/auth/login", ip="1.2.3.4")
+
+
+@pytest.mark.parametrize("forwarded_for, trusted, expected", [
+    (None, 1, "10.0.0.1"),
+    ("", 1, "10.0.0.1"),
+    ("203.0.113.5", 1, "203.0.113.5"),
+    # Entries left of the trusted hops are client-supplied and ignored
+    ("6.6.6.6, 203.0.113.5", 1, "203.0.113.5"),
+    ("6.6.6.6, 203.0.113.5, 10.0.0.9", 2, "203.0.113.5"),
+    (" 203.0.113.5 ,  10.0.0.9 ", 2, "203.0.113.5"),
+    # Fewer hops than trusted proxies: the header can't be trusted
+    ("203.0.113.5", 2, "10.0.0.1"),
+    ("203.0.113.5", 0, "10.0.0.1"),
+])
+def test_client_ip(forwarded_for, trusted, expected):
+    assert client_ip(forwarded_for, "10.0.0.1", trusted) == expected
@@ -0,0 +1,164 @@
+"""JWT issuing and verification, shared by app.py and async_app.py.
+
+Tokens are signed with the active key of the asymmetric key ring when one is
+configured (see keys.py), otherwise with JWT_SECRET using HS256.
+
+Verified claims are kept in a bounded LRU cache keyed by a digest of the
+token, so repeat verifications of the same token (every REST call and socket
+reconnect carries it) skip the HMAC check and JSON parsing. Entries expire at
+the token's own `exp`, so a cached token is never accepted past its lifetime.
+
+Signing and uncached verification are timed into `auth_jwt_seconds`.
+"""
+import collections
+import datetime
+import hashlib
+import threading
+import time
+
+import jwt
+
+from config import (
+    JWT_ACCEPT_HS256,
+    JWT_ACTIVE_KID,
+    JWT_EXP_DELTA_SECONDS,
+    JWT_KEYS_DIR,
+    JWT_SECRET,
+    JWT_SIGNING_KEYS,
+    TOKEN_CACHE_SIZE,
+)
+from keys import KeyRing
+from metrics import add_collector, header_lines, histogram
+
+# Algorithm used with JWT_SECRET when no key ring is configured
+JWT_ALGORITHM = "HS256"
+
+JWT_SECONDS = histogram("auth_jwt_seconds", "Time spent signing and verifying JWTs", ["op"])
+
+
+class TokenCache:
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()   # digest -> (exp, claims)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            exp, claims = entry
+            if exp <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def put(self, token, claims):
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)) or self.maxsize <= 0:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (exp, claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "max": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+
+def _token_cache_collector():
+    stats = token_cache.stats()
+    lines = header_lines("auth_token_cache_lookups_total", "counter", "Verified-token cache lookups")
+    lines.append(f'auth_token_cache_lookups_total{{result="hit"}} {stats["hits"]}')
+    lines.append(f'auth_token_cache_lookups_total{{result="miss"}} {stats["misses"]}')
+    lines += header_lines("auth_token_cache_size", "gauge", "Entries in the verified-token cache")
+    lines.append(f"auth_token_cache_size {stats['size']}")
+    return lines
+
+
+add_collector(_token_cache_collector)
+
+key_ring = None
+if JWT_KEYS_DIR or JWT_SIGNING_KEYS:
+    key_ring = KeyRing(JWT_KEYS_DIR, JWT_SIGNING_KEYS, JWT_ACTIVE_KID, on_change=token_cache.clear)
+    if not key_ring.enabled:
+        raise RuntimeError("JWT_KEYS_DIR / JWT_SIGNING_KEYS is set but no signing keys were found")
+
+
+def jwks():
+    """The public JWKS document; empty when tokens are signed with JWT_SECRET."""
+    return key_ring.jwks() if key_ring is not None else {"keys": []}
+
+
+def issue_token(email, user_id):
+    """Sign an access token and prime the cache so its first verify is a hit."""
+    exp = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=JWT_EXP_DELTA_SECONDS)
+    claims = {"user": email, "user_id": str(user_id), "exp": int(exp.timestamp())}
+    with JWT_SECONDS.time(op="encode"):
+        if key_ring is not None:
+            key = key_ring.signing_key()
+            token = jwt.encode(claims, key.private_key, algorithm=key.algorithm, headers={"kid": key.kid})
+        else:
+            token = jwt.encode(claims, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    token_cache.put(token, claims)
+    return token
+
+
+def _decode_uncached(token):
+    if key_ring is not None:
+        header = jwt.get_unverified_header(token)
+        key = key_ring.get(header.get("kid"))
+        if key is not None:
+            # Pin the algorithm to the key's own, never the one the token claims
+            return jwt.decode(token, key.public_key, algorithms=[key.algorithm])
+        if not (JWT_ACCEPT_HS256 and header.get("alg") == JWT_ALGORITHM):
+            raise jwt.InvalidTokenError("Unknown signing key")
+    return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+
+
+def decode_token(token):
+    """Return the token's claims, raising jwt.InvalidTokenError subclasses on failure.
+
+    The returned dict is shared with the cache and must not be modified.
+    """
+    if not isinstance(token, str):
+        raise jwt.InvalidTokenError("Token must be a string")
+    claims = token_cache.get(token)
+    if claims is None:
+        with JWT_SECONDS.time(op="decode"):
+            claims = _decode_uncached(token)
+        token_cache.put(token, claims)
+    return claims
+
+
+def verify_token(token):
+    """Verify one token and return the /verify response body."""
+    try:
+        claims = decode_token(token)
+        return {"valid": True, "user": claims.get("user")}
+    except jwt.ExpiredSignatureError:
+        return {"valid": False, "error": "Token expired"}
+    except jwt.InvalidTokenError:
+        return {"valid": False, "error": "Invalid token"}
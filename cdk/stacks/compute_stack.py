@@ -202,6 +202,7 @@ class ComputeStack(Stack):
                 stream_prefix="auth", log_group=auth_log_group
             ),
             environment={
+                "PORT": "4000",
                 "DB_NAME": "crdtdemo",
             },
             secrets={
@@ -211,8 +212,10 @@ class ComputeStack(Stack):
                 "DB_USER": ecs.Secret.from_secrets_manager(data.db_credentials, field="username"),
                 "DB_PASSWORD": ecs.Secret.from_secrets_manager(data.db_credentials, field="password"),
             },
+            # Liveness only: /auth/health reports 503 while the pool is
+            # saturated, which should drain traffic, not restart the task
             health_check=ecs.HealthCheck(
-                command=["CMD-SHELL", "wget -qO- http://localhost:4000/auth/health || exit 1"],
+                command=["CMD-SHELL", "wget -qO- http://localhost:4000/auth/live || exit 1"],
                 interval=Duration.seconds(30),
                 timeout=Duration.seconds(5),
                 retries=3,
@@ -240,10 +243,13 @@ class ComputeStack(Stack):
             port=4000,
             protocol=elbv2.ApplicationProtocol.HTTP,
             targets=[auth_service],
+            # Readiness: the service answers 503 while its connection pool is exhausted
             health_check=elbv2.HealthCheck(
                 path="/auth/health",
-                interval=Duration.seconds(30),
+                interval=Duration.seconds(10),
                 timeout=Duration.seconds(5),
+                healthy_threshold_count=2,
+                unhealthy_threshold_count=2,
                 healthy_http_codes="200",
             ),
             target_group_name="crdt-auth-tg",
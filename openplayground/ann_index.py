@@ -0,0 +1,288 @@
+"""
+Approximate nearest-neighbor search with an inverted-file (IVF) index.
+
+k-means splits the embedding space into `nlist` cells, and each vector is
+stored in the list of its nearest centroid. A query scores only the vectors in
+the `nprobe` cells whose centroids are closest to it. This trades a little
+recall for scanning about nprobe/nlist of the corpus:
+
+    index = IVFIndex.build(EMBEDDINGS)            # ids default to row numbers
+    ids, scores = index.search(query_embedding, k=5, nprobe=8)
+    index.evaluate(sample_queries, k=10)          # recall@k and latency per nprobe
+
+Vectors are stored normalized and scored by inner product, i.e. cosine
+similarity. Corpora under EXACT_SEARCH_MAX vectors get a single list, so
+search is exact. Lists grow in place on `add`, `remove` is O(1), and
+`save`/`load` keep the index in .npy files that are memory-mapped on load.
+"""
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from similarity import as_matrix, top_k
+
+# Below this many vectors a full scan is cheap enough that the index doesn't partition
+EXACT_SEARCH_MAX = 10000
+# Rows assigned to centroids per matrix product, bounding the (rows, nlist) score block
+ASSIGN_CHUNK = 65536
+# Training vectors per centroid; k-means on more than this barely moves the centroids
+TRAIN_PER_LIST = 64
+
+
+def _normalize(vectors):
+    vectors = as_matrix(vectors, np.float32).copy()
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms != 0)
+    return vectors
+
+
+def default_nlist(count):
+    return 1 if count <= EXACT_SEARCH_MAX else int(4 * math.sqrt(count))
+
+
+def kmeans(vectors, nlist, iterations=20, seed=0):
+    """Spherical k-means on normalized vectors; returns (nlist, D) unit centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _assign(vectors, centroids)
+        order = np.argsort(assignment, kind="stable")
+        cells, starts = np.unique(assignment[order], return_index=True)
+        sums = np.zeros_like(centroids)
+        sums[cells] = np.add.reduceat(vectors[order], starts)
+        counts = np.bincount(assignment, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Restart empty cells on random vectors rather than losing them
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def _assign(vectors, centroids):
+    assignment = np.empty(len(vectors), dtype=np.intp)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        block = vectors[start:start + ASSIGN_CHUNK]
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+class _InvertedList:
+    """Ids and vectors of one cell, in arrays that double when full."""
+
+    def __init__(self, dim, ids=None, vectors=None):
+        if ids is None:
+            ids, vectors = np.empty(0, dtype=np.int64), np.empty((0, dim), dtype=np.float32)
+        self.size = len(ids)
+        # May be read-only views into a memory-mapped file until first modified
+        self._ids = ids
+        self._vectors = vectors
+
+    @property
+    def ids(self):
+        return self._ids[:self.size]
+
+    @property
+    def vectors(self):
+        return self._vectors[:self.size]
+
+    def _reserve(self, capacity):
+        if capacity <= len(self._ids) and self._ids.flags.writeable and self._vectors.flags.writeable:
+            return
+        capacity = max(capacity, 2 * len(self._ids), 16)
+        ids = np.empty(capacity, dtype=np.int64)
+        vectors = np.empty((capacity, self._vectors.shape[1]), dtype=np.float32)
+        ids[:self.size] = self.ids
+        vectors[:self.size] = self.vectors
+        self._ids, self._vectors = ids, vectors
+
+    def extend(self, ids, vectors):
+        """Append rows; returns the slot of the first one."""
+        first = self.size
+        self._reserve(self.size + len(ids))
+        self._ids[first:first + len(ids)] = ids
+        self._vectors[first:first + len(ids)] = vectors
+        self.size += len(ids)
+        return first
+
+    def pop(self, slot):
+        """Remove a slot by moving the last row into it; returns the moved id, if any."""
+        self._reserve(self.size)
+        last = self.size - 1
+        moved = None
+        if slot != last:
+            self._ids[slot] = self._ids[last]
+            self._vectors[slot] = self._vectors[last]
+            moved = int(self._ids[slot])
+        self.size = last
+        return moved
+
+
+class IVFIndex:
+    """
+    Parameters:
+    centroids (np.ndarray): (nlist, D) unit vectors partitioning the space.
+    nprobe (int): Default number of cells a search scans.
+    """
+
+    def __init__(self, centroids, nprobe=8):
+        self.centroids = _normalize(centroids)
+        self.nprobe = nprobe
+        self._lists = [_InvertedList(self.dim) for _ in range(self.nlist)]
+        self._where = {}   # id -> (list number, slot)
+
+    @classmethod
+    def build(cls, vectors, ids=None, nlist=None, nprobe=8, seed=0):
+        """Train centroids on (a sample of) vectors and add them all."""
+        vectors = _normalize(vectors)
+        nlist = min(nlist or default_nlist(len(vectors)), len(vectors))
+        if nlist <= 1:
+            centroids = np.ones((1, vectors.shape[1]), dtype=np.float32)
+        else:
+            rng = np.random.default_rng(seed)
+            sample = min(len(vectors), nlist * TRAIN_PER_LIST)
+            training = vectors[np.sort(rng.choice(len(vectors), sample, replace=False))]
+            centroids = kmeans(training, nlist, seed=seed)
+        index = cls(centroids, nprobe)
+        index._add(np.arange(len(vectors)) if ids is None else ids, vectors)
+        return index
+
+    @property
+    def nlist(self):
+        return self.centroids.shape[0]
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, id_):
+        return int(id_) in self._where
+
+    def add(self, ids, vectors):
+        """Insert vectors under integer ids; an id that's already present is replaced."""
+        self._add(ids, _normalize(vectors))
+
+    def _add(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if len(ids) != len(vectors):
+            raise ValueError(f"Got {len(ids)} ids but {len(vectors)} vectors")
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError("ids must be unique")
+        self.remove([id_ for id_ in ids.tolist() if id_ in self._where])
+        assignment = _assign(vectors, self.centroids)
+        order = np.argsort(assignment, kind="stable")
+        cells, starts = np.unique(assignment[order], return_index=True)
+        for cell, rows in zip(cells.tolist(), np.split(order, starts[1:])):
+            first = self._lists[cell].extend(ids[rows], vectors[rows])
+            for offset, id_ in enumerate(ids[rows].tolist()):
+                self._where[id_] = (cell, first + offset)
+
+    def remove(self, ids):
+        """Delete ids; unknown ids are ignored. Returns how many were removed."""
+        removed = 0
+        for id_ in ids:
+            location = self._where.pop(int(id_), None)
+            if location is None:
+                continue
+            cell, slot = location
+            moved = self._lists[cell].pop(slot)
+            if moved is not None:
+                self._where[moved] = (cell, slot)
+            removed += 1
+        return removed
+
+    def _probe(self, query, k, cells):
+        lists = [self._lists[cell] for cell in cells if self._lists[cell].size]
+        if not lists:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if len(lists) == 1:
+            ids, vectors = lists[0].ids, lists[0].vectors
+        else:
+            ids = np.concatenate([inverted.ids for inverted in lists])
+            vectors = np.concatenate([inverted.vectors for inverted in lists])
+        scores = vectors @ query
+        best = top_k(scores, k)
+        return ids[best], scores[best]
+
+    def search(self, queries, k, nprobe=None):
+        """
+        The k most similar ids for one query (D,) or a batch (Q, D).
+
+        Parameters:
+        nprobe (int): Cells to scan; defaults to self.nprobe. nprobe >= nlist is an exact search.
+
+        Returns:
+        tuple: (ids, scores) of shape (k,) or (Q, k), best first. Fewer than k
+        are returned for one query if the scanned cells hold fewer vectors.
+        """
+        single = np.ndim(queries) == 1
+        queries = _normalize(queries)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        if nprobe >= self.nlist:
+            cells = np.broadcast_to(np.arange(self.nlist), (len(queries), self.nlist))
+        else:
+            cells = top_k(queries @ self.centroids.T, nprobe)
+        results = [self._probe(query, k, query_cells) for query, query_cells in zip(queries, cells)]
+        if single:
+            return results[0]
+        width = min(len(ids) for ids, _ in results)
+        return (np.stack([ids[:width] for ids, _ in results]),
+                np.stack([scores[:width] for _, scores in results]))
+
+    def evaluate(self, queries, k=10, nprobes=(1, 2, 4, 8, 16, 32, 64)):
+        """
+        Recall@k against exact search, and search latency, for each nprobe.
+
+        Returns:
+        list of dict: {"nprobe", "recall", "ms_per_query"} per setting.
+        """
+        queries = as_matrix(queries, np.float32)
+        exact, _ = self.search(queries, k, nprobe=self.nlist)
+        report = []
+        for nprobe in sorted({min(n, self.nlist) for n in nprobes}):
+            start = time.perf_counter()
+            found, _ = self.search(queries, k, nprobe=nprobe)
+            elapsed = time.perf_counter() - start
+            hits = sum(len(set(a.tolist()) & set(b.tolist())) for a, b in zip(found, exact))
+            report.append({
+                "nprobe": nprobe,
+                "recall": hits / exact.size if exact.size else 1.0,
+                "ms_per_query": elapsed / len(queries) * 1e3,
+            })
+        return report
+
+    def save(self, directory, **meta):
+        """Write the index to a directory; extra keyword arguments are kept in its meta.json."""
+        os.makedirs(directory, exist_ok=True)
+        sizes = np.array([inverted.size for inverted in self._lists], dtype=np.int64)
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "offsets.npy"), np.concatenate([[0], np.cumsum(sizes)]))
+        np.save(os.path.join(directory, "ids.npy"), np.concatenate([inverted.ids for inverted in self._lists]))
+        np.save(os.path.join(directory, "vectors.npy"),
+                np.concatenate([inverted.vectors for inverted in self._lists]))
+        temporary = os.path.join(directory, "meta.json.tmp")
+        with open(temporary, "w") as f:
+            json.dump({"nprobe": self.nprobe, "count": len(self), **meta}, f)
+        os.replace(temporary, os.path.join(directory, "meta.json"))
+
+    @classmethod
+    def load(cls, directory):
+        """Open a saved index, memory-mapping its vectors; returns (index, meta)."""
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        index = cls(np.load(os.path.join(directory, "centroids.npy")), meta["nprobe"])
+        offsets = np.load(os.path.join(directory, "offsets.npy"))
+        ids = np.load(os.path.join(directory, "ids.npy"))
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+        for cell in range(index.nlist):
+            start, end = int(offsets[cell]), int(offsets[cell + 1])
+            index._lists[cell] = _InvertedList(index.dim, ids[start:end], vectors[start:end])
+            for slot, id_ in enumerate(ids[start:end].tolist()):
+                index._where[id_] = (cell, slot)
+        return index, meta
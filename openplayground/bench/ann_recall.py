@@ -0,0 +1,73 @@
+"""
+Recall@k and latency of the IVF index against exact search, per nprobe.
+
+Uses the vectors of an embedding store (--store, e.g. openplayground/embeddings)
+or synthetic clustered vectors, and queries that are perturbed corpus
+vectors so each has close neighbors:
+
+    python bench/ann_recall.py --size 1000000 --dim 384 --nprobes 1,4,16,64
+    python bench/ann_recall.py --store embeddings --nlist 32
+
+Prints one JSON object per nprobe, plus the exact (brute-force) baseline.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import IVFIndex
+from embedding_store import EmbeddingStore
+from similarity import EmbeddingMatrix
+
+
+def synthetic(size, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centers[rng.integers(0, clusters, size)]
+    vectors += 0.5 * rng.standard_normal((size, dim), dtype=np.float32)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", help="Embedding store directory to read vectors from")
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--nlist", type=int, help="Defaults to 4 * sqrt(size)")
+    parser.add_argument("--nprobes", default="1,2,4,8,16,32,64")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.store:
+        vectors = EmbeddingStore(args.store).vectors
+    else:
+        vectors = synthetic(args.size, args.dim, args.clusters)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape, dtype=np.float32)
+
+    start = time.perf_counter()
+    index = IVFIndex.build(vectors, nlist=args.nlist)
+    print(json.dumps({"size": len(vectors), "nlist": index.nlist, "build_seconds": round(time.perf_counter() - start, 2)}))
+
+    matrix = EmbeddingMatrix(vectors)
+    matrix.norms
+    start = time.perf_counter()
+    for query in queries:
+        matrix.top_k(query, args.k)
+    exact_ms = (time.perf_counter() - start) / len(queries) * 1e3
+    print(json.dumps({"nprobe": "exact", "recall": 1.0, "ms_per_query": round(exact_ms, 4)}))
+
+    for row in index.evaluate(queries, args.k, [int(n) for n in args.nprobes.split(",")]):
+        print(json.dumps({key: round(value, 4) if isinstance(value, float) else value for key, value in row.items()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Per-query BM25 latency: re-indexing on every query (the old bm25_retrieve) versus BM25Index.
+
+Also checks the indices unittests.test_bm25_retrieve expects:
+
+    python bench/bm25_latency.py --queries 200
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import bm25s
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bm25_index import BM25Index
+
+CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "news_data_dedup.csv")
+QUERY = "Should I invest in startups?"
+EXPECTED = [863, 848, 716]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    frame = pd.read_csv(CSV)
+    corpus = (frame["title"] + " " + frame["description"]).tolist()
+    result = {"documents": len(corpus)}
+
+    retriever = bm25s.BM25()
+    tokenized = bm25s.tokenize(corpus, show_progress=False)
+    start = time.perf_counter()
+    old_runs = max(1, args.queries // 20)
+    for _ in range(old_runs):
+        retriever.index(tokenized, show_progress=False)
+        retriever.retrieve(bm25s.tokenize(QUERY, show_progress=False), k=3, show_progress=False)
+    result["reindex_per_query_ms"] = (time.perf_counter() - start) / old_runs * 1e3
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        BM25Index.open(directory, corpus)
+        result["build_and_save_ms"] = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        index = BM25Index.open(directory, corpus)
+        result["load_ms"] = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        for _ in range(args.queries):
+            indices, _ = index.retrieve(QUERY, 3)
+        result["index_per_query_ms"] = (time.perf_counter() - start) / args.queries * 1e3
+        start = time.perf_counter()
+        index.retrieve([QUERY] * args.queries, 3)
+        result["index_batched_per_query_ms"] = (time.perf_counter() - start) / args.queries * 1e3
+        result["expected_indices"] = indices.tolist() == EXPECTED
+
+    print(json.dumps({key: round(value, 4) if isinstance(value, float) else value for key, value in result.items()}))
+    if not result["expected_indices"]:
+        sys.exit(f"Expected {EXPECTED} for {QUERY!r}, got {indices.tolist()}")
+
+
+if __name__ == "__main__":
+    main()
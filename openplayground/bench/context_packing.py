@@ -0,0 +1,74 @@
+"""
+RAG context size by top_k: every retrieved article in full versus ContextPacker.
+
+Articles are retrieved with BM25 for a few queries and formatted as
+dostuff.format_document does; reports mean context tokens, tokens saved and
+packing time per top_k:
+
+    python bench/context_packing.py --budget 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bm25_index import BM25Index
+from context_packing import SEPARATOR, ContextPacker
+from ingest import NewsTable
+
+CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "news_data_dedup.csv")
+QUERIES = [
+    "Should I invest in startups?",
+    "Harvey Weinstein conviction overturned",
+    "humanitarian aid pier off Gaza",
+    "What are the recent news about GDP?",
+    "Champions League results",
+]
+
+
+def format_document(document):
+    # As dostuff.format_document, which can't be imported without the embedding model
+    return (f"Title: {document['title']}\nPublished at: {document['published_at']}\n"
+            f"Description: {document['description']}\nURL: {document['url']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=int, default=1500)
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 5, 10, 20, 50])
+    args = parser.parse_args()
+
+    table = NewsTable.from_csv(CSV)
+    packer = ContextPacker(args.budget)
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        index = BM25Index.open(directory, (table.column("title") + " " + table.column("description")).tolist())
+        for top_k in args.top_k:
+            unpacked, packed, saved, elapsed = [], [], [], []
+            for query in QUERIES:
+                indices, _ = index.retrieve(query, top_k)
+                documents = [(i, format_document(table[i])) for i in indices.tolist()]
+                unpacked.append(packer.counter.count(SEPARATOR.join(text for _, text in documents)))
+                start = time.perf_counter()
+                result = packer.pack(documents)
+                elapsed.append(time.perf_counter() - start)
+                packed.append(result.tokens)
+                saved.append(result.tokens_saved)
+            report.append({
+                "top_k": top_k,
+                "unpacked_tokens": statistics.mean(unpacked),
+                "packed_tokens": statistics.mean(packed),
+                "max_packed_tokens": max(packed),
+                "tokens_saved": statistics.mean(saved),
+                "pack_ms": statistics.mean(elapsed) * 1e3,
+            })
+    print(json.dumps({"budget": args.budget, "by_top_k": report, "packer": packer.stats()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
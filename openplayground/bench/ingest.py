@@ -0,0 +1,81 @@
+"""
+News CSV load time and peak memory: the old read_dataframe versus ingest.py.
+
+The corpus is repeated --copies times into a temporary CSV to approximate a
+larger dump (guids are suffixed so they stay unique):
+
+    python bench/ingest.py --copies 100
+
+"old" is pandas read_csv, a dateutil parse per date cell, then
+to_dict(orient="records"). "table" is NewsTable.from_csv and "stream" walks
+iter_records without keeping rows. Peak memory is Python allocations as seen
+by tracemalloc, which includes NumPy and pandas buffers.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+from dateutil import parser as date_parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import NewsTable, iter_records
+
+CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "news_data_dedup.csv")
+
+
+def old_read_dataframe(path):
+    def format_date(date_string):
+        return date_parser.parse(date_string).strftime("%Y-%m-%d")
+
+    df = pd.read_csv(path)
+    df['published_at'] = df['published_at'].apply(format_date)
+    df['updated_at'] = df['updated_at'].apply(format_date)
+    return df.to_dict(orient='records')
+
+
+def stream(path):
+    count = 0
+    for row in iter_records(path):
+        count += len(row["title"]) > 0
+    return count
+
+
+def measure(func, path):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"seconds": round(elapsed, 3), "peak_mib": round(peak / 2**20, 1)}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--copies", type=int, default=100)
+    arg_parser.add_argument("--skip-old", action="store_true", help="The old loader takes minutes past ~100 copies")
+    args = arg_parser.parse_args()
+
+    frame = pd.read_csv(CSV, dtype=str, keep_default_na=False)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "news.csv")
+        for copy in range(args.copies):
+            part = frame.assign(guid=frame["guid"] + f"-{copy}")
+            part.to_csv(path, mode="a", header=copy == 0, index=False)
+        result = {"rows": len(frame) * args.copies, "file_mib": round(os.path.getsize(path) / 2**20, 1)}
+        for name, func in (("old", old_read_dataframe), ("table", NewsTable.from_csv), ("stream", stream)):
+            if name == "old" and args.skip_old:
+                continue
+            result[name] = measure(func, path)
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
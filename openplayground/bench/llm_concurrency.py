@@ -0,0 +1,76 @@
+"""
+Wall time of the RAG widget's four LLM calls: one after another versus LLMClient.gather.
+
+A stub provider answers each request after --latency-ms (jittered by 20%),
+and returns 503 for a --failure-rate share of attempts, which the client
+retries. It also times four identical requests, which are coalesced into one:
+
+    python bench/llm_concurrency.py --latency-ms 800 --failure-rate 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_client
+from llm_client import LLMClient, Provider
+
+
+def stub_transport(latency, failure_rate, counts):
+    async def handler(request):
+        counts["http"] += 1
+        await asyncio.sleep(latency * random.uniform(0.8, 1.2))
+        if random.random() < failure_rate:
+            return httpx.Response(503, text="overloaded")
+        content = json.loads(request.content)["messages"][-1]["content"]
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+    return httpx.MockTransport(handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    # Short backoff so a retried request doesn't dominate the comparison
+    llm_client.BACKOFF_BASE = 0.05
+    counts = {"http": 0}
+    client = LLMClient([Provider("stub", "http://stub/v1",
+                                 transport=stub_transport(args.latency_ms / 1e3, args.failure_rate, counts))])
+    requests = [{"messages": [{"role": "user", "content": f"variant {i}"}], "model": "stub"} for i in range(4)]
+    result = {"latency_ms": args.latency_ms, "failure_rate": args.failure_rate}
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for request in requests:
+            client.chat(**request)
+    result["serial_ms"] = (time.perf_counter() - start) / args.rounds * 1e3
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        client.gather(requests)
+    result["gather_ms"] = (time.perf_counter() - start) / args.rounds * 1e3
+
+    counts["http"] = 0
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        client.gather([requests[0]] * 4)
+    result["identical_gather_ms"] = (time.perf_counter() - start) / args.rounds * 1e3
+    result["identical_http_requests_per_round"] = counts["http"] / args.rounds
+    result["client"] = client.stats()
+    client.close()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Perceived latency of an LLM answer: waiting for the whole reply versus streaming it.
+
+A stub provider sends --tokens tokens, the first after --prefill-ms and the
+rest --token-ms apart, as server-sent events. Reports time to first token and
+to the complete answer for LLMClient.chat and LLMClient.stream:
+
+    python bench/llm_streaming.py --tokens 300 --token-ms 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_client import LLMClient, Provider
+
+
+def stub_transport(tokens, prefill, token_delay):
+    async def handler(request):
+        payload = json.loads(request.content)
+
+        async def events():
+            await asyncio.sleep(prefill)
+            for i in range(tokens):
+                if i:
+                    await asyncio.sleep(token_delay)
+                yield f"data: {json.dumps({'choices': [{'delta': {'content': f'token{i} '}}]})}\n\n".encode()
+            yield b"data: [DONE]\n\n"
+
+        if payload.get("stream"):
+            return httpx.Response(200, content=events(), headers={"content-type": "text/event-stream"})
+        await asyncio.sleep(prefill + token_delay * (tokens - 1))
+        content = "".join(f"token{i} " for i in range(tokens))
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+    return httpx.MockTransport(handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--prefill-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    client = LLMClient([Provider("stub", "http://stub/v1",
+                                 transport=stub_transport(args.tokens, args.prefill_ms / 1e3, args.token_ms / 1e3))])
+    # temperature 1 so no round is answered from a cache
+    request = {"messages": [{"role": "user", "content": "Tell me a story"}], "model": "stub", "temperature": 1}
+
+    blocking = []
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        client.chat(**request)
+        blocking.append(time.perf_counter() - start)
+
+    first_tokens, totals = [], []
+    for _ in range(args.rounds):
+        stream = client.stream(**request)
+        for _ in stream:
+            pass
+        first_tokens.append(stream.first_token_seconds)
+        totals.append(stream.seconds)
+
+    print(json.dumps({
+        "tokens": args.tokens,
+        "blocking_first_text_ms": statistics.median(blocking) * 1e3,
+        "stream_first_token_ms": statistics.median(first_tokens) * 1e3,
+        "stream_complete_ms": statistics.median(totals) * 1e3,
+        "client": client.stats(),
+    }, indent=2))
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
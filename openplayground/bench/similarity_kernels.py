@@ -0,0 +1,113 @@
+"""
+Similarity scoring cost: the old per-row loops versus the vectorized kernels in similarity.py.
+
+For each corpus size, times one query against N random vectors with:
+
+- loop_cosine / loop_euclidean: the old utils.py implementations, replayed
+  here (a Python loop with np.array(v2) and norm(v1) per row)
+- cosine_float64: similarity.cosine_similarity, the new utils.cosine_similarity
+  (one matrix product, norms recomputed per call)
+- cosine_cached_float32: EmbeddingMatrix.cosine with cached norms
+- cosine_batch_float32: per-query cost when scoring a batch of queries at once
+- top_k_argsort / top_k_argpartition: selecting k from the scores
+
+    python bench/similarity_kernels.py --sizes 1000,100000,1000000 --dim 384
+
+The loops are only timed up to --loop-max vectors. At 1M x 384 the float32
+corpus is 1.5 GB and the float64 copy is 3 GB, so large sizes need the memory.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from similarity import EmbeddingMatrix, cosine_similarity, top_k
+
+
+def loop_cosine(v1, array_of_vectors):
+    v1 = np.array(v1)
+    similarities = []
+    for v2 in array_of_vectors:
+        v2 = np.array(v2)
+        similarities.append(np.dot(v1, v2) / (np.linalg.norm(v1) * np.linalg.norm(v2)))
+    return np.array(similarities)
+
+
+def loop_euclidean(v1, array_of_vectors):
+    v1 = np.array(v1)
+    distances = []
+    for v2 in array_of_vectors:
+        v2 = np.array(v2)
+        distances.append(np.sqrt(np.sum((v1 - v2) ** 2)))
+    return distances
+
+
+def _time(func, min_seconds=0.5, max_repeats=1000):
+    """Best-of seconds per call, repeating until min_seconds have passed."""
+    best, spent, repeats = float("inf"), 0.0, 0
+    while spent < min_seconds and repeats < max_repeats:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        spent += elapsed
+        repeats += 1
+    return best
+
+
+def run(size, dim, batch, k, loop_max, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((size, dim), dtype=np.float32)
+    query = rng.standard_normal(dim, dtype=np.float32)
+    queries = rng.standard_normal((batch, dim), dtype=np.float32)
+    result = {"size": size, "dim": dim}
+
+    if size <= loop_max:
+        result["loop_cosine_ms"] = _time(lambda: loop_cosine(query, vectors)) * 1e3
+        result["loop_euclidean_ms"] = _time(lambda: loop_euclidean(query, vectors)) * 1e3
+
+    result["cosine_float64_ms"] = _time(lambda: cosine_similarity(query, vectors)) * 1e3
+
+    matrix = EmbeddingMatrix(vectors)
+    matrix.norms  # built once, outside the timing
+    result["cosine_cached_float32_ms"] = _time(lambda: matrix.cosine(query)) * 1e3
+    result["euclidean_cached_float32_ms"] = _time(lambda: matrix.euclidean(query)) * 1e3
+    result["cosine_batch_float32_ms_per_query"] = _time(lambda: matrix.cosine(queries)) * 1e3 / batch
+
+    scores = matrix.cosine(query)
+    result["top_k_argsort_ms"] = _time(lambda: np.argsort(-scores)[:k]) * 1e3
+    result["top_k_argpartition_ms"] = _time(lambda: top_k(scores, k)) * 1e3
+
+    # The kernels must agree with the loops they replace
+    sample = slice(0, min(size, 1000))
+    expected = loop_cosine(query, vectors[sample])
+    result["max_abs_error_float32"] = float(np.abs(matrix.cosine(query)[sample] - expected).max())
+    if "loop_cosine_ms" in result:
+        result["speedup_cached_float32"] = result["loop_cosine_ms"] / result["cosine_cached_float32_ms"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=384, help="384 matches all-MiniLM-L6-v2")
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--loop-max", type=int, default=1000000)
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        result = run(size, args.dim, args.batch, args.k, args.loop_max)
+        results.append(result)
+        print(json.dumps({key: round(value, 4) if isinstance(value, float) else value
+                          for key, value in result.items()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+BM25 keyword index that is built once, saved, and memory-mapped on load.
+
+    index = BM25Index.open("bm25", corpus)      # loads if the saved index matches corpus
+    indices, scores = index.retrieve("What are the recent news about GDP?", k=5)
+    indices, scores = index.retrieve(many_queries, k=5)   # (Q, k)
+
+Per query, retrieval only tokenizes the query and scores it against the
+precomputed bm25s score matrix; nothing is re-indexed.
+
+Documents appended to a corpus that was already indexed go into a small delta
+segment instead of triggering a rebuild. Delta documents are scored with the
+combined corpus statistics (document count, document frequencies, average
+length), so they rank like indexed ones; the main segment keeps the statistics
+it was built with until the delta outgrows MAX_DELTA_FRACTION of it and `open`
+rebuilds.
+"""
+import hashlib
+import json
+import math
+import os
+import shutil
+from collections import Counter
+
+import bm25s
+import numpy as np
+
+from similarity import top_k as select_top_k
+
+# Rebuild once appended documents exceed this share of the indexed ones
+MAX_DELTA_FRACTION = 0.1
+MIN_DELTA_REBUILD = 1000
+
+
+def tokenize(texts):
+    """bm25s tokenization (lowercase, English stopwords) as lists of strings."""
+    return bm25s.tokenize(texts, return_ids=False, show_progress=False)
+
+
+def fingerprint(texts):
+    digest = hashlib.blake2b(digest_size=16)
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class BM25Index:
+    """
+    Parameters:
+    retriever (bm25s.BM25): The indexed main segment.
+    count (int): Documents in the main segment.
+    total_length (int): Tokens in the main segment, for the average document length.
+    fingerprint (str): fingerprint() of the main segment's texts.
+    """
+
+    def __init__(self, retriever, count, total_length, fingerprint):
+        self.retriever = retriever
+        self.count = count
+        self.total_length = total_length
+        self.fingerprint = fingerprint
+        self.directory = None
+        self.delta_texts = []
+        self._delta_lengths = []
+        self._delta_postings = {}   # token -> ([delta position], [term frequency])
+        self._delta_arrays = {}     # token -> (positions, frequencies) as arrays, rebuilt after appends
+        self._main_df = np.diff(np.asarray(retriever.scores["indptr"]))
+
+    def __len__(self):
+        return self.count + len(self.delta_texts)
+
+    @classmethod
+    def build(cls, texts):
+        tokenized = bm25s.tokenize(texts, show_progress=False)
+        retriever = bm25s.BM25()
+        retriever.index(tokenized, show_progress=False)
+        total_length = sum(len(ids) for ids in tokenized.ids)
+        return cls(retriever, len(texts), total_length, fingerprint(texts))
+
+    def save(self, directory):
+        """Write the main segment, its statistics and the delta texts."""
+        main = os.path.join(directory, "main")
+        if os.path.exists(main):
+            shutil.rmtree(main)
+        os.makedirs(directory, exist_ok=True)
+        self.retriever.save(main, show_progress=False)
+        with open(os.path.join(directory, "delta.jsonl"), "w") as f:
+            for text in self.delta_texts:
+                f.write(json.dumps(text) + "\n")
+        temporary = os.path.join(directory, "meta.json.tmp")
+        with open(temporary, "w") as f:
+            json.dump({"count": self.count, "total_length": self.total_length, "fingerprint": self.fingerprint}, f)
+        os.replace(temporary, os.path.join(directory, "meta.json"))
+        self.directory = directory
+
+    @classmethod
+    def load(cls, directory):
+        """Open a saved index; the score matrix is memory-mapped, not read."""
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        retriever = bm25s.BM25.load(os.path.join(directory, "main"), mmap=True, show_progress=False)
+        index = cls(retriever, meta["count"], meta["total_length"], meta["fingerprint"])
+        with open(os.path.join(directory, "delta.jsonl")) as f:
+            index._add_delta([json.loads(line) for line in f])
+        index.directory = directory
+        return index
+
+    @classmethod
+    def open(cls, directory, texts):
+        """
+        Load the index saved in directory if it covers a prefix of texts, else build and save one.
+
+        Texts beyond the saved ones are appended to the delta; if that makes
+        the delta too large, the index is rebuilt from all texts.
+        """
+        texts = list(texts)
+        index = None
+        if os.path.exists(os.path.join(directory, "meta.json")):
+            index = cls.load(directory)
+            known = len(index)
+            if (known > len(texts)
+                    or index.delta_texts != texts[index.count:known]
+                    or fingerprint(texts[:index.count]) != index.fingerprint):
+                index = None
+            else:
+                index.append(texts[known:])
+                if len(index.delta_texts) > max(MIN_DELTA_REBUILD, MAX_DELTA_FRACTION * index.count):
+                    index = None
+        if index is None:
+            index = cls.build(texts)
+            index.save(directory)
+        return index
+
+    def _add_delta(self, texts):
+        base = len(self.delta_texts)
+        for offset, tokens in enumerate(tokenize(texts) if texts else []):
+            self._delta_lengths.append(len(tokens))
+            for token, frequency in Counter(tokens).items():
+                positions, frequencies = self._delta_postings.setdefault(token, ([], []))
+                positions.append(base + offset)
+                frequencies.append(frequency)
+        self.delta_texts.extend(texts)
+        self._delta_arrays = {}
+
+    def append(self, texts):
+        """Add documents without rebuilding; their indices continue from len(self)."""
+        texts = list(texts)
+        if not texts:
+            return
+        self._add_delta(texts)
+        if self.directory is not None:
+            with open(os.path.join(self.directory, "delta.jsonl"), "a") as f:
+                for text in texts:
+                    f.write(json.dumps(text) + "\n")
+
+    def _delta_scores(self, query_tokens):
+        """BM25 scores of every delta document, using the combined corpus statistics."""
+        scores = np.zeros(len(self.delta_texts), dtype=np.float32)
+        documents = len(self)
+        average_length = (self.total_length + sum(self._delta_lengths)) / documents
+        lengths = np.asarray(self._delta_lengths, dtype=np.float32)
+        k1, b = self.retriever.k1, self.retriever.b
+        for token in query_tokens:
+            if token not in self._delta_postings:
+                continue
+            if token not in self._delta_arrays:
+                positions, frequencies = self._delta_postings[token]
+                self._delta_arrays[token] = (np.asarray(positions), np.asarray(frequencies, dtype=np.float32))
+            positions, frequencies = self._delta_arrays[token]
+            token_id = self.retriever.vocab_dict.get(token)
+            df = len(positions) + (int(self._main_df[token_id]) if token_id is not None else 0)
+            idf = math.log(1 + (documents - df + 0.5) / (df + 0.5))
+            norm = k1 * (1 - b + b * lengths[positions] / average_length)
+            scores[positions] += idf * frequencies / (frequencies + norm)
+        return scores
+
+    def retrieve(self, queries, k=5):
+        """
+        Top-k documents for one query or a batch.
+
+        Parameters:
+        queries (str or list of str): The search query or queries.
+        k (int): Documents per query, capped at len(self).
+
+        Returns:
+        tuple: (indices, scores), each of shape (k,) for a single query or (Q, k), best first.
+        """
+        single = isinstance(queries, str)
+        query_tokens = tokenize([queries] if single else list(queries))
+        k = min(k, len(self))
+        indices, scores = self.retriever.retrieve(query_tokens, k=min(k, self.count), show_progress=False)
+        if self.delta_texts:
+            delta = np.stack([self._delta_scores(tokens) for tokens in query_tokens])
+            candidates = np.concatenate([indices, np.broadcast_to(self.count + np.arange(delta.shape[1]), delta.shape)], axis=1)
+            candidate_scores = np.concatenate([scores, delta], axis=1)
+            best = select_top_k(candidate_scores, k)
+            indices = np.take_along_axis(candidates, best, axis=1)
+            scores = np.take_along_axis(candidate_scores, best, axis=1)
+        return (indices[0], scores[0]) if single else (indices, scores)
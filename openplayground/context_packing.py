@@ -0,0 +1,244 @@
+"""
+Token budgeting for RAG prompts: retrieved documents are packed into a fixed context size.
+
+    packer = ContextPacker(budget=1500)
+    packed = packer.pack(documents, scores)      # documents: [(key, text)], best first
+    packed.text, packed.tokens, packed.tokens_saved
+    packer.stats()                                # totals over every pack()
+
+Documents are taken best first. Sentences of DEDUPE_MIN_WORDS or more words
+that are already in the context (ignoring case, punctuation and field labels
+such as "Description: ") are dropped from later documents, and a document
+with nothing new is skipped. A document that doesn't fit whole is truncated
+into the remaining budget if at least `min_tokens` are left; otherwise
+smaller documents further down may still fit. The packed text never exceeds
+`budget` tokens, however many documents are retrieved.
+
+Tokens are counted with tiktoken when it is installed, and otherwise
+estimated, erring high. Counts are cached per text.
+"""
+import hashlib
+import math
+import re
+
+from lru import LRUCache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+DEFAULT_ENCODING = "cl100k_base"
+SEPARATOR = "\n\n"
+# Shorter sentences, e.g. "Published at: 2024-04-25" field lines, are never treated as repeats
+DEDUPE_MIN_WORDS = 6
+
+_SENTENCE_END = re.compile(r"((?<=[.!?])\s+|\n+)")
+_PIECE = re.compile(r"\w+|[^\w\s]")
+_SPACE = re.compile(r"\s+")
+_LABEL = re.compile(r"^\w+(?: \w+){0,2}:\s+")
+_NON_WORD = re.compile(r"[^\w']+")
+
+
+class TokenCounter:
+    """
+    Parameters:
+    encoding (str): tiktoken encoding; ignored when tiktoken isn't installed.
+    cache_size (int): Texts whose counts are kept.
+    """
+
+    def __init__(self, encoding=DEFAULT_ENCODING, cache_size=65536):
+        self._encoding = tiktoken.get_encoding(encoding) if tiktoken is not None else None
+        self.exact = self._encoding is not None
+        self.cache = LRUCache(cache_size)
+
+    def _count(self, text):
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        # About 4 characters per token for English text, but at least one token per word or punctuation mark
+        return max(len(_PIECE.findall(text)), math.ceil(len(text) / 4))
+
+    def count(self, text):
+        """Tokens in text, cached by content."""
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        tokens = self.cache.get(key)
+        if tokens is None:
+            tokens = self._count(text)
+            self.cache.put(key, tokens)
+        return tokens
+
+    def truncate(self, text, max_tokens, marker=" …"):
+        """The longest prefix of text, ending in `marker`, within max_tokens; "" if even the marker doesn't fit."""
+        if self.count(text) <= max_tokens:
+            return text
+        room = max_tokens - self._count(marker)
+        if room <= 0:
+            return ""
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            return self._encoding.decode(tokens[:room]).rstrip() + marker
+        # Binary search over word boundaries for the longest prefix that fits
+        cuts = [match.start() for match in re.finditer(r"\s+", text)] + [len(text)]
+        low, high = 0, len(cuts)
+        while low < high:
+            middle = (low + high) // 2
+            if self._count(text[:cuts[middle]]) <= room:
+                low = middle + 1
+            else:
+                high = middle
+        return text[:cuts[low - 1]].rstrip() + marker if low else ""
+
+
+class PackedContext:
+    """
+    The result of ContextPacker.pack.
+
+    Attributes:
+    text (str): The packed documents, joined by SEPARATOR.
+    keys (list): Keys of the documents included, in order.
+    tokens (int): Tokens in text.
+    tokens_available (int): Tokens all documents would have taken, unpacked.
+    truncated (list): Keys of documents that were cut short.
+    dropped (list): Keys of documents left out, for lack of room or of new content.
+    """
+
+    def __init__(self, text, keys, tokens, tokens_available, truncated, dropped):
+        self.text = text
+        self.keys = keys
+        self.tokens = tokens
+        self.tokens_available = tokens_available
+        self.truncated = truncated
+        self.dropped = dropped
+
+    @property
+    def tokens_saved(self):
+        return max(0, self.tokens_available - self.tokens)
+
+    def report(self):
+        return {
+            "documents": len(self.keys), "tokens": self.tokens, "tokens_available": self.tokens_available,
+            "tokens_saved": self.tokens_saved, "truncated": len(self.truncated), "dropped": len(self.dropped),
+        }
+
+
+def _normalize(sentence):
+    """Comparable form of a sentence: no field label ("Description: "), punctuation, quote style or case."""
+    sentence = _LABEL.sub("", sentence.strip())
+    return _SPACE.sub(" ", _NON_WORD.sub(" ", sentence.lower().replace("’", "'"))).strip()
+
+
+class ContextPacker:
+    """
+    Parameters:
+    budget (int): Most tokens the packed context may take.
+    counter (TokenCounter): Counts tokens; one shared counter keeps the count cache warm.
+    min_tokens (int): Smallest remainder worth truncating a document into.
+    """
+
+    def __init__(self, budget, counter=None, min_tokens=48):
+        self.budget = budget
+        self.counter = counter or TokenCounter()
+        self.min_tokens = min_tokens
+        self.packs = 0
+        self.tokens_packed = 0
+        self.tokens_saved = 0
+
+    def _dedupe(self, text, seen):
+        """
+        Text without the sentences already in `seen`, keeping its line breaks; `seen` isn't changed.
+
+        Returns None when the text repeats content and adds no sentence of DEDUPE_MIN_WORDS or more.
+        """
+        pieces = _SENTENCE_END.split(text)
+        kept, repeated, new = [], False, set()
+        # pieces alternates sentence, delimiter, sentence, ...
+        for position in range(0, len(pieces), 2):
+            sentence = pieces[position]
+            delimiter = pieces[position + 1] if position + 1 < len(pieces) else ""
+            normalized = _normalize(sentence)
+            if len(normalized.split()) >= DEDUPE_MIN_WORDS:
+                # A sentence repeated within the text itself is kept once
+                if normalized in seen or normalized in new:
+                    repeated = True
+                    continue
+                new.add(normalized)
+            kept.append(sentence + delimiter)
+        if repeated and not new:
+            return None
+        return "".join(kept).strip()
+
+    @staticmethod
+    def _sentences(text):
+        """Normalized sentences of DEDUPE_MIN_WORDS or more words in text, as _dedupe compares them."""
+        sentences = (_normalize(sentence) for sentence in _SENTENCE_END.split(text)[::2])
+        return {sentence for sentence in sentences if len(sentence.split()) >= DEDUPE_MIN_WORDS}
+
+    def pack(self, documents, scores=None, budget=None):
+        """
+        Fit the best documents into the budget.
+
+        Parameters:
+        documents (list of tuple): (key, text) pairs.
+        scores (list of float): Retrieval score per document, higher is better; defaults to the given order.
+        budget (int): Overrides self.budget for this call.
+
+        Returns:
+        PackedContext: The packed text and what was kept, cut and left out.
+        """
+        budget = self.budget if budget is None else budget
+        documents = list(documents)
+        order = range(len(documents))
+        if scores is not None:
+            # Stable, so equal scores keep their retrieval order
+            order = sorted(order, key=lambda i: -scores[i])
+        separator_tokens = self.counter.count(SEPARATOR)
+        tokens_available = sum(self.counter.count(text) for _, text in documents)
+        tokens_available += separator_tokens * max(0, len(documents) - 1)
+
+        seen = set()
+        parts, keys, truncated, dropped = [], [], [], []
+        used = 0
+        for i in order:
+            key, text = documents[i]
+            text = self._dedupe(text, seen)
+            if not text:
+                dropped.append(key)
+                continue
+            cost = self.counter.count(text) + (separator_tokens if parts else 0)
+            remaining = budget - used
+            if cost <= remaining:
+                parts.append(text)
+                keys.append(key)
+                seen |= self._sentences(text)
+                used += cost
+                continue
+            room = remaining - (separator_tokens if parts else 0)
+            if room >= self.min_tokens:
+                cut = self.counter.truncate(text, room)
+                if cut:
+                    parts.append(cut)
+                    keys.append(key)
+                    truncated.append(key)
+                    # Only what made it into the cut counts as seen
+                    seen |= self._sentences(cut)
+                    used += self.counter.count(cut) + (separator_tokens if len(parts) > 1 else 0)
+                    continue
+            dropped.append(key)
+
+        text = SEPARATOR.join(parts)
+        tokens = self.counter.count(text) if parts else 0
+        if tokens > budget:
+            # Tokenizers can merge across the joins, so the whole may count a little over its parts
+            text = self.counter.truncate(text, budget)
+            tokens = self.counter.count(text)
+            if keys and keys[-1] not in truncated:
+                truncated.append(keys[-1])
+        packed = PackedContext(text, keys, tokens, tokens_available, truncated, dropped)
+        self.packs += 1
+        self.tokens_packed += packed.tokens
+        self.tokens_saved += packed.tokens_saved
+        return packed
+
+    def stats(self):
+        return {"packs": self.packs, "tokens_packed": self.tokens_packed, "tokens_saved": self.tokens_saved,
+                "exact_counts": self.counter.exact, "count_cache": self.counter.cache.stats()}
@@ -1,19 +1,30 @@
 import joblib
+import logging
 import numpy as np
-import bm25s
 import os
+import subprocess
+import sys
 from sentence_transformers import SentenceTransformer
 
+from ann_index import IVFIndex
+from bm25_index import BM25Index
+from context_packing import ContextPacker
+from embedding_pipeline import NEAR_DUPLICATE_BITS, copies_tag
+from embedding_store import EmbeddingStore, content_hash
+from hybrid_retrieval import HybridRetriever, fuse
+
 from utils import (
-    read_dataframe,
+    read_news_table,
     pprint, 
     generate_with_single_input, 
+    generate_with_single_input_stream,
     cosine_similarity,
     display_widget
 )
 # import unittests
 
-NEWS_DATA = read_dataframe(os.path.join(os.path.dirname(__file__), "news_data_dedup.csv"))
+NEWS_CSV = os.path.join(os.path.dirname(__file__), "news_data_dedup.csv")
+NEWS_DATA = read_news_table(NEWS_CSV)
 
 def query_news(indices):
     """
@@ -26,44 +37,148 @@ def query_news(indices):
     Returns:
     list: A list of elements from the dataset corresponding to the indices provided in list_of_indices.
     """
-    return [NEWS_DATA[index] for index in indices]
+    return [NEWS_DATA[index].to_dict() for index in indices]
 
-# The corpus used will be the title appended with the description
-corpus = [x['title'] + " " + x['description'] for x in NEWS_DATA]
+def corpus_texts():
+    """The text indexed for each article: its title and description, in NEWS_DATA order."""
+    return (NEWS_DATA.column('title') + " " + NEWS_DATA.column('description')).tolist()
+
+# Corpus embeddings, memory-mapped from disk (see embedding_store.py). Only articles that are new
+# or whose title/description changed since the last run are encoded.
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "BAAI/bge-base-en-v1.5")
+EMBEDDING_DIR = os.path.join(os.path.dirname(__file__), "embeddings")
+# Vectors from an earlier session, used instead of encoding when the text matches
+LEGACY_EMBEDDINGS = os.path.join(os.path.dirname(__file__), "embeddings.joblib")
+# Model a bare legacy array was encoded with; tagged files ({'model', 'hashes', 'vectors'}) name their own
+LEGACY_EMBEDDINGS_MODEL = "BAAI/bge-base-en-v1.5"
+SEMANTIC_INDEX_DIR = os.path.join(EMBEDDING_DIR, "ivf")
+# Processes encoding new articles; unset sizes the pool to the machine's CPUs and memory
+EMBEDDING_WORKERS = int(os.environ["EMBEDDING_WORKERS"]) if os.environ.get("EMBEDDING_WORKERS") else None
+
+_embedding_model = None
+
+def embedding_model():
+    """The SentenceTransformer for EMBEDDING_MODEL, loaded on first use."""
+    global _embedding_model
+    if _embedding_model is None:
+        _embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+    return _embedding_model
+
+logger = logging.getLogger(__name__)
+
+def load_legacy_embeddings(texts):
+    """
+    Reads LEGACY_EMBEDDINGS, keyed by the content hash of the text each vector was encoded from.
+
+    A tagged file, {'model': str, 'hashes': [bytes], 'vectors': array}, is matched by hash. A bare array, as
+    first saved, has no hashes and is assumed to follow the CSV's row order, so it is only used when its
+    length is len(texts); either is only used when its model is EMBEDDING_MODEL.
+
+    Args:
+        texts (List[str]): The corpus, in NEWS_DATA order.
+
+    Returns:
+        dict: content hash -> vector; empty, with the reason logged, when the file doesn't fit.
+    """
+    legacy = joblib.load(LEGACY_EMBEDDINGS)
+    if isinstance(legacy, dict):
+        model, hashes, vectors = legacy.get('model'), legacy.get('hashes'), legacy.get('vectors')
+        if hashes is None or vectors is None or len(hashes) != len(vectors):
+            logger.warning("Ignoring %s: expected 'hashes' and 'vectors' of the same length", LEGACY_EMBEDDINGS)
+            return {}
+    else:
+        model, vectors = LEGACY_EMBEDDINGS_MODEL, legacy
+        if len(vectors) != len(texts):
+            logger.warning("Ignoring %s: it has %s vectors for %s articles, so its rows can't be matched by position",
+                           LEGACY_EMBEDDINGS, len(vectors), len(texts))
+            return {}
+        hashes = [content_hash(text) for text in texts]
+    if model != EMBEDDING_MODEL:
+        logger.warning("Ignoring %s: encoded with %s, not %s", LEGACY_EMBEDDINGS, model, EMBEDDING_MODEL)
+        return {}
+    return dict(zip(hashes, vectors))
+
+def load_embedding_store():
+    """
+    Opens the embedding store, bringing it up to date with NEWS_DATA first.
+
+    Rows with a vector in LEGACY_EMBEDDINGS for the same text and model take it from there (see
+    load_legacy_embeddings); the rest are encoded by embedding_pipeline.py's worker processes.
+
+    Returns:
+    EmbeddingStore: Row i holds the embedding of NEWS_DATA[i].
+    """
+    guids = NEWS_DATA.column('guid').tolist()
+    texts = corpus_texts()
+    store = EmbeddingStore(EMBEDDING_DIR)
+    # Tagged as the pipeline below tags its copies, so it resumes this update rather than starting over
+    pending = store.prepare(guids, texts, EMBEDDING_MODEL, copies_tag(NEAR_DUPLICATE_BITS))
+    if pending is None:
+        return store
+    if os.path.exists(LEGACY_EMBEDDINGS):
+        legacy = load_legacy_embeddings(texts)
+        rows = [i for i in pending.missing if content_hash(texts[i]) in legacy]
+        if rows:
+            pending.write(rows, np.array([legacy[content_hash(texts[i])] for i in rows]))
+    # Run as a script so the pool's workers re-import embedding_pipeline, not this module; it
+    # picks up the rows written above as an update in progress
+    command = [sys.executable, os.path.join(os.path.dirname(__file__), "embedding_pipeline.py"),
+               "--csv", NEWS_CSV, "--store", EMBEDDING_DIR, "--model", EMBEDDING_MODEL]
+    if EMBEDDING_WORKERS:
+        command += ["--workers", str(EMBEDDING_WORKERS)]
+    subprocess.run(command, check=True)
+    return EmbeddingStore(EMBEDDING_DIR)
 
-# Instantiate the retriever by passing the corpus data
-BM25_RETRIEVER = bm25s.BM25(corpus=corpus)
+EMBEDDING_STORE = load_embedding_store()
+EMBEDDINGS = EMBEDDING_STORE.vectors
 
-# Tokenize the chunks
-tokenized_data = bm25s.tokenize(corpus)
+def load_semantic_index():
+    """
+    Opens the ANN index over EMBEDDINGS, rebuilding it if the embedding store has changed since it was saved.
 
-# Index the tokenized chunks within the retriever
-BM25_RETRIEVER.index(tokenized_data)
+    Returns:
+    IVFIndex: Ids are row numbers in NEWS_DATA.
+    """
+    if os.path.exists(os.path.join(SEMANTIC_INDEX_DIR, "meta.json")):
+        index, meta = IVFIndex.load(SEMANTIC_INDEX_DIR)
+        if meta.get("store_generation") == EMBEDDING_STORE.generation:
+            return index
+    index = IVFIndex.build(EMBEDDINGS)
+    index.save(SEMANTIC_INDEX_DIR, store_generation=EMBEDDING_STORE.generation)
+    return index
 
-# Tokenize the same query used in the previous exercise
-sample_query = "What are the recent news about GDP?"
-tokenized_sample_query = bm25s.tokenize(sample_query)
+SEMANTIC_INDEX = load_semantic_index()
+
+def semantic_search_retrieve(query, top_k=5, nprobe=None):
+    """
+    Retrieves the indices of the top k articles most similar to a query by embedding cosine similarity.
+
+    Args:
+        query (str): The search query.
+        top_k (int): The number of indices to return. Default is 5.
+        nprobe (int): Index cells to scan; more is slower but closer to exact. Defaults to the index's setting.
+            Corpora as small as NEWS_DATA are always searched exactly.
 
-# Get the retrieved results and their respective scores
-res = BM25_RETRIEVER.retrieve(tokenized_sample_query, k=3)
-results, scores = res
+    Returns:
+        List[int]: Indices into NEWS_DATA, most similar first.
+    """
+    query_embedding = embedding_model().encode(query)
+    ids, _ = SEMANTIC_INDEX.search(query_embedding, top_k, nprobe=nprobe)
+    return ids.tolist()
 
-# print(f"Results for query: {sample_query}\n")
-# for doc in results[0]:
-#   print(f"Document retrieved {corpus.index(doc)} : {doc}\n")
+# The corpus used will be the title appended with the description
+corpus = corpus_texts()
 
-corpus = [x['title'] + " " + x['description'] for x in NEWS_DATA]
-BM25_RETRIEVER = bm25s.BM25(corpus=corpus)
-TOKENIZED_DATA = bm25s.tokenize(corpus)
-BM25_RETRIEVER.index(TOKENIZED_DATA)
+# Keyword index over the corpus, built once and memory-mapped on later runs (see bm25_index.py)
+BM25_DIR = os.path.join(os.path.dirname(__file__), "bm25")
+BM25_INDEX = BM25Index.open(BM25_DIR, corpus)
 
 def bm25_retrieve(query: str, top_k: int = 5):
     """
     Retrieves the top k relevant documents for a given query using the BM25 algorithm.
 
-    This function tokenizes the input query and uses a pre-indexed BM25 retriever to
-    search through a collection of documents. It returns the indices of the top k documents
-    that are most relevant to the query.
+    This function tokenizes the input query and scores it against the prebuilt BM25 index.
+    It returns the indices of the top k documents that are most relevant to the query.
 
     Args:
         query (str): The search query for which documents need to be retrieved.
@@ -73,32 +188,137 @@ def bm25_retrieve(query: str, top_k: int = 5):
         List[int]: A list of indices corresponding to the top k relevant documents
         within the corpus.
     """
-    ### START CODE HERE ###
-
-    # Tokenize the query using the 'tokenize' function from the 'bm25s' module
-    tokenized_query = bm25s.tokenize(query)
-    print(type(tokenized_query))
-
-    # Index the tokenized chunks within the retriever
-    BM25_RETRIEVER.index(tokenized_data)
-    # Use the 'BM25_RETRIEVER' to retrieve documents and their scores based on the tokenized query
-    # Retrieve the top 'k' documents
-    results, scores = BM25_RETRIEVER.retrieve(tokenized_query, k=top_k)
-    # a = BM25_RETRIEVER.get_scores(tokenized_query)
-    print(type(results))
-    # print how many results received:
-    print("Number of results received:", len(results))
-    # Extract the first element from 'results' to get the list of retrieved documents
-    results_first = [item[0] for item in results]
-    # Convert the retrieved documents into their corresponding indices in the results list
-    enumerated = enumerate(results)
-    sorted_results = sorted(enumerated, key=lambda x:x, reverse=True)
-    # top_k_indices = sorted_results[:top_k]
-    
-    top_k_indices = np.argsort(scores)[::-1][:top_k]
-    ### END CODE HERE ###
-    
-    return list(top_k_indices)
-print('------------------------------------')
-retrieved = bm25_retrieve("What are the recent news about GDP?", top_k=3)
-print(f"retrieved: {retrieved}")
\ No newline at end of file
+    top_k_indices, _ = BM25_INDEX.retrieve(query, top_k)
+    return top_k_indices.tolist()
+
+def reciprocal_rank_fusion(list1, list2, top_k=5, K=60):
+    """
+    Fuses two ranked lists of document indices with reciprocal rank fusion.
+
+    Each document scores 1 / (K + rank) for every list it appears in, with ranks starting at 1.
+
+    Args:
+        list1 (List[int]): Indices from the first retriever, best first.
+        list2 (List[int]): Indices from the second retriever, best first.
+        top_k (int): The number of fused indices to return. Default is 5.
+        K (int): The RRF constant. Default is 60.
+
+    Returns:
+        List[int]: The top k indices by fused score.
+    """
+    top_k_indices, _ = fuse([list1, list2], top_k, k=K)
+    return top_k_indices
+
+# Semantic and BM25 retrieval run concurrently and are fused with RRF; weights are relative
+HYBRID_RETRIEVER = HybridRetriever(
+    {
+        "semantic": lambda queries, k: SEMANTIC_INDEX.search(embedding_model().encode(queries), k)[0].tolist(),
+        "bm25": lambda queries, k: BM25_INDEX.retrieve(queries, k)[0].tolist(),
+    },
+    weights={
+        "semantic": float(os.environ.get("HYBRID_SEMANTIC_WEIGHT", "1.0")),
+        "bm25": float(os.environ.get("HYBRID_BM25_WEIGHT", "1.0")),
+    },
+)
+
+def hybrid_retrieve(query, top_k=5):
+    """
+    Retrieves the top k documents by fusing semantic and BM25 rankings, computed in parallel.
+
+    Args:
+        query (str or List[str]): The search query, or a list of queries to answer in one batch.
+        top_k (int): The number of indices to return per query. Default is 5.
+
+    Returns:
+        List[int]: Indices into NEWS_DATA, best first; one such list per query for a batch.
+    """
+    if isinstance(query, str):
+        return HYBRID_RETRIEVER.retrieve(query, top_k)[0]
+    return [indices for indices, _ in HYBRID_RETRIEVER.retrieve_batch(query, top_k)]
+
+# The widget passes reciprocal_rank_fusion as a retriever, but it fuses two ranked lists rather than
+# answering a query; its (query, top_k) form is hybrid_retrieve. Each retriever's scored form lets the
+# context packer order articles by retrieval score.
+_SCORED_RETRIEVERS = {
+    semantic_search_retrieve: lambda query, k: SEMANTIC_INDEX.search(embedding_model().encode(query), k),
+    bm25_retrieve: lambda query, k: BM25_INDEX.retrieve(query, k),
+    hybrid_retrieve: lambda query, k: HYBRID_RETRIEVER.retrieve(query, k),
+    reciprocal_rank_fusion: lambda query, k: HYBRID_RETRIEVER.retrieve(query, k),
+}
+
+def retrieve_with_scores(query, top_k=5, retrieve_function=None):
+    """
+    Retrieves indices along with their retrieval scores.
+
+    Args:
+        query (str): The search query.
+        top_k (int): The number of indices to return. Default is 5.
+        retrieve_function (callable): One of this module's retrievers, or any (query, top_k) -> indices function.
+            Default is hybrid_retrieve; reciprocal_rank_fusion stands for hybrid_retrieve.
+
+    Returns:
+        tuple: (indices, scores), best first; scores is None for a retriever that doesn't report them.
+    """
+    retrieve_function = retrieve_function or hybrid_retrieve
+    scored = _SCORED_RETRIEVERS.get(retrieve_function)
+    if scored is None:
+        return list(retrieve_function(query, top_k)), None
+    indices, scores = scored(query, top_k)
+    return np.asarray(indices).tolist(), np.asarray(scores).tolist()
+
+# Retrieved articles are packed into a fixed token budget (see context_packing.py), so prompt size
+# doesn't grow with top_k
+RAG_CONTEXT_TOKENS = int(os.environ.get("RAG_CONTEXT_TOKENS", "1500"))
+CONTEXT_PACKER = ContextPacker(RAG_CONTEXT_TOKENS)
+
+def format_document(document):
+    """One retrieved article as it appears in a RAG prompt."""
+    return (f"Title: {document['title']}\nPublished at: {document['published_at']}\n"
+            f"Description: {document['description']}\nURL: {document['url']}")
+
+def generate_final_prompt(query, top_k=5, retrieve_function=None, use_rag=True):
+    """
+    Builds the prompt for a query, with the retrieved articles as context when use_rag is set.
+
+    Args:
+        query (str): The user's question.
+        top_k (int): Articles to retrieve; however many, the context stays within RAG_CONTEXT_TOKENS.
+        retrieve_function (callable): (query, top_k) -> indices into NEWS_DATA, best first. Default is hybrid_retrieve;
+            reciprocal_rank_fusion, as the widget passes it, stands for hybrid_retrieve.
+        use_rag (bool): Whether to add retrieved articles at all.
+
+    Returns:
+        tuple: (prompt, report), where report is the PackedContext.report() of the context, or None without RAG.
+    """
+    if not use_rag:
+        return query, None
+    indices, scores = retrieve_with_scores(query, top_k, retrieve_function)
+    documents = [(index, format_document(document)) for index, document in zip(indices, query_news(indices))]
+    # Without scores the packer keeps the retriever's best-first order
+    packed = CONTEXT_PACKER.pack(documents, scores)
+    prompt = (f"Answer the user query below. There will be provided additional information for you to compose "
+              f"your answer. The relevant information provided is from 2024 and it should be added as your overall "
+              f"knowledge to answer the query, you should not rely only on this information to answer the query, "
+              f"but add it to your overall knowledge.\nQuery: {query}\n2024 News: {packed.text}")
+    return prompt, packed.report()
+
+def llm_call(query, retrieve_function=None, top_k=5, use_rag=True, stream=False):
+    """
+    Answers a query with the LLM, with retrieved news as context; the llm_call_func of display_widget.
+
+    Args:
+        stream (bool): Return the answer as it arrives rather than once it's complete. display_widget sets it,
+            so its outputs update incrementally.
+
+    Returns:
+        str: The answer's text; with stream, an llm_client.Stream that yields it piece by piece.
+    """
+    prompt, _ = generate_final_prompt(query, top_k, retrieve_function, use_rag)
+    if stream:
+        return generate_with_single_input_stream(prompt)
+    return generate_with_single_input(prompt)['content']
+
+if __name__ == "__main__":
+    print('------------------------------------')
+    retrieved = bm25_retrieve("What are the recent news about GDP?", top_k=3)
+    print(f"retrieved: {retrieved}")
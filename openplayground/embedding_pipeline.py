@@ -0,0 +1,263 @@
+"""
+Embedding generation for the corpus: near-duplicate collapse, memory-sized batches, a process pool.
+
+    pipeline = EmbeddingPipeline(EmbeddingStore("embeddings"), "BAAI/bge-base-en-v1.5", workers=4)
+    stats = pipeline.run(guids, texts)
+
+Steps:
+
+1. Rows whose text hash already has a vector from the same model are reused
+   (EmbeddingStore.prepare), as are rows written by an interrupted run.
+2. Near-duplicate texts are grouped by 64-bit SimHash: texts whose hashes
+   differ in at most `near_duplicate_bits` bits share one encoding, the
+   group's first row. Set near_duplicate_bits=None to encode every text.
+   Copies are recorded as such in the store, so changing the threshold or
+   disabling collapsing re-encodes them.
+3. The remaining texts are encoded in batches across a process pool, each
+   worker loading the model once. Batch size follows available memory.
+4. Each batch is written to the store's new generation as it completes, so
+   stopping the run loses at most the batches in flight.
+
+Run it from the command line to prepare the store before opening dostuff:
+
+    python embedding_pipeline.py --csv news_data_dedup.csv --store embeddings --workers 4
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+# Rough peak memory per text while a transformer encodes it (activations at
+# a few hundred tokens); sizes batches so all workers fit in available memory
+BYTES_PER_TEXT = 8 * 2**20
+# Rough resident size of one worker with the model loaded; caps the default worker count
+BYTES_PER_WORKER = 2 * 2**30
+MIN_BATCH = 16
+MAX_BATCH = 512
+# Share of available memory the workers' batches may use together
+MEMORY_FRACTION = 0.5
+# Rows compared against per SimHash bucket, so a huge bucket doesn't go quadratic
+MAX_BUCKET_COMPARE = 32
+NEAR_DUPLICATE_BITS = 3
+
+_WORD = re.compile(r"\w+")
+
+
+def available_memory():
+    """Bytes of memory available to new allocations (MemAvailable on Linux)."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def default_workers(bytes_per_worker=BYTES_PER_WORKER):
+    """One worker per CPU, as far as available memory holds a model copy for each."""
+    return max(1, min(os.cpu_count() or 1, int(available_memory() * MEMORY_FRACTION // bytes_per_worker)))
+
+
+def memory_batch_size(workers, bytes_per_text=BYTES_PER_TEXT):
+    size = int(available_memory() * MEMORY_FRACTION / max(1, workers) / bytes_per_text)
+    return max(MIN_BATCH, min(MAX_BATCH, size))
+
+
+def simhash(text, cache):
+    """64-bit SimHash of the text's lowercase words; `cache` maps word -> hash bits."""
+    words = set(_WORD.findall(text.lower()))
+    if not words:
+        return 0
+    rows = []
+    for word in words:
+        bits = cache.get(word)
+        if bits is None:
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bits = cache[word] = np.unpackbits(np.frombuffer(digest, dtype=np.uint8))
+        rows.append(bits)
+    votes = np.sum(rows, axis=0) * 2 > len(rows)
+    return int.from_bytes(np.packbits(votes).tobytes(), "big")
+
+
+def near_duplicates(texts, max_bits=3):
+    """
+    Group near-duplicate texts by SimHash Hamming distance.
+
+    Hashes are split into max_bits + 1 bands; two hashes within max_bits of
+    each other must agree on at least one whole band, so only rows sharing a
+    band are compared.
+
+    Returns:
+    list of int: For each row, the first row of its group (itself if unique).
+    """
+    cache = {}
+    hashes = [simhash(text, cache) for text in texts]
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    bands = max_bits + 1
+    width = 64 // bands
+    mask = (1 << width) - 1
+    for band in range(bands):
+        buckets = {}
+        for i, value in enumerate(hashes):
+            members = buckets.setdefault((value >> (band * width)) & mask, [])
+            for j in members:
+                if bin(hashes[i] ^ hashes[j]).count("1") <= max_bits:
+                    a, b = find(i), find(j)
+                    # The lower row stays the representative
+                    parent[max(a, b)] = min(a, b)
+                    break
+            if len(members) < MAX_BUCKET_COMPARE:
+                members.append(i)
+    return [find(i) for i in range(len(texts))]
+
+
+def sentence_transformer(model):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model).encode
+
+
+_encode = None
+
+
+def _init_worker(factory, model):
+    global _encode
+    # One thread per process; the pool provides the parallelism
+    try:
+        import torch
+
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    _encode = factory(model)
+
+
+def _encode_batch(texts):
+    return np.asarray(_encode(texts), dtype=np.float32)
+
+
+def copies_tag(near_duplicate_bits):
+    """The EmbeddingStore `copies` tag for vectors shared under this SimHash distance; None when collapsing is off."""
+    return None if near_duplicate_bits is None else f"simhash:{near_duplicate_bits}"
+
+
+class EmbeddingPipeline:
+    """
+    Parameters:
+    store (EmbeddingStore): Where vectors are read from and written to.
+    model (str): Embedding model name, passed to `factory` in each worker.
+    factory (callable): model -> encode(texts) function; must be picklable (module-level).
+    workers (int): Encoding processes; defaults to default_workers().
+    batch_size (int): Texts per task; defaults to memory_batch_size(workers).
+    near_duplicate_bits (int): SimHash distance treated as a duplicate; None disables collapsing.
+    """
+
+    def __init__(self, store, model, factory=sentence_transformer, workers=None, batch_size=None,
+                 near_duplicate_bits=NEAR_DUPLICATE_BITS):
+        self.store = store
+        self.model = model
+        self.factory = factory
+        self.workers = workers or default_workers()
+        self.batch_size = batch_size or memory_batch_size(self.workers)
+        self.near_duplicate_bits = near_duplicate_bits
+
+    @property
+    def copies(self):
+        return copies_tag(self.near_duplicate_bits)
+
+    def run(self, guids, texts):
+        """
+        Bring the store up to date with these rows.
+
+        Returns:
+        dict: rows, reused (vectors already stored), near_duplicates (copied
+        from a similar text), encoded and seconds.
+        """
+        started = time.perf_counter()
+        texts = list(texts)
+        stats = {"rows": len(texts), "reused": len(texts), "near_duplicates": 0, "encoded": 0}
+        pending = self.store.prepare(guids, texts, self.model, self.copies)
+        if pending is None:
+            stats["seconds"] = time.perf_counter() - started
+            return stats
+        missing = pending.missing
+        stats["reused"] = len(texts) - len(missing)
+
+        if self.near_duplicate_bits is None:
+            to_encode, copies = missing, []
+        else:
+            groups = near_duplicates(texts, self.near_duplicate_bits)
+            missing_set = set(missing)
+            # A group's first row is encoded unless it already has a vector
+            to_encode = sorted({groups[i] for i in missing if groups[i] in missing_set})
+            copies = [(i, groups[i]) for i in missing if groups[i] != i]
+            stats["near_duplicates"] = len(copies)
+
+        batches = [to_encode[start:start + self.batch_size] for start in range(0, len(to_encode), self.batch_size)]
+        if batches:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(self.factory, self.model)) as pool:
+                running = {}
+                queued = iter(batches)
+                # Keep two tasks per worker in flight so finished batches are written while others encode
+                for batch in queued:
+                    running[pool.submit(_encode_batch, [texts[i] for i in batch])] = batch
+                    if len(running) >= 2 * self.workers:
+                        break
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.write(running.pop(future), future.result())
+                        batch = next(queued, None)
+                        if batch is not None:
+                            running[pool.submit(_encode_batch, [texts[i] for i in batch])] = batch
+        stats["encoded"] = len(to_encode)
+        if copies:
+            rows, sources = zip(*copies)
+            pending.copy(list(rows), list(sources))
+        pending.commit()
+        stats["seconds"] = time.perf_counter() - started
+        return stats
+
+
+def main():
+    from ingest import NewsTable
+
+    parser = argparse.ArgumentParser(description="Encode the news corpus into an embedding store.")
+    parser.add_argument("--csv", default=os.path.join(os.path.dirname(__file__), "news_data_dedup.csv"))
+    parser.add_argument("--store", default=os.path.join(os.path.dirname(__file__), "embeddings"))
+    parser.add_argument("--model", default=os.environ.get("EMBEDDING_MODEL", "BAAI/bge-base-en-v1.5"))
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--near-duplicate-bits", type=int, default=NEAR_DUPLICATE_BITS, help="-1 disables near-duplicate collapsing")
+    args = parser.parse_args()
+
+    table = NewsTable.from_csv(args.csv)
+    texts = (table.column("title") + " " + table.column("description")).tolist()
+    pipeline = EmbeddingPipeline(
+        EmbeddingStore(args.store), args.model, workers=args.workers, batch_size=args.batch_size,
+        near_duplicate_bits=None if args.near_duplicate_bits < 0 else args.near_duplicate_bits,
+    )
+    print(json.dumps(pipeline.run(table.column("guid").tolist(), texts)))
+
+
+if __name__ == "__main__":
+    main()
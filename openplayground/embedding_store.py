@@ -0,0 +1,338 @@
+"""
+On-disk, memory-mapped store of corpus embeddings.
+
+Vectors live in one contiguous float32 .npy file, with sidecar arrays of each
+row's guid and a hash of the text it was encoded from. Opening the store maps
+the files with np.load(mmap_mode="r"), so nothing is read until it's used, and
+several processes scoring the same corpus share one copy in the page cache.
+
+    store = EmbeddingStore("embeddings")
+    store.update(guids, texts, model.encode, model_name)   # encodes only new or changed rows
+    matrix = store.matrix()                                # similarity.EmbeddingMatrix, no copy
+
+Rows are stored in the order given to `update`, so row i is NEWS_DATA[i].
+
+A row can also hold a copy of another text's vector, e.g. a near-duplicate's
+(see embedding_pipeline.py). Each row records the hash of the text its vector
+was actually encoded from, and the store records the `copies` setting that
+chose them; copies are only reused, or the store considered current, under
+the same setting, so changing or disabling it re-encodes them.
+
+Each update writes a new generation of files and then replaces manifest.json
+atomically; readers that already opened the previous generation keep their
+mapping, and files of older generations are removed. Vectors are written as
+they're encoded, so an interrupted update resumes instead of starting over.
+"""
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from similarity import EmbeddingMatrix
+
+MANIFEST = "manifest.json"
+# Progress of an update that hasn't been committed yet
+PENDING = "pending.json"
+# Reused vectors are copied into a new generation this many rows at a time
+COPY_ROWS = 65536
+
+
+def content_hash(text):
+    """16-byte digest of the text a vector was encoded from."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingStore:
+    """
+    Parameters:
+    directory (str): Where the manifest and array files live; created on the first update.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.model = None
+        self.generation = 0
+        self.vectors = None   # np.memmap of shape (N, D), float32
+        self._guids = None    # np.ndarray of bytes
+        self._hashes = None   # np.ndarray of shape (N, 16), uint8 digests
+        self._sources = None  # digests of the texts the vectors were encoded from; None if every row is its own
+        self.copies = None    # setting that chose the copied rows, e.g. "simhash:3"
+        self._positions = None
+        self._open()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _open(self):
+        try:
+            with open(self._path(MANIFEST)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+        self.model = manifest["model"]
+        self.generation = manifest["generation"]
+        self.vectors = np.load(self._path(manifest["vectors"]), mmap_mode="r")
+        self._guids = np.load(self._path(manifest["guids"]), mmap_mode="r")
+        self._hashes = np.load(self._path(manifest["hashes"]), mmap_mode="r")
+        # Stores written before copies were tracked have no sources file
+        self._sources = np.load(self._path(manifest["sources"]), mmap_mode="r") if "sources" in manifest else None
+        self.copies = manifest.get("copies")
+        self._positions = None
+
+    def __len__(self):
+        return 0 if self.vectors is None else self.vectors.shape[0]
+
+    def __contains__(self, guid):
+        return guid in self._position_index()
+
+    @property
+    def dim(self):
+        return None if self.vectors is None else self.vectors.shape[1]
+
+    @property
+    def guids(self):
+        return [] if self._guids is None else [guid.decode() for guid in self._guids]
+
+    def _position_index(self):
+        if self._positions is None:
+            self._positions = {guid: i for i, guid in enumerate(self.guids)}
+        return self._positions
+
+    def position(self, guid):
+        """Row number of a guid; raises KeyError if it isn't stored."""
+        return self._position_index()[guid]
+
+    def vector(self, guid):
+        return self.vectors[self.position(guid)]
+
+    def matrix(self):
+        """An EmbeddingMatrix over the mapped vectors, without copying them."""
+        if self.vectors is None:
+            raise ValueError(f"No embeddings stored in {self.directory}")
+        return EmbeddingMatrix(self.vectors)
+
+    def _stored_hashes(self):
+        return [] if self._hashes is None else [digest.tobytes() for digest in self._hashes]
+
+    def _copied(self):
+        """Positions whose vector was encoded from another text."""
+        if self._sources is None:
+            return np.zeros(len(self), dtype=bool)
+        return (np.asarray(self._sources) != np.asarray(self._hashes)).any(axis=1)
+
+    def is_current(self, guids, texts, model, copies=None):
+        """True if the store holds exactly these rows, in this order, encoded by this model under `copies`."""
+        return self._is_current(list(guids), [content_hash(text) for text in texts], model, copies)
+
+    def _is_current(self, guids, hashes, model, copies=None):
+        if self.vectors is None or model != self.model or len(guids) != len(self):
+            return False
+        if copies != self.copies and self._copied().any():
+            return False
+        return self.guids == guids and self._stored_hashes() == hashes
+
+    def prepare(self, guids, texts, model, copies=None):
+        """
+        Start (or resume) writing a new generation for these rows.
+
+        A stored vector is reused when its text hash matches and it came from
+        the same model, whatever guid or position it had before; a copied
+        vector only when `copies` names the setting that chose it (None: no
+        copies are reused). If an earlier update of the same rows was
+        interrupted, its progress is picked up.
+
+        Returns:
+        PendingUpdate: Rows still to encode are in `missing`; None if the store is already current.
+        """
+        guids, texts = list(guids), list(texts)
+        if len(guids) != len(texts):
+            raise ValueError(f"Got {len(guids)} guids but {len(texts)} texts")
+        if len(set(guids)) != len(guids):
+            raise ValueError("guids must be unique")
+        hashes = [content_hash(text) for text in texts]
+        if self._is_current(guids, hashes, model, copies):
+            return None
+
+        pending = PendingUpdate.resume(self, guids, hashes, model, copies)
+        if pending is not None:
+            return pending
+        reusable = {}
+        if self.vectors is not None and model == self.model:
+            copied = self._copied() if copies is None or copies != self.copies else np.zeros(len(self), dtype=bool)
+            reusable = {digest: i for i, digest in enumerate(self._stored_hashes()) if not copied[i]}
+        sources = {i: reusable[digest] for i, digest in enumerate(hashes) if digest in reusable}
+        generation = max(self.generation, PendingUpdate.last_generation(self)) + 1
+        pending = PendingUpdate(self, generation, guids, hashes, model, copies)
+        if sources:
+            pending.create(self.dim, sources)
+        return pending
+
+    def update(self, guids, texts, encode, model, batch_size=256):
+        """
+        Store vectors for these rows, encoding only texts not already stored.
+
+        Each batch is on disk as soon as it's encoded, so an interrupted
+        update resumes where it stopped; see prepare().
+
+        Parameters:
+        guids (list of str): Row ids, unique, in corpus order.
+        texts (list of str): The text to embed for each row.
+        encode (callable): Takes a list of texts and returns an array of shape (len(texts), D).
+        model (str): Name of the embedding model; changing it re-encodes everything.
+        batch_size (int): Texts per call to `encode`.
+
+        Returns:
+        int: How many rows were encoded.
+        """
+        texts = list(texts)
+        pending = self.prepare(guids, texts, model)
+        if pending is None:
+            return 0
+        missing = pending.missing
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            pending.write(batch, encode([texts[i] for i in batch]))
+        pending.commit()
+        return len(missing)
+
+
+class PendingUpdate:
+    """
+    A generation being written. Vectors land in its .npy file as they're
+    encoded and a per-row flag file records which are written, so a run that
+    is interrupted can be resumed by preparing the same rows again.
+    """
+
+    def __init__(self, store, generation, guids, hashes, model, copies=None):
+        self.store = store
+        self.generation = generation
+        self.guids = guids
+        self.hashes = hashes
+        self.model = model
+        self.copies = copies
+        self.names = {kind: f"{kind}-{generation}.npy" for kind in ("vectors", "guids", "hashes", "sources")}
+        self._done_name = f"done-{generation}.npy"
+        self._vectors = None
+        self._sources = None
+        self._done = None
+
+    @staticmethod
+    def _fingerprint(guids, hashes, model, copies=None):
+        digest = hashlib.blake2b(f"{model}\0{copies}".encode("utf-8"), digest_size=16)
+        for guid, content in zip(guids, hashes):
+            digest.update(guid.encode("utf-8") + b"\0" + content)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _read(store):
+        try:
+            with open(store._path(PENDING)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def last_generation(cls, store):
+        state = cls._read(store)
+        return state["generation"] if state else 0
+
+    @classmethod
+    def resume(cls, store, guids, hashes, model, copies=None):
+        state = cls._read(store)
+        if state is None or state["fingerprint"] != cls._fingerprint(guids, hashes, model, copies):
+            return None
+        pending = cls(store, state["generation"], guids, hashes, model, copies)
+        try:
+            pending._vectors = np.load(store._path(pending.names["vectors"]), mmap_mode="r+")
+            pending._sources = np.load(store._path(pending.names["sources"]), mmap_mode="r+")
+            pending._done = np.load(store._path(pending._done_name), mmap_mode="r+")
+        except FileNotFoundError:
+            return None
+        return pending
+
+    @property
+    def missing(self):
+        """Rows not written yet."""
+        if self._done is None:
+            return list(range(len(self.guids)))
+        return np.flatnonzero(self._done == 0).tolist()
+
+    def create(self, dim, sources=None):
+        """Allocate the generation's files and copy reused vectors, {row: stored position}, into them."""
+        os.makedirs(self.store.directory, exist_ok=True)
+        self._vectors = np.lib.format.open_memmap(
+            self.store._path(self.names["vectors"]), mode="w+", dtype=np.float32, shape=(len(self.guids), dim)
+        )
+        self._sources = np.lib.format.open_memmap(
+            self.store._path(self.names["sources"]), mode="w+", dtype=np.uint8, shape=(len(self.guids), 16)
+        )
+        self._done = np.lib.format.open_memmap(
+            self.store._path(self._done_name), mode="w+", dtype=np.uint8, shape=(len(self.guids),)
+        )
+        stored = self.store._sources if self.store._sources is not None else self.store._hashes
+        kept = sorted((sources or {}).items())
+        for start in range(0, len(kept), COPY_ROWS):
+            rows, positions = zip(*kept[start:start + COPY_ROWS])
+            self._vectors[list(rows)] = self.store.vectors[list(positions)]
+            self._sources[list(rows)] = stored[list(positions)]
+        self._mark(list((sources or {}).keys()))
+        _write_json(self.store._path(PENDING), {
+            "generation": self.generation,
+            "fingerprint": self._fingerprint(self.guids, self.hashes, self.model, self.copies),
+        })
+
+    def _mark(self, rows):
+        # Vectors reach the file before the flags that say they're there
+        self._vectors.flush()
+        self._sources.flush()
+        self._done[rows] = 1
+        self._done.flush()
+
+    def write(self, rows, vectors):
+        """Store encoded vectors for rows (positions in the new generation)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self._vectors is None:
+            self.create(vectors.shape[1])
+        self._vectors[rows] = vectors
+        self._sources[rows] = np.frombuffer(b"".join(self.hashes[i] for i in rows), dtype=np.uint8).reshape(-1, 16)
+        self._mark(rows)
+
+    def copy(self, rows, sources):
+        """Give rows the vectors already written for sources, e.g. near-duplicate texts; recorded as copies."""
+        if rows:
+            self._vectors[rows] = self._vectors[sources]
+            self._sources[rows] = self._sources[sources]
+            self._mark(rows)
+
+    def commit(self):
+        """Make this generation current once every row is written."""
+        if self._vectors is None:
+            raise ValueError("Cannot create an empty embedding store")
+        if self.missing:
+            raise ValueError(f"{len(self.missing)} rows have no vector yet")
+        dim = self._vectors.shape[1]
+        self._vectors.flush()
+        self._sources.flush()
+        self._vectors = self._sources = self._done = None
+        store = self.store
+        np.save(store._path(self.names["guids"]), np.array([guid.encode() for guid in self.guids], dtype=bytes))
+        np.save(store._path(self.names["hashes"]),
+                np.frombuffer(b"".join(self.hashes), dtype=np.uint8).reshape(-1, 16))
+        _write_json(store._path(MANIFEST), {
+            "model": self.model, "copies": self.copies, "generation": self.generation, "count": len(self.guids),
+            "dim": dim, **self.names,
+        })
+        os.remove(store._path(PENDING))
+        store._open()
+        for path in glob.glob(store._path("*-*.npy")):
+            if os.path.basename(path) not in self.names.values():
+                os.remove(path)
+
+
+def _write_json(path, data):
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
@@ -0,0 +1,121 @@
+"""
+Hybrid retrieval: several retrievers run concurrently, fused with reciprocal rank fusion.
+
+Each retriever is a callable that takes a list of queries and a depth k and
+returns one ranked list of document indices per query. HybridRetriever calls
+them on a thread pool (NumPy and bm25s release the GIL for the heavy parts, so
+dense and keyword search overlap) and fuses their rankings with weighted RRF:
+
+    score(d) = sum over retrievers r of weight_r / (K + rank_r(d))    (rank from 1)
+
+    hybrid = HybridRetriever({"semantic": dense, "bm25": keyword}, weights={"bm25": 0.5})
+    indices, scores = hybrid.retrieve("Should I invest in startups?", top_k=5)
+    results = hybrid.retrieve_batch(queries, top_k=5)
+
+Results are cached per (query, top_k, retriever) in a bounded LRU, both for
+each retriever's ranking and for the fused one.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from lru import LRUCache
+
+# The constant from the original RRF paper; larger values flatten the rank weighting
+RRF_K = 60
+
+
+def fuse(rankings, top_k, weights=None, k=RRF_K):
+    """
+    Weighted reciprocal rank fusion of ranked lists.
+
+    Parameters:
+    rankings (list of list of int): Document indices per retriever, best first.
+    top_k (int): How many fused results to return.
+    weights (list of float): Weight per ranking; defaults to 1 each.
+    k (int): The RRF constant.
+
+    Returns:
+    tuple: (indices, scores), best first. Equal scores keep the order in which
+    documents first appear across the rankings.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, index in enumerate(ranking, start=1):
+            scores[index] = scores.get(index, 0.0) + weight / (k + rank)
+    # sorted() is stable, so ties stay in first-appearance order
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [index for index, _ in fused], [score for _, score in fused]
+
+
+class HybridRetriever:
+    """
+    Parameters:
+    retrievers (dict): name -> callable(queries, k) returning a ranked list of indices per query.
+    weights (dict): name -> RRF weight; retrievers not listed weigh 1.
+    depth (int): Candidates taken from each retriever; defaults to the requested top_k.
+    k (int): The RRF constant.
+    cache_size (int): Entries kept in the result cache; 0 disables it.
+    """
+
+    def __init__(self, retrievers, weights=None, depth=None, k=RRF_K, cache_size=1024):
+        self.retrievers = dict(retrievers)
+        self.weights = {name: 1.0 for name in self.retrievers}
+        self.weights.update(weights or {})
+        self.depth = depth
+        self.k = k
+        self.cache = LRUCache(cache_size) if cache_size else None
+        self._executor = ThreadPoolExecutor(max_workers=len(self.retrievers), thread_name_prefix="retriever")
+
+    def _cached(self, key):
+        return self.cache.get(key) if self.cache is not None else None
+
+    def _store(self, key, value):
+        if self.cache is not None:
+            self.cache.put(key, value)
+
+    def rankings(self, queries, k):
+        """Each retriever's ranking of each query, fetched concurrently: {name: [ranking per query]}."""
+        results = {name: [None] * len(queries) for name in self.retrievers}
+        futures = {}
+        for name, retriever in self.retrievers.items():
+            missing = []
+            for i, query in enumerate(queries):
+                cached = self._cached((query, k, name))
+                if cached is None:
+                    missing.append(i)
+                else:
+                    results[name][i] = cached
+            if missing:
+                futures[name] = (missing, self._executor.submit(retriever, [queries[i] for i in missing], k))
+        for name, (missing, future) in futures.items():
+            for i, ranking in zip(missing, future.result()):
+                ranking = tuple(int(index) for index in ranking)
+                results[name][i] = ranking
+                self._store((queries[i], k, name), ranking)
+        return results
+
+    def retrieve_batch(self, queries, top_k=5):
+        """Fused (indices, scores) for each query, in order."""
+        queries = list(queries)
+        weights_key = tuple(sorted(self.weights.items()))
+        output = [self._cached((query, top_k, ("hybrid", weights_key, self.k))) for query in queries]
+        missing = [i for i, result in enumerate(output) if result is None]
+        if missing:
+            depth = max(top_k, self.depth or 0)
+            rankings = self.rankings([queries[i] for i in missing], depth)
+            names = list(self.retrievers)
+            for position, i in enumerate(missing):
+                indices, scores = fuse(
+                    [rankings[name][position] for name in names], top_k, [self.weights[name] for name in names], self.k
+                )
+                output[i] = (tuple(indices), tuple(scores))
+                self._store((queries[i], top_k, ("hybrid", weights_key, self.k)), output[i])
+        return [(list(indices), list(scores)) for indices, scores in output]
+
+    def retrieve(self, query, top_k=5):
+        """Fused (indices, scores) for one query, best first."""
+        return self.retrieve_batch([query], top_k)[0]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,146 @@
+"""
+Chunked, columnar ingestion of the news CSV.
+
+The CSV is read in chunks of CHUNK_ROWS. Date columns are normalized to
+"YYYY-MM-DD" per chunk with vectorized string and datetime operations,
+instead of a dateutil parse per cell. Rows are never materialized as dicts:
+
+    for chunk in iter_chunks(path):        # one DataFrame at a time; memory stays flat
+        ...
+    for row in iter_records(path):         # one lazy row view at a time
+        row["title"]
+
+    table = NewsTable.from_csv(path)       # whole corpus, one NumPy array per column
+    table[863]["title"]                    # a lazy view of row 863
+    table.column("title")                  # the whole column
+
+All columns are read as strings and empty cells stay "" rather than NaN, so
+`title + " " + description` is always defined.
+"""
+import re
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+from dateutil import parser
+
+CHUNK_ROWS = 50000
+DATE_COLUMNS = ("published_at", "updated_at")
+
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}(?:[ T]|$)")
+
+
+def _format_date(date_string):
+    return parser.parse(date_string).strftime("%Y-%m-%d")
+
+
+def format_dates(series):
+    """
+    Normalize a column of timestamps to "YYYY-MM-DD", as written (no timezone conversion).
+
+    ISO timestamps, the common case, are sliced and validated in one
+    vectorized pass; other formats are parsed with pandas, and only columns
+    that pandas can't parse as a whole fall back to dateutil per cell.
+    """
+    if series.str.match(_ISO_DATE).all():
+        dates = series.str.slice(0, 10)
+        # Validates, e.g. rejects 2024-02-30
+        pd.to_datetime(dates, format="%Y-%m-%d")
+        return dates
+    try:
+        return pd.to_datetime(series, format="mixed").dt.strftime("%Y-%m-%d")
+    except (ValueError, TypeError):
+        # e.g. timestamps with differing UTC offsets, which pandas won't combine
+        return series.map(_format_date)
+
+
+def iter_chunks(path, chunksize=CHUNK_ROWS, date_columns=DATE_COLUMNS):
+    """Yield the CSV as DataFrames of up to chunksize string columns, with dates normalized."""
+    with pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunksize) as reader:
+        for chunk in reader:
+            for column in date_columns:
+                if column in chunk.columns:
+                    chunk[column] = format_dates(chunk[column])
+            yield chunk
+
+
+def iter_records(path, chunksize=CHUNK_ROWS):
+    """Yield lazy row views over the CSV, holding one chunk in memory at a time."""
+    for chunk in iter_chunks(path, chunksize):
+        yield from NewsTable.from_frame(chunk)
+
+
+class Row(Mapping):
+    """A read-only view of one table row; values are read from the columns on access."""
+
+    __slots__ = ("_columns", "_index")
+
+    def __init__(self, columns, index):
+        self._columns = columns
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._columns[key][self._index]
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def to_dict(self):
+        return {key: column[self._index] for key, column in self._columns.items()}
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class NewsTable(Sequence):
+    """
+    Rows stored column by column, each column one NumPy array.
+
+    Indexing with an int returns a Row view; with a slice, a NewsTable over
+    views of the same arrays.
+    """
+
+    def __init__(self, columns):
+        self._columns = dict(columns)
+        lengths = {len(column) for column in self._columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+        self._length = lengths.pop() if lengths else 0
+
+    @classmethod
+    def from_frame(cls, frame):
+        return cls({name: frame[name].to_numpy(dtype=object) for name in frame.columns})
+
+    @classmethod
+    def from_csv(cls, path, chunksize=CHUNK_ROWS):
+        parts = {}
+        for chunk in iter_chunks(path, chunksize):
+            for name in chunk.columns:
+                parts.setdefault(name, []).append(chunk[name].to_numpy(dtype=object))
+        return cls({name: np.concatenate(arrays) for name, arrays in parts.items()})
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def column(self, name):
+        return self._columns[name]
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return NewsTable({name: column[index] for name, column in self._columns.items()})
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("row index out of range")
+        return Row(self._columns, index)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield Row(self._columns, index)
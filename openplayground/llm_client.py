@@ -0,0 +1,452 @@
+"""
+Concurrent chat-completion client shared by the LLM helpers.
+
+Every request runs on one event loop in a background thread, so the same
+connection pools serve scripts, threads and notebooks (whose own loop is
+already running):
+
+    client = default_client()
+    reply = client.chat(messages, model="meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo")    # blocking
+    replies = client.gather([{"messages": m, "model": model} for m in conversations])     # concurrent
+    reply = await client.achat(messages, model=model)                                      # from async code
+
+Replies are {"role", "content"} dicts. For each provider the client keeps one
+httpx.AsyncClient, whose keep-alive connections are reused across calls, and a
+semaphore capping its requests in flight. Responses with status 429 or 5xx,
+and requests that fail to connect or time out, are retried with full-jitter
+exponential backoff, honoring Retry-After. Identical requests that are in
+flight at the same time share one HTTP call. Given a ResponseCache, the
+client answers repeated deterministic requests (temperature 0) from it.
+
+stream() and astream() yield the reply's text as the provider sends it
+(server-sent events), and record the time to the first token:
+
+    stream = client.stream(messages, model=model)
+    for text in stream:
+        print(text, end="")
+    stream.first_token_seconds, stream.seconds
+
+A streamed request is retried only until its first token arrives.
+"""
+import asyncio
+import atexit
+import json
+import os
+import queue
+import random
+import statistics
+import threading
+import time
+from collections import deque
+
+import httpx
+
+from response_cache import ResponseCache
+
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Streams whose timings stats() summarizes
+TIMINGS_KEPT = 1000
+DEFAULT_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+# Response cache of default_client(); LLM_CACHE=0 turns it off
+LLM_CACHE = os.environ.get("LLM_CACHE", "1") != "0"
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(os.path.dirname(__file__), "llm_cache.sqlite"))
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 30 * 86400))
+
+
+class LLMError(Exception):
+    """A request that failed for good: a non-retryable status, or retries ran out."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class Provider:
+    """
+    Parameters:
+    name (str): Used to pick the provider per request.
+    base_url (str): OpenAI-compatible API root; requests go to {base_url}/chat/completions.
+    api_key_env (str): Environment variable holding the API key, read per request; None sends no key.
+    max_concurrency (int): Requests in flight at once.
+    verify (bool): Verify TLS certificates.
+    transport (httpx.AsyncBaseTransport): Replaces the network, e.g. httpx.MockTransport for a stub server.
+    """
+
+    def __init__(self, name, base_url, api_key_env=None, max_concurrency=DEFAULT_CONCURRENCY, verify=True,
+                 transport=None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_key_env = api_key_env
+        self.max_concurrency = max_concurrency
+        self.verify = verify
+        self.transport = transport
+
+    def headers(self, api_key=None):
+        api_key = api_key or (os.environ.get(self.api_key_env) if self.api_key_env else None)
+        return {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+
+def default_providers():
+    return [
+        Provider("together", "https://api.together.xyz/v1", "TOGETHER_API_KEY"),
+        # The course proxy needs no key (and serves a certificate that doesn't verify)
+        Provider("together-proxy", "https://proxy.dlai.link/coursera_proxy/together/v1", verify=False),
+        Provider("openai", "https://api.openai.com/v1", "OPENAI_API_KEY"),
+    ]
+
+
+def _backoff(attempt, retry_after=None):
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    try:
+        return max(delay, float(retry_after)) if retry_after else delay
+    except ValueError:
+        # Retry-After given as an HTTP date; the jittered delay will do
+        return delay
+
+
+class LLMClient:
+    """
+    Parameters:
+    providers (list of Provider): Available providers; the first is the default.
+    max_retries (int): Retries after the first attempt of a request.
+    cache (ResponseCache): Answers deterministic requests it has seen before; None disables caching.
+    """
+
+    def __init__(self, providers=None, max_retries=MAX_RETRIES, cache=None):
+        self.providers = {provider.name: provider for provider in (providers or default_providers())}
+        self.cache = cache
+        self.default_provider = next(iter(self.providers))
+        self.max_retries = max_retries
+        self.requests = 0
+        self.coalesced = 0
+        self.retries = 0
+        self._http = {}
+        self._semaphores = {}
+        self._in_flight = {}
+        self._timings = deque(maxlen=TIMINGS_KEPT)   # (first token, total) seconds per stream
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-client", daemon=True)
+        self._thread.start()
+
+    def _connection(self, name):
+        # Only touched from the client's loop, so no lock is needed
+        if name not in self._http:
+            provider = self.providers[name]
+            limits = httpx.Limits(max_connections=provider.max_concurrency,
+                                  max_keepalive_connections=provider.max_concurrency)
+            self._http[name] = httpx.AsyncClient(base_url=provider.base_url, verify=provider.verify, limits=limits,
+                                                 timeout=TIMEOUT, transport=provider.transport)
+            self._semaphores[name] = asyncio.Semaphore(provider.max_concurrency)
+        return self._http[name], self._semaphores[name]
+
+    async def _post(self, name, payload, api_key):
+        http, semaphore = self._connection(name)
+        headers = self.providers[name].headers(api_key)
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            async with semaphore:
+                try:
+                    response = await http.post("/chat/completions", json=payload, headers=headers)
+                except (httpx.TransportError, httpx.TimeoutException) as e:
+                    if attempt == self.max_retries:
+                        raise LLMError(f"Error while calling LLM: {e!r}") from e
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                        if response.is_error:
+                            raise LLMError(f"Error while calling LLM: {response.text}", response.status_code)
+                        return self._reply(response)
+                    retry_after = response.headers.get("Retry-After")
+            # Back off outside the semaphore so other requests can use the slot
+            self.retries += 1
+            await asyncio.sleep(_backoff(attempt, retry_after))
+
+    # The cache reads and writes SQLite, so it runs off the event loop that every request shares
+    async def _cache_get(self, payload):
+        return await asyncio.to_thread(self.cache.get, payload) if self.cache is not None else None
+
+    async def _cache_put(self, payload, reply):
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, payload, reply)
+
+    async def _post_and_cache(self, name, payload, api_key):
+        reply = await self._post(name, payload, api_key)
+        await self._cache_put(payload, reply)
+        return reply
+
+    @staticmethod
+    def _reply(response):
+        try:
+            message = response.json()["choices"][-1]["message"]
+            return {"role": message["role"], "content": message["content"]}
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise LLMError(f"Failed to get correct output from LLM call.\nException: {e}\nResponse: {response.text}")
+
+    async def _chat(self, messages, model, provider=None, api_key=None, **params):
+        name = provider or self.default_provider
+        payload = {"model": model, "messages": messages, **params}
+        self.requests += 1
+        cached = await self._cache_get(payload)
+        if cached is not None:
+            return cached
+        key = (name, api_key, json.dumps(payload, sort_keys=True, default=str))
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._loop.create_task(self._post_and_cache(name, payload, api_key))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: one caller being cancelled doesn't cancel the call the others are waiting on
+        reply = await asyncio.shield(task)
+        return dict(reply)
+
+    async def _gather(self, requests, return_exceptions):
+        return await asyncio.gather(*(self._chat(**request) for request in requests),
+                                    return_exceptions=return_exceptions)
+
+    async def _stream(self, name, payload, api_key, deliver):
+        """Send the reply's text to deliver("chunk", text) as it arrives, then deliver("done", reply)."""
+        try:
+            cached = await self._cache_get(payload)
+            if cached is not None:
+                deliver("chunk", cached["content"])
+                deliver("done", cached)
+                return
+            http, semaphore = self._connection(name)
+            headers = self.providers[name].headers(api_key)
+            parts = []
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
+                async with semaphore:
+                    try:
+                        async with http.stream("POST", "/chat/completions", json={**payload, "stream": True},
+                                               headers=headers) as response:
+                            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                                retry_after = response.headers.get("Retry-After")
+                            elif response.is_error:
+                                await response.aread()
+                                raise LLMError(f"Error while calling LLM: {response.text}", response.status_code)
+                            else:
+                                role = "assistant"
+                                async for line in response.aiter_lines():
+                                    delta = _stream_delta(line)
+                                    if delta is None:
+                                        continue
+                                    role = delta.get("role") or role
+                                    if delta.get("content"):
+                                        parts.append(delta["content"])
+                                        deliver("chunk", delta["content"])
+                                reply = {"role": role, "content": "".join(parts)}
+                                await self._cache_put(payload, reply)
+                                deliver("done", reply)
+                                return
+                    except (httpx.TransportError, httpx.TimeoutException) as e:
+                        # Text already shown can't be taken back, so only retry before the first token
+                        if parts or attempt == self.max_retries:
+                            raise LLMError(f"Error while calling LLM: {e!r}") from e
+                self.retries += 1
+                await asyncio.sleep(_backoff(attempt, retry_after))
+        except Exception as e:
+            deliver("error", e)
+
+    def _record(self, first_token_seconds, seconds):
+        self._timings.append((first_token_seconds, seconds))
+
+    def _submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def chat(self, messages, model, provider=None, api_key=None, **params):
+        """
+        One chat completion, blocking until it's done.
+
+        Parameters:
+        messages (list of dict): {"role", "content"} messages.
+        model (str): Model name, as the provider knows it.
+        provider (str): Name of the provider to call; defaults to the first one.
+        api_key (str): Overrides the provider's key for this request.
+        **params: Further payload fields, e.g. temperature, top_p, max_tokens.
+
+        Returns:
+        dict: The reply's "role" and "content".
+        """
+        return self._submit(self._chat(messages, model, provider, api_key, **params)).result()
+
+    def gather(self, requests, return_exceptions=False):
+        """
+        Run several chat() requests concurrently.
+
+        Parameters:
+        requests (list of dict): Keyword arguments of chat() per request.
+        return_exceptions (bool): Return a failed request's exception in its place instead of raising it.
+
+        Returns:
+        list of dict: Replies in the order of requests.
+        """
+        return self._submit(self._gather(list(requests), return_exceptions)).result()
+
+    async def achat(self, messages, model, provider=None, api_key=None, **params):
+        """chat() for async code, on any event loop."""
+        return await asyncio.wrap_future(self._submit(self._chat(messages, model, provider, api_key, **params)))
+
+    async def agather(self, requests, return_exceptions=False):
+        """gather() for async code, on any event loop."""
+        return await asyncio.wrap_future(self._submit(self._gather(list(requests), return_exceptions)))
+
+    def _stream_request(self, messages, model, provider, api_key, params):
+        params.pop("stream", None)
+        self.requests += 1
+        return provider or self.default_provider, {"model": model, "messages": messages, **params}, api_key
+
+    def stream(self, messages, model, provider=None, api_key=None, **params):
+        """
+        One chat completion, streamed. Takes the same arguments as chat().
+
+        Returns:
+        Stream: Iterate it for the reply's text as it arrives.
+        """
+        return Stream(self, *self._stream_request(messages, model, provider, api_key, params))
+
+    def astream(self, messages, model, provider=None, api_key=None, **params):
+        """
+        stream() for async code: `async for text in client.astream(...)`, on any event loop.
+
+        Returns:
+        AsyncStream: Iterate it with async for.
+        """
+        return AsyncStream(self, *self._stream_request(messages, model, provider, api_key, params))
+
+    def stats(self):
+        stats = {"requests": self.requests, "coalesced": self.coalesced, "retries": self.retries,
+                 "in_flight": len(self._in_flight)}
+        timings = list(self._timings)
+        if timings:
+            stats["streams"] = len(timings)
+            stats["first_token_ms_p50"] = statistics.median(first for first, _ in timings) * 1e3
+            stats["stream_ms_p50"] = statistics.median(total for _, total in timings) * 1e3
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+    def close(self):
+        async def close_connections():
+            for http in self._http.values():
+                await http.aclose()
+
+        if self._loop.is_running():
+            self._submit(close_connections()).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+        if self.cache is not None:
+            self.cache.close()
+
+
+def _stream_delta(line):
+    """The message delta in one server-sent event line, or None for other lines."""
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data or data == "[DONE]":
+        return None
+    choices = json.loads(data).get("choices") or [{}]
+    choice = choices[-1]
+    if "delta" in choice:
+        return choice["delta"] or {}
+    # Completion-style events carry the text directly
+    return {"content": choice.get("text")}
+
+
+class Stream:
+    """
+    The text of one streamed completion, to iterate once.
+
+    Attributes, set as the stream progresses:
+    first_token_seconds (float): From the request to its first text.
+    seconds (float): From the request to the end of the reply.
+    reply (dict): The whole reply's "role" and "content", once finished.
+    """
+
+    def __init__(self, client, name, payload, api_key):
+        self.first_token_seconds = None
+        self.seconds = None
+        self.reply = None
+        self._client = client
+        self._started = time.perf_counter()
+        self._queue = self._make_queue()
+        self._future = client._submit(client._stream(name, payload, api_key, self._deliver))
+
+    def _make_queue(self):
+        return queue.Queue()
+
+    def _put(self, item):
+        self._queue.put(item)
+
+    def _deliver(self, kind, value):
+        # Runs on the client's loop, so timings are taken when the text arrives, not when it's read
+        elapsed = time.perf_counter() - self._started
+        if kind == "chunk" and self.first_token_seconds is None:
+            self.first_token_seconds = elapsed
+        elif kind == "done":
+            self.reply = value
+            self.seconds = elapsed
+            self._client._record(self.first_token_seconds if self.first_token_seconds is not None else elapsed,
+                                 elapsed)
+        self._put((kind, value))
+
+    def _handle(self, kind, value):
+        if kind == "error":
+            raise value
+        return kind == "done"
+
+    def __iter__(self):
+        try:
+            while True:
+                kind, value = self._queue.get()
+                if self._handle(kind, value):
+                    return
+                yield value
+        finally:
+            # Abandoning the iteration stops the request
+            self._future.cancel()
+
+
+class AsyncStream(Stream):
+    """A Stream read with async for; create it on the loop that will read it."""
+
+    def _make_queue(self):
+        self._reader_loop = asyncio.get_running_loop()
+        return asyncio.Queue()
+
+    def _put(self, item):
+        self._reader_loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    def __iter__(self):
+        raise TypeError("AsyncStream is read with async for")
+
+    async def __aiter__(self):
+        try:
+            while True:
+                kind, value = await self._queue.get()
+                if self._handle(kind, value):
+                    return
+                yield value
+        finally:
+            self._future.cancel()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def default_client():
+    """The process-wide client over default_providers(), created on first use, with the LLM_CACHE_* response cache."""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            cache = ResponseCache(LLM_CACHE_PATH, ttl=LLM_CACHE_TTL) if LLM_CACHE else None
+            _default_client = LLMClient(cache=cache)
+            atexit.register(_default_client.close)
+        return _default_client
@@ -3,6 +3,8 @@ import json
 import os
 from IPython.display import HTML, display
 
+from llm_client import default_client
+
 MODEL ="gpt-4o-mini"
 # get api key from json file in secrets folder
 token = ""
@@ -18,15 +20,28 @@ except Exception as e:
 #  set env variables
 os.environ["OPENAI_API_KEY"] = token
 client = openai.OpenAI(api_key=token)
+# Completions go through the shared pooled, retrying client (llm_client.py)
+llm = default_client()
 
 def get_completion(prompt, model=MODEL, temperature=0):
     messages = [{"role": "user", "content": prompt}]
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature
-    )
-    return response.choices[0].message.content
+    return get_completion_from_messages(messages, model, temperature)
+
+def stream_completion(prompt, model=MODEL, temperature=0):
+    """get_completion, streamed: iterate the result for the reply's text as it arrives (an llm_client.Stream)."""
+    messages = [{"role": "user", "content": prompt}]
+    return llm.stream(messages, model=model, provider="openai", api_key=token, temperature=temperature)
+
+def astream_completion(prompt, model=MODEL, temperature=0):
+    """stream_completion for async code: `async for text in astream_completion(prompt)`."""
+    messages = [{"role": "user", "content": prompt}]
+    return llm.astream(messages, model=model, provider="openai", api_key=token, temperature=temperature)
+
+def get_completions(prompts, model=MODEL, temperature=0):
+    """Completions for several prompts, requested concurrently; returned in the order of prompts."""
+    requests = [{"messages": [{"role": "user", "content": prompt}], "model": model, "temperature": temperature,
+                 "provider": "openai", "api_key": token} for prompt in prompts]
+    return [reply["content"] for reply in llm.gather(requests)]
 
 """
 this function retrieves the completion for a given prompt and model.
@@ -43,13 +58,14 @@ a role can be one of ["user" or "assistant" or "system"]
 - temperature: the degree of randomness in the output (default: 0)
 """
 def get_completion_from_messages(messages, model=MODEL, temperature=0):
-    response = openai.ChatCompletion.create(
+    reply = llm.chat(
+        messages,
         model=model,
-        messages=messages,
+        provider="openai",
+        api_key=token,
         temperature=temperature, # this is the degree of randomness of the model's output
     )
-#     print(str(response.choices[0].message))
-    return response.choices[0].message["content"]
+    return reply["content"]
 
 
 def get_single_completion(target_text, action_text):
@@ -0,0 +1,171 @@
+"""
+Cache of LLM replies for deterministic requests, in memory and in SQLite.
+
+A request is cached only when its reply is reproducible: temperature 0
+(greedy decoding, where top_p has no effect) and no streaming. Anything else
+bypasses the cache. The key is a SHA-256 of the payload (model, messages and
+every sampling parameter) as canonical JSON, so key order and the provider
+or API key used don't matter:
+
+    cache = ResponseCache("llm_cache.sqlite", ttl=7 * 86400, max_entries=50000)
+    client = LLMClient(cache=cache)
+    cache.stats()   # hits per tier, misses, bypassed requests, entries
+
+Lookups try an in-memory LRU first, then SQLite; disk hits are promoted to
+memory. Entries expire `ttl` seconds after they were written. When the
+database holds more than max_entries, the least recently used rows are
+deleted.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from lru import LRUCache
+
+# Writes between checks of the database's size
+PRUNE_EVERY = 100
+
+
+def is_deterministic(payload):
+    """True if the payload asks for greedy decoding, so the same payload always gets the same reply."""
+    temperature = payload.get("temperature")
+    if isinstance(temperature, bool) or not isinstance(temperature, (int, float)) or temperature != 0:
+        return False
+    return not payload.get("stream") and payload.get("n", 1) == 1
+
+
+def cache_key(payload):
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Parameters:
+    path (str): SQLite file; None keeps the cache in memory only.
+    ttl (float): Seconds an entry stays valid; None never expires entries.
+    max_entries (int): Rows kept in the database.
+    memory_entries (int): Replies kept in the in-memory LRU.
+    """
+
+    def __init__(self, path=None, ttl=None, max_entries=100000, memory_entries=1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory = LRUCache(memory_entries)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def get(self, payload):
+        """The cached reply for a payload, or None on a miss or when the payload isn't deterministic."""
+        if not is_deterministic(payload):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        key = cache_key(payload)
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry is not None:
+            created, value = entry
+            if not self._expired(created, now):
+                with self._lock:
+                    self.memory_hits += 1
+                return dict(value)
+        if self._db is not None:
+            with self._lock:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and self._expired(row[1], now):
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    row = None
+                if row is not None:
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self.disk_hits += 1
+                    value = json.loads(row[0])
+                    self.memory.put(key, (row[1], value))
+                    return dict(value)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, payload, reply):
+        """Store a reply; ignored when the payload isn't deterministic."""
+        if not is_deterministic(payload):
+            return
+        key = cache_key(payload)
+        now = time.time()
+        self.memory.put(key, (now, dict(reply)))
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(reply), now, now),
+            )
+            self._writes += 1
+            if self._writes % PRUNE_EVERY == 0:
+                self._prune(now)
+
+    def _prune(self, now):
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def prune(self):
+        """Delete expired entries, and the least recently used ones beyond max_entries, now."""
+        if self._db is not None:
+            with self._lock:
+                self._prune(time.time())
+
+    def clear(self):
+        self.memory.clear()
+        if self._db is not None:
+            with self._lock:
+                self._db.execute("DELETE FROM responses")
+
+    def __len__(self):
+        if self._db is None:
+            return self.memory.stats()["size"]
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self):
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "memory_entries": self.memory.stats()["size"],
+            "entries": len(self),
+        }
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
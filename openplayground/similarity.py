@@ -0,0 +1,181 @@
+"""
+Vectorized similarity kernels over a 2-D embedding matrix.
+
+Scoring a query against the corpus is one matrix product instead of a Python
+loop over rows, and the corpus-side norms are computed once and cached:
+
+    matrix = EmbeddingMatrix(EMBEDDINGS)               # (N, D), stored as float32
+    scores = matrix.cosine(query_embedding)            # (N,)
+    scores = matrix.cosine(query_embeddings)           # (Q, N) for a batch of queries
+    indices, scores = matrix.top_k(query_embedding, k=5)
+
+`top_k` selects with `np.argpartition` (linear in N) and only sorts the k
+winners. Ties are broken by the lower row index, so results are deterministic.
+"""
+import numpy as np
+
+
+def as_matrix(vectors, dtype=np.float32):
+    """
+    Return vectors as a C-contiguous 2-D array of the given dtype, copying only if needed.
+
+    A single vector becomes a 1-row matrix.
+    """
+    matrix = np.asarray(vectors, dtype=dtype)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    if matrix.ndim != 2:
+        raise ValueError(f"Expected a vector or a 2-D matrix, got shape {matrix.shape}")
+    return np.ascontiguousarray(matrix)
+
+
+def _safe_divide(numerator, denominator):
+    # Zero vectors have no direction; score them 0 instead of NaN
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+
+def top_k(scores, k, largest=True):
+    """
+    Indices of the k best scores along the last axis, best first.
+
+    Parameters:
+    scores (np.ndarray): Scores of shape (N,) or (Q, N).
+    k (int): How many to select; capped at N.
+    largest (bool): True for similarities, False for distances.
+
+    Returns:
+    np.ndarray: Indices of shape (k,) or (Q, k).
+    """
+    scores = np.asarray(scores)
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    keyed = -scores if largest else scores
+    if k < n:
+        candidates = np.argpartition(keyed, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape).copy()
+    # Order the k candidates by score, then by index for ties
+    candidate_keys = np.take_along_axis(keyed, candidates, axis=-1)
+    order = np.lexsort((candidates, candidate_keys), axis=-1)
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+class EmbeddingMatrix:
+    """
+    A corpus of embeddings with cached norms, scored with matrix products.
+
+    Parameters:
+    vectors (array-like): Embeddings of shape (N, D).
+    dtype: Storage type; float32 halves memory and is what most embedding models produce.
+    """
+
+    def __init__(self, vectors, dtype=np.float32):
+        self.vectors = as_matrix(vectors, dtype)
+        self._norms = None
+        self._squared_norms = None
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    @property
+    def norms(self):
+        if self._norms is None:
+            self._norms = np.sqrt(self.squared_norms)
+        return self._norms
+
+    @property
+    def squared_norms(self):
+        if self._squared_norms is None:
+            self._squared_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+        return self._squared_norms
+
+    def append(self, vectors):
+        """Add rows to the corpus; norms are only computed for the new rows."""
+        new = as_matrix(vectors, self.vectors.dtype)
+        if new.shape[1] != self.dim:
+            raise ValueError(f"Shapes don't match: corpus dim {self.dim}, new vectors dim {new.shape[1]}")
+        squared = np.einsum("ij,ij->i", new, new)
+        self.vectors = np.concatenate([self.vectors, new])
+        if self._squared_norms is not None:
+            self._squared_norms = np.concatenate([self._squared_norms, squared])
+        if self._norms is not None:
+            self._norms = np.concatenate([self._norms, np.sqrt(squared)])
+
+    def _queries(self, queries):
+        single = np.ndim(queries) == 1
+        queries = as_matrix(queries, self.vectors.dtype)
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Shapes don't match: query dim {queries.shape[1]}, corpus dim {self.dim}")
+        return queries, single
+
+    def dot(self, queries):
+        """Inner products, shape (N,) for one query or (Q, N) for a batch."""
+        queries, single = self._queries(queries)
+        scores = queries @ self.vectors.T
+        return scores[0] if single else scores
+
+    def cosine(self, queries):
+        """Cosine similarities, shape (N,) for one query or (Q, N) for a batch."""
+        queries, single = self._queries(queries)
+        query_norms = np.sqrt(np.einsum("ij,ij->i", queries, queries))
+        scores = _safe_divide(queries @ self.vectors.T, np.outer(query_norms, self.norms))
+        return scores[0] if single else scores
+
+    def euclidean(self, queries):
+        """
+        Euclidean distances, shape (N,) for one query or (Q, N) for a batch.
+
+        Uses |q - x|^2 = |q|^2 + |x|^2 - 2 q.x so the work is one matrix
+        product; rounding can make the expansion slightly negative, so it's
+        clipped at 0.
+        """
+        queries, single = self._queries(queries)
+        query_squared = np.einsum("ij,ij->i", queries, queries)
+        squared = query_squared[:, np.newaxis] + self.squared_norms[np.newaxis, :] - 2 * (queries @ self.vectors.T)
+        distances = np.sqrt(np.maximum(squared, 0, out=squared), out=squared)
+        return distances[0] if single else distances
+
+    def top_k(self, queries, k, metric="cosine"):
+        """
+        The k nearest rows for one query or a batch.
+
+        Parameters:
+        queries (array-like): A query vector (D,) or a batch (Q, D).
+        k (int): How many rows to return per query.
+        metric (str): "cosine", "dot" or "euclidean".
+
+        Returns:
+        tuple: (indices, scores), each of shape (k,) or (Q, k), best first.
+        """
+        if metric == "cosine":
+            scores, largest = self.cosine(queries), True
+        elif metric == "dot":
+            scores, largest = self.dot(queries), True
+        elif metric == "euclidean":
+            scores, largest = self.euclidean(queries), False
+        else:
+            raise ValueError(f"Unknown metric '{metric}': expected cosine, dot or euclidean")
+        indices = top_k(scores, k, largest)
+        return indices, np.take_along_axis(scores, indices, axis=-1)
+
+
+def cosine_similarity(queries, vectors, dtype=np.float64):
+    """
+    Cosine similarity between one or more queries and each vector.
+
+    Returns shape (N,) for one query or (Q, N) for a batch. For repeated
+    queries against the same vectors, use EmbeddingMatrix so the norms are
+    computed once.
+    """
+    return EmbeddingMatrix(vectors, dtype).cosine(queries)
+
+
+def euclidean_distance(queries, vectors, dtype=np.float64):
+    """Euclidean distance between one or more queries and each vector; see cosine_similarity."""
+    return EmbeddingMatrix(vectors, dtype).euclidean(queries)
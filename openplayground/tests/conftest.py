@@ -0,0 +1,5 @@
+# The playground's modules import each other by plain name, so the tests put openplayground/ on the path.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from context_packing import SEPARATOR, ContextPacker, TokenCounter
+
+
+def article(i, sentences=3):
+    body = " ".join(f"Article {i} reports development number {j} in the ongoing story today." for j in range(sentences))
+    return f"Title: Story {i}\nPublished at: 2024-04-25\nDescription: {body}\nURL: https://example.com/{i}"
+
+
+@pytest.fixture
+def counter():
+    return TokenCounter()
+
+
+@pytest.mark.parametrize("budget", [1, 5, 20, 60, 200, 1500])
+@pytest.mark.parametrize("min_tokens", [1, 48, 1000])
+def test_packed_text_never_exceeds_budget(counter, budget, min_tokens):
+    rng = random.Random(budget * 7 + min_tokens)
+    documents = [(i, article(i, rng.randint(1, 12))) for i in range(25)]
+    packed = ContextPacker(budget, counter, min_tokens=min_tokens).pack(documents)
+    assert packed.tokens <= budget
+    assert counter.count(packed.text) == packed.tokens
+    assert set(packed.keys) | set(packed.dropped) == {key for key, _ in documents}
+
+
+def test_everything_fits_under_a_large_budget(counter):
+    documents = [(i, article(i)) for i in range(3)]
+    packed = ContextPacker(10000, counter).pack(documents)
+    assert packed.keys == [0, 1, 2]
+    assert packed.text == SEPARATOR.join(text for _, text in documents)
+    assert packed.truncated == packed.dropped == []
+
+
+def test_scores_order_documents(counter):
+    documents = [("low", article(1)), ("high", article(2))]
+    packed = ContextPacker(10000, counter).pack(documents, scores=[0.1, 0.9])
+    assert packed.keys == ["high", "low"]
+
+
+def test_document_is_truncated_into_the_remainder(counter):
+    documents = [(0, article(0, 1)), (1, article(1, 30))]
+    budget = counter.count(documents[0][1]) + 80
+    packed = ContextPacker(budget, counter, min_tokens=20).pack(documents)
+    assert packed.keys == [0, 1]
+    assert packed.truncated == [1]
+    assert packed.text.endswith("…")
+    assert packed.tokens <= budget
+
+
+def test_repeated_sentences_are_dropped(counter):
+    shared = "The central bank raised interest rates by half a point on Tuesday."
+    documents = [("a", f"Description: {shared} Markets fell sharply after the announcement was made."),
+                 ("b", f"Description: {shared}"),
+                 ("c", f"Description: {shared} Analysts expect another increase before the end of the year.")]
+    packed = ContextPacker(10000, counter).pack(documents)
+    assert packed.keys == ["a", "c"]
+    assert packed.dropped == ["b"]
+    assert packed.text.count(shared) == 1
+
+
+def test_dropped_document_does_not_mark_its_sentences_seen(counter):
+    big = " ".join(f"Sentence number {i} talks about the quarterly economic outlook today." for i in range(40))
+    small = "Sentence number 0 talks about the quarterly economic outlook today. Markets rallied."
+    packed = ContextPacker(60, counter, min_tokens=1000).pack([("big", big), ("small", small)])
+    assert packed.keys == ["small"]
+    assert packed.dropped == ["big"]
+
+
+def test_stats_accumulate(counter):
+    packer = ContextPacker(50, counter)
+    documents = [(i, article(i, 5)) for i in range(5)]
+    first = packer.pack(documents)
+    second = packer.pack(documents)
+    stats = packer.stats()
+    assert stats["packs"] == 2
+    assert stats["tokens_packed"] == first.tokens + second.tokens
+    assert stats["tokens_saved"] == first.tokens_saved + second.tokens_saved
+
+
+def test_truncate_respects_max_tokens(counter):
+    text = article(0, 20)
+    for max_tokens in (0, 1, 3, 10, 50, 1000):
+        cut = counter.truncate(text, max_tokens)
+        assert counter.count(cut) <= max_tokens if cut else True
+    assert counter.truncate(text, 10000) == text
@@ -1,48 +1,33 @@
-import requests
-import json
 from dateutil import parser
 import pandas as pd
 from pprint import pprint as original_pprint
+import inspect
 import os
-from together import Together
+import time
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import similarity
+from ingest import NewsTable
+from llm_client import LLMError, default_client
 
 
 # Distance formulas. 
-# In this ungraded lab, distance formulas will be implemented here. However, in future assignments, you will import functions from specialized libraries.
+# These delegate to the vectorized kernels in similarity.py: one matrix product per call instead of a
+# Python loop over rows. For repeated queries against the same embeddings, build a
+# similarity.EmbeddingMatrix once so the document norms are cached.
 def cosine_similarity(v1, array_of_vectors):
     """
     Compute the cosine similarity between a vector and an array of vectors.
     
     Parameters:
-    v1 (array-like): The first vector.
+    v1 (array-like): The first vector, or a batch of query vectors (Q, D).
     array_of_vectors (array-like): An array of vectors or a single vector.
 
     Returns:
-    list: A list of cosine similarities between v1 and each vector in array_of_vectors.
+    np.ndarray: The cosine similarities between v1 and each vector in array_of_vectors, shape (N,) or (Q, N).
     """
-    # Ensure that v1 is a numpy array
-    v1 = np.array(v1)
-    # Initialize a list to store similarities
-    similarities = []
-    
-    # Check if array_of_vectors is a single vector
-    if len(np.shape(array_of_vectors)) == 1:
-        array_of_vectors = [array_of_vectors]
-    
-    # Iterate over each vector in the array
-    for v2 in array_of_vectors:
-        # Convert the current vector to a numpy array
-        v2 = np.array(v2)
-        # Compute the dot product of v1 and v2
-        dot_product = np.dot(v1, v2)
-        # Compute the norms of the vectors
-        norm_v1 = np.linalg.norm(v1)
-        norm_v2 = np.linalg.norm(v2)
-        # Compute the cosine similarity and append to the list
-        similarity = dot_product / (norm_v1 * norm_v2)
-        similarities.append(similarity)
-    return np.array(similarities)
+    return similarity.cosine_similarity(v1, array_of_vectors)
 
 def euclidean_distance(v1, array_of_vectors):
     """
@@ -55,26 +40,9 @@ def euclidean_distance(v1, array_of_vectors):
     Returns:
     list: A list of Euclidean distances between v1 and each vector in array_of_vectors.
     """
-    # Ensure that v1 is a numpy array
-    v1 = np.array(v1)
-    # Initialize a list to store distances
-    distances = []
-    
-    # Check if array_of_vectors is a single vector
-    if len(np.shape(array_of_vectors)) == 1:
-        array_of_vectors = [array_of_vectors]
-    
-    # Iterate over each vector in the array
-    for v2 in array_of_vectors:
-        # Convert the current vector to a numpy array
-        v2 = np.array(v2)
-        # Check if the input arrays have the same shape
-        if v1.shape != v2.shape:
-            raise ValueError(f"Shapes don't match: v1 shape: {v1.shape}, v2 shape: {v2.shape}")
-        # Calculate the Euclidean distance and append to the list
-        dist = np.sqrt(np.sum((v1 - v2) ** 2))
-        distances.append(dist)
-    return distances
+    if np.shape(v1)[-1] != np.shape(array_of_vectors)[-1]:
+        raise ValueError(f"Shapes don't match: v1 shape: {np.shape(v1)}, array_of_vectors shape: {np.shape(array_of_vectors)}")
+    return list(similarity.euclidean_distance(v1, array_of_vectors))
 
 
 def format_date(date_string):
@@ -88,15 +56,7 @@ def pprint(*args, **kwargs):
     kwargs.setdefault('sort_dicts', False)
     original_pprint(*args, **kwargs)
     
-def generate_with_single_input(prompt: str, 
-                               role: str = 'assistant', 
-                               top_p: float = 0, 
-                               temperature: float = 0,
-                               max_tokens: int = 500,
-                               model: str ="meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo",
-                               together_api_key = None,
-                              **kwargs):
-    
+def _single_input_request(prompt, role, top_p, temperature, max_tokens, model, together_api_key, **kwargs):
     if top_p is None:
         top_p = 'none'
     if temperature is None:
@@ -111,43 +71,134 @@ def generate_with_single_input(prompt: str,
             **kwargs
                   }
     if (not together_api_key) and ('TOGETHER_API_KEY' not in os.environ):
-        url = os.path.join('https://proxy.dlai.link/coursera_proxy/together', 'v1/chat/completions')   
-        response = requests.post(url, json = payload, verify=False)
-        if not response.ok:
-            raise Exception(f"Error while calling LLM: f{response.text}")
-        try:
-            json_dict = json.loads(response.text)
-        except Exception as e:
-            raise Exception(f"Failed to get correct output from LLM call.\nException: {e}\nResponse: {response.text}")
+        provider = 'together-proxy'
     else:
-        if together_api_key is None:
-            together_api_key = os.environ['TOGETHER_API_KEY']
-        client = Together(api_key =  together_api_key)
-        json_dict = client.chat.completions.create(**payload).model_dump()
-        json_dict['choices'][-1]['message']['role'] = json_dict['choices'][-1]['message']['role'].name.lower()
+        provider = 'together'
+    return dict(payload, provider=provider, api_key=together_api_key)
+
+def generate_with_single_input(prompt: str, 
+                               role: str = 'assistant', 
+                               top_p: float = 0, 
+                               temperature: float = 0,
+                               max_tokens: int = 500,
+                               model: str ="meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo",
+                               together_api_key = None,
+                              **kwargs):
+    # Calls go through the shared client (llm_client.py): pooled connections, retries on 429/5xx,
+    # and identical concurrent calls coalesced into one
+    request = _single_input_request(prompt, role, top_p, temperature, max_tokens, model, together_api_key, **kwargs)
     try:
-        output_dict = {'role': json_dict['choices'][-1]['message']['role'], 'content': json_dict['choices'][-1]['message']['content']}
-    except Exception as e:
-        raise Exception(f"Failed to get correct output dict. Please try again. Error: {e}")
-    return output_dict
+        return default_client().chat(**request)
+    except LLMError as e:
+        raise Exception(str(e)) from e
 
-# Read the CSV without parsing dates
+def generate_with_single_input_stream(prompt: str, 
+                                      role: str = 'assistant', 
+                                      top_p: float = 0, 
+                                      temperature: float = 0,
+                                      max_tokens: int = 500,
+                                      model: str ="meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo",
+                                      together_api_key = None,
+                                      **kwargs):
+    """
+    generate_with_single_input, streamed: iterate the result for the reply's text as it arrives.
+
+    Returns:
+    llm_client.Stream: Yields text; afterwards .reply is the whole {'role', 'content'} and
+    .first_token_seconds / .seconds the latencies.
+    """
+    request = _single_input_request(prompt, role, top_p, temperature, max_tokens, model, together_api_key, **kwargs)
+    return default_client().stream(**request)
+
+def agenerate_with_single_input_stream(prompt: str, 
+                                       role: str = 'assistant', 
+                                       top_p: float = 0, 
+                                       temperature: float = 0,
+                                       max_tokens: int = 500,
+                                       model: str ="meta-llama/Meta-Llama-3.1-8B-Instruct-Turbo",
+                                       together_api_key = None,
+                                       **kwargs):
+    """
+    generate_with_single_input_stream for async code; call it inside a coroutine and read it with async for.
+
+    Returns:
+    llm_client.AsyncStream: Yields text as it arrives.
+    """
+    request = _single_input_request(prompt, role, top_p, temperature, max_tokens, model, together_api_key, **kwargs)
+    return default_client().astream(**request)
+
+# Read the CSV in chunks into columns, with dates formatted as "YYYY-MM-DD" (see ingest.py)
 
 def read_dataframe(path):
-    df = pd.read_csv(path)
+    """
+    Load the news CSV.
 
-    # Apply the custom date formatting function to the relevant columns
-    df['published_at'] = df['published_at'].apply(format_date)
-    df['updated_at'] = df['updated_at'].apply(format_date)
+    Returns:
+    list of dict: One dict per article. Use read_news_table for the same data stored column by column,
+    or ingest.iter_records to stream a file too large to hold in memory.
+    """
+    return [row.to_dict() for row in NewsTable.from_csv(path)]
 
-    # Convert the DataFrame to dictionary after formatting
-    df= df.to_dict(orient='records')
-    return df
+
+def read_news_table(path):
+    """
+    Load the news CSV column by column.
+
+    Returns:
+    ingest.NewsTable: A sequence of read-only row views (row['title']); table.column('title') is the whole column.
+    """
+    return NewsTable.from_csv(path)
 
 
 import ipywidgets as widgets
 from IPython.display import display, Markdown
 
+# Runs the widget's LLM calls side by side; the HTTP requests themselves share default_client()'s pools
+WIDGET_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="widget")
+# Seconds between re-renders of a streaming answer
+RENDER_INTERVAL = 0.1
+
+def _show_markdown(output, text):
+    # Setting outputs directly, rather than `with output: display(...)`, is safe from worker threads
+    output.outputs = ({'output_type': 'display_data', 'data': {'text/markdown': text, 'text/plain': text},
+                       'metadata': {}},)
+
+def _render_response(output, func, **kwargs):
+    """
+    Call an llm_call_func and show its answer in output.
+
+    The function may return the whole answer as a string, or an iterable of text pieces (e.g.
+    generate_with_single_input_stream) that is rendered as it arrives. Functions with a `stream`
+    parameter, like dostuff.llm_call, are asked for the iterable.
+
+    Returns:
+    tuple: (seconds to the first text, seconds to the whole answer).
+    """
+    start = time.perf_counter()
+    first_token = None
+    text = ''
+    if 'stream' in inspect.signature(func).parameters:
+        kwargs['stream'] = True
+    try:
+        response = func(**kwargs)
+        if isinstance(response, str):
+            text = response
+        else:
+            rendered = 0
+            for piece in response:
+                now = time.perf_counter()
+                if first_token is None:
+                    first_token = now - start
+                text += piece
+                if now - rendered >= RENDER_INTERVAL:
+                    _show_markdown(output, text)
+                    rendered = now
+    except Exception as e:
+        text = f"{text}\n\nError: {e}" if text else f"Error: {e}"
+    total = time.perf_counter() - start
+    _show_markdown(output, text)
+    return (first_token if first_token is not None else total), total
+
 def display_widget(llm_call_func, semantic_search_retrieve, bm25_retrieve, reciprocal_rank_fusion):
     def on_button_click(b):
         query = query_input.value
@@ -158,19 +209,26 @@ def display_widget(llm_call_func, semantic_search_retrieve, bm25_retrieve, recip
         status_output.clear_output()
         # Display "Generating..." message
         status_output.append_stdout("Generating...\n")
-        # Update outputs one by one
+        # Run the four calls concurrently; each output is filled as soon as its call returns, so the
+        # whole update takes about as long as the slowest call
         results = [
             (output1, llm_call_func, query, True, top_k, semantic_search_retrieve),
             (output2, llm_call_func, query, True, top_k, bm25_retrieve),
             (output3, llm_call_func, query, True, top_k, reciprocal_rank_fusion),
             (output4, llm_call_func, query, False, top_k, None)
         ]
-        for output, func, query, use_rag, top_k, retriever in results:
-            response = func(query=query, use_rag=use_rag, top_k=top_k, retrieve_function=retriever)
-            with output:
-                display(Markdown(response))
-        # Clear "Generating..." message
-        status_output.clear_output()
+        futures = {
+            WIDGET_EXECUTOR.submit(_render_response, output, func, query=query, use_rag=use_rag, top_k=top_k,
+                                   retrieve_function=retriever): label.value
+            for (output, func, query, use_rag, top_k, retriever), label in zip(results, [label1, label2, label3, label4])
+        }
+        # Replace "Generating..." with each call's latency as it finishes
+        timings = {}
+        for future in as_completed(futures):
+            timings[futures[future]] = future.result()
+            status_output.clear_output()
+            for name, (first_token, total) in timings.items():
+                status_output.append_stdout(f"{name}: first token {first_token:.2f}s, complete {total:.2f}s\n")
         
     query_input = widgets.Text(
         description='',
@@ -19,13 +19,24 @@ router.get("/me", verifyJWT, (req: Request, res: Response): void => {
 // Helper function to forward requests using fetch
 async function forwardRequest(path: string, req: Request, res: Response) {
   try {
+    // Pass the client address on: auth rate-limits per IP, and would
+    // otherwise see every request as coming from this server
+    const clientAddress = req.socket.remoteAddress || "";
+    const forwardedFor = req.headers["x-forwarded-for"];
     const response = await fetch(`http://auth:5000${path}`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: {
+        "Content-Type": "application/json",
+        "X-Forwarded-For": forwardedFor ? `${forwardedFor}, ${clientAddress}` : clientAddress,
+      },
       body: JSON.stringify(req.body),
     });
 
     const data = await response.json();
+    const retryAfter = response.headers.get("Retry-After");
+    if (retryAfter) {
+      res.set("Retry-After", retryAfter);
+    }
     res.status(response.status).json(data);
   } catch (error) {
     console.error(`Error forwarding to ${path}:`, error);
@@ -42,6 +53,7 @@ router.post("/login", (req, res) => {
   console.log("Login request received forwarding ", req.body || "");
   return forwardRequest("/auth/login", req, res);
 });
+router.post("/refresh", (req, res) => forwardRequest("/auth/refresh", req, res));
 router.post("/logout", (req, res) => forwardRequest("/auth/logout", req, res));
 /*
  * Middleware to check if user is authenticated